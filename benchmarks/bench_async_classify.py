@@ -0,0 +1,95 @@
+"""
+Latency of concurrent uploads with a blocking implementation, inline vs. executor.
+
+The mock answers instantly, so a blocking backend call is emulated by
+sleeping ``--work-ms`` inside the synchronous classification. In ``inline``
+mode the route calls the synchronous method directly on the event loop (the
+behaviour before ``classify_pdf_async`` existed); in ``executor`` mode it goes
+through the bounded executor.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_async_classify.py --concurrency 200
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+
+from openapi_server import executor
+from openapi_server.implementation.classification_service import ClassificationServiceImpl, EXPECTED_PDF_HEADER
+from openapi_server.main import app
+from openapi_server.settings import settings
+
+SAMPLE_PDF_BODY = EXPECTED_PDF_HEADER + b"1.7\n" + b"x" * 4096
+
+
+def _percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def _run(concurrency: int) -> list:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # all uploads are issued at once, so latency is measured from a common start
+        started = time.perf_counter()
+
+        async def upload(index: int) -> float:
+            response = await client.post(f"/api/v1/classify/{uuid.UUID(int=index)}", content=SAMPLE_PDF_BODY,
+                                         headers={"Content-Type": "application/pdf"})
+            response.raise_for_status()
+            return time.perf_counter() - started
+
+        return await asyncio.gather(*(upload(i) for i in range(concurrency)))
+
+
+def bench(mode: str, concurrency: int, work_ms: float) -> dict:
+    original_fill = ClassificationServiceImpl._fill_template
+    original_async = ClassificationServiceImpl.classify_pdf_async
+
+    # both classify_pdf and classify_pdf_json go through _fill_template
+    def blocking_fill_template(self, uuid_param_str, body):
+        time.sleep(work_ms / 1000.0)
+        return original_fill(self, uuid_param_str, body)
+
+    async def inline_classify_pdf_async(self, uuid_param_str, body):
+        return self.classify_pdf(uuid_param_str, body)
+
+    ClassificationServiceImpl._fill_template = blocking_fill_template
+    if mode == "inline":
+        ClassificationServiceImpl.classify_pdf_async = inline_classify_pdf_async
+    try:
+        latencies = asyncio.run(_run(concurrency))
+    finally:
+        ClassificationServiceImpl._fill_template = original_fill
+        ClassificationServiceImpl.classify_pdf_async = original_async
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "work_ms": work_ms,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--work-ms", type=float, default=5.0, help="emulated blocking work per request")
+    parser.add_argument("--workers", type=int, default=0, help="executor size, 0 for the default")
+    args = parser.parse_args()
+
+    settings.executor_workers = args.workers
+    for mode in ("inline", "executor"):
+        print(json.dumps(bench(mode, args.concurrency, args.work_ms)))
+    executor.shutdown_executor()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Requests/sec of building the mock response: per-request pydantic models vs. precompiled templates.
+
+``models`` reproduces the response construction as it was before the templates:
+parse ``doc_date_parsed``, validate three ``QualifiedValue``s, a ``ResultItem``
+and a ``ClassificationResult`` and serialize them the way FastAPI does.
+``template`` fills the precompiled ``ResponseTemplate`` and emits JSON bytes.
+Both include the value corruption, which is identical in both paths;
+``--no-corruption`` leaves it out to isolate the model overhead.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_mock_responses.py --seconds 2
+"""
+
+import argparse
+import datetime
+import json
+import time
+import uuid
+
+from openapi_server.implementation.classification_service import (
+    ClassificationServiceImpl,
+    MOCK_RESPONSES,
+    compile_response_template,
+)
+from openapi_server.models.classification_result import ClassificationResult
+from openapi_server.models.qualified_value import QualifiedValue
+from openapi_server.models.result_item import ResultItem
+
+corrupt_value = ClassificationServiceImpl.corrupt_value
+RESPONSE_TEMPLATES = {ending: compile_response_template(data) for ending, data in MOCK_RESPONSES.items()}
+
+
+def _no_corruption(value, score):
+    return value
+
+
+def build_with_models(ending: str, custom_id: str) -> bytes:
+    response_data = MOCK_RESPONSES[ending]
+    parsed_date = datetime.datetime.fromisoformat(response_data["doc_date_parsed"])
+    result_item = ResultItem(
+        kind=response_data["kind"],
+        doc_id=QualifiedValue(value=corrupt_value(response_data["doc_id_val"], response_data["doc_id_score"]),
+                              score=response_data["doc_id_score"]),
+        doc_date_sic=QualifiedValue(value=corrupt_value(response_data["doc_date_sic_val"], response_data["doc_date_sic_score"]),
+                                    score=response_data["doc_date_sic_score"]),
+        doc_date_parsed=parsed_date,
+        doc_subject=QualifiedValue(value=corrupt_value(response_data["doc_subject_val"], response_data["doc_subject_score"]),
+                                   score=response_data["doc_subject_score"]),
+    )
+    response_model = ClassificationResult(class_id=str(uuid.uuid4()), custom_id=custom_id, result=result_item)
+    return response_model.model_dump_json(by_alias=True).encode("utf-8")
+
+
+def build_with_template(ending: str, custom_id: str) -> bytes:
+    template = RESPONSE_TEMPLATES[ending]
+    return template.to_json(
+        str(uuid.uuid4()),
+        custom_id,
+        corrupt_value(template.doc_id_val, template.doc_id_score),
+        corrupt_value(template.doc_date_sic_val, template.doc_date_sic_score),
+        corrupt_value(template.doc_subject_val, template.doc_subject_score),
+    )
+
+
+def requests_per_second(build, seconds: float) -> float:
+    endings = list(MOCK_RESPONSES)
+    custom_ids = [str(uuid.UUID(int=int(ending))) for ending in endings]
+    calls = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        for ending, custom_id in zip(endings, custom_ids):
+            build(ending, custom_id)
+        calls += len(endings)
+    return calls / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0, help="measuring time per variant")
+    parser.add_argument("--no-corruption", action="store_true", help="skip the value corruption in both variants")
+    args = parser.parse_args()
+
+    global corrupt_value
+    if args.no_corruption:
+        corrupt_value = _no_corruption
+
+    results = {name: requests_per_second(build, args.seconds)
+               for name, build in (("models", build_with_models), ("template", build_with_template))}
+    print(json.dumps({
+        "models_rps": round(results["models"]),
+        "template_rps": round(results["template"]),
+        "speedup": round(results["template"] / results["models"], 2),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+End-to-end load generator: drives POST /classify/{uuid} over HTTP and reports throughput and latency.
+
+Starts the service with uvicorn on a free local port (or targets ``--url``),
+then sends uploads from an async httpx client:
+
+* ``closed`` loop: ``--concurrency`` clients each send the next request as
+  soon as the previous one answered.
+* ``open`` loop: requests arrive at a fixed ``--rate`` per second regardless
+  of how fast the service answers; latency is measured from the scheduled
+  arrival, so queueing in front of a slow service is not hidden.
+
+Body sizes are drawn from ``--sizes`` (``size:weight,...`` with k/m suffixes)
+and UUID suffixes from ``--suffixes`` (``suffix:weight,...``, by default all
+suffixes of ``MOCK_RESPONSES`` equally). The report is JSON with RPS,
+p50/p95/p99/p999 latency and error rate. ``--baseline`` compares against a
+stored report and exits with status 1 on a regression beyond
+``--tolerance``; ``--save-baseline`` stores the report.
+
+Usage:
+    PYTHONPATH=src python benchmarks/loadgen.py --mode closed --concurrency 64 --duration 10
+    PYTHONPATH=src python benchmarks/loadgen.py --mode open --rate 500 --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import asyncio
+import collections
+import contextlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+from openapi_server.implementation.classification_service import EXPECTED_PDF_HEADER, MOCK_RESPONSES
+
+PERCENTILES = {"p50": 0.50, "p95": 0.95, "p99": 0.99, "p999": 0.999}
+_UNITS = {"k": 1024, "m": 1024 * 1024}
+
+
+def parse_weighted(spec: str, parse_value=str) -> list:
+    """Parse ``value:weight,value:weight`` (weight defaults to 1) into ``[(value, weight)]``."""
+    pairs = []
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        value, _, weight = part.partition(":")
+        pairs.append((parse_value(value.strip()), float(weight) if weight else 1.0))
+    return pairs
+
+
+def parse_size(text: str) -> int:
+    unit = _UNITS.get(text[-1:].lower())
+    return int(float(text[:-1]) * unit) if unit else int(text)
+
+
+def make_body(size: int) -> bytes:
+    header = EXPECTED_PDF_HEADER + b"1.7\n"
+    return header + os.urandom(max(1, size - len(header)))
+
+
+def percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Workload:
+    """Draws the body and uuid of each request."""
+
+    def __init__(self, sizes: list, suffixes: list, seed: int):
+        self.rng = random.Random(seed)
+        self.bodies = {size: make_body(size) for size, _ in sizes}
+        self.sizes, self.size_weights = zip(*sizes)
+        self.suffixes, self.suffix_weights = zip(*suffixes)
+
+    def next(self):
+        size = self.rng.choices(self.sizes, self.size_weights)[0]
+        suffix = self.rng.choices(self.suffixes, self.suffix_weights)[0]
+        request_uuid = str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+        return request_uuid[:-len(suffix)] + suffix, self.bodies[size]
+
+
+class Recorder:
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = collections.Counter()
+        self.request_bytes = 0
+
+    def record(self, latency: float, status, size: int):
+        self.latencies.append(latency)
+        self.statuses[str(status)] += 1
+        self.request_bytes += size
+
+    def report(self, elapsed: float) -> dict:
+        ordered = sorted(self.latencies)
+        count = len(ordered)
+        errors = sum(n for status, n in self.statuses.items() if status != "200")
+        report = {
+            "requests": count,
+            "elapsed_s": round(elapsed, 3),
+            "rps": round(count / elapsed, 1) if elapsed else 0.0,
+            "error_rate": round(errors / count, 5) if count else 0.0,
+            "statuses": dict(sorted(self.statuses.items())),
+            "mb_per_s": round(self.request_bytes / elapsed / 1024 / 1024, 2) if elapsed else 0.0,
+        }
+        if ordered:
+            report.update({f"{name}_ms": round(percentile(ordered, q) * 1000, 3) for name, q in PERCENTILES.items()})
+            report["max_ms"] = round(ordered[-1] * 1000, 3)
+            report["mean_ms"] = round(sum(ordered) / count * 1000, 3)
+        return report
+
+
+async def _send(client: httpx.AsyncClient, workload: Workload, recorder: Recorder, started: float):
+    request_uuid, body = workload.next()
+    try:
+        response = await client.post(f"/api/v1/classify/{request_uuid}", content=body,
+                                     headers={"Content-Type": "application/pdf"})
+        status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    recorder.record(time.perf_counter() - started, status, len(body))
+
+
+async def closed_loop(client, workload, recorder, concurrency: int, deadline: float):
+    async def user():
+        while time.perf_counter() < deadline:
+            await _send(client, workload, recorder, time.perf_counter())
+
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+
+
+async def open_loop(client, workload, recorder, rate: float, deadline: float):
+    interval = 1.0 / rate
+    tasks = []
+    scheduled = time.perf_counter()
+    while scheduled < deadline:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # latency counts from the scheduled arrival, not from when the request got out
+        tasks.append(asyncio.create_task(_send(client, workload, recorder, scheduled)))
+        scheduled += interval
+    await asyncio.gather(*tasks)
+
+
+async def run_load(args, base_url: str) -> dict:
+    workload = Workload(parse_weighted(args.sizes, parse_size), parse_weighted(args.suffixes), args.seed)
+    connections = args.concurrency if args.mode == "closed" else args.max_connections
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        if args.warmup > 0:
+            await closed_loop(client, workload, Recorder(), min(connections, 8), time.perf_counter() + args.warmup)
+        recorder = Recorder()
+        started = time.perf_counter()
+        deadline = started + args.duration
+        if args.mode == "closed":
+            await closed_loop(client, workload, recorder, args.concurrency, deadline)
+        else:
+            await open_loop(client, workload, recorder, args.rate, deadline)
+        return recorder.report(time.perf_counter() - started)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def local_server(workers: int, env: dict):
+    """Start uvicorn with the service on a free port and yield its base URL."""
+    port = _free_port()
+    src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+    command = [sys.executable, "-m", "uvicorn", "openapi_server.main:app", "--app-dir", src,
+               "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+               "--no-access-log", "--log-level", "warning"]
+    process = subprocess.Popen(command, env={**os.environ, "PDFCLASSIFIER_LOG_LEVEL": "WARNING", **env})
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+            try:
+                if httpx.get(f"{base_url}/metrics", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("uvicorn did not become ready within 30s")
+            time.sleep(0.1)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Return the regressions of ``report`` against ``baseline`` as messages."""
+    regressions = []
+    if report["rps"] < baseline["rps"] * (1 - tolerance):
+        regressions.append(f"rps {report['rps']} < baseline {baseline['rps']} - {tolerance:.0%}")
+    for name in PERCENTILES:
+        key = f"{name}_ms"
+        if key in baseline and report.get(key, float("inf")) > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key} {report.get(key)} > baseline {baseline[key]} + {tolerance:.0%}")
+    if report["error_rate"] > baseline["error_rate"] + 0.001:
+        regressions.append(f"error_rate {report['error_rate']} > baseline {baseline['error_rate']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="target a running service instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers of the started service")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="environment of the started service, e.g. PDFCLASSIFIER_LATENCY_PROFILE=fixed:5")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--concurrency", type=int, default=32, help="clients of the closed loop")
+    parser.add_argument("--rate", type=float, default=200.0, help="arrivals per second of the open loop")
+    parser.add_argument("--max-connections", type=int, default=256, help="connection limit of the open loop")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds of unmeasured load first")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--sizes", default="4k", help="body sizes and weights, e.g. 4k:7,256k:2,4m:1")
+    parser.add_argument("--suffixes", default=",".join(sorted(MOCK_RESPONSES)),
+                        help="UUID suffixes and weights, default all MOCK_RESPONSES suffixes equally")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", help="report to compare against; regressions exit with status 1")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    parser.add_argument("--save-baseline", help="write the report to this file")
+    args = parser.parse_args()
+
+    if args.url:
+        report = asyncio.run(run_load(args, args.url))
+    else:
+        env = dict(item.split("=", 1) for item in args.env)
+        with local_server(args.workers, env) as base_url:
+            report = asyncio.run(run_load(args, base_url))
+    report["config"] = {"mode": args.mode, "concurrency": args.concurrency, "rate": args.rate,
+                        "duration_s": args.duration, "sizes": args.sizes, "suffixes": args.suffixes}
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("PERFORMANCE REGRESSION against " + args.baseline, file=sys.stderr)
+            for regression in regressions:
+                print("  " + regression, file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
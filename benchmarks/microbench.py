@@ -0,0 +1,205 @@
+"""
+Microbenchmarks of the service hot paths, without HTTP, with a JSON history across commits.
+
+Each case is timed like ``pytest-benchmark`` does: the number of calls per
+round is calibrated so a round takes about ``--round-ms``, then ``--rounds``
+rounds are measured and min/median/mean/stddev per call and ops/s are
+reported. Cases:
+
+* ``corrupt_value`` over string lengths and scores
+* ``assertValidBody`` on bodies from 1 KB up to ``--max-body-mb``
+* ``ClassificationResult.to_dict`` / ``to_json`` vs. ``model_dump_json``
+* a full ``classify_pdf`` and ``classify_pdf_json`` call
+* the response table lookup with the packaged table and with thousands of rules
+
+Every run is appended to ``--history`` (one JSON object per line, with the
+git commit) and compared with the previous entry, so trends across commits
+are visible. ``--filter`` selects cases by substring.
+
+Usage:
+    PYTHONPATH=src python benchmarks/microbench.py
+    PYTHONPATH=src python benchmarks/microbench.py --filter corrupt --rounds 20
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from typing import Callable, List, Tuple
+
+from openapi_server.implementation.classification_service import ClassificationServiceImpl, EXPECTED_PDF_HEADER
+from openapi_server.implementation.mock_table import DEFAULT_TABLE_PATH, ResponseTable, Rule, load_rules
+from openapi_server.implementation.pdf_structure import inspect_pdf
+
+SAMPLE_PDF_BODY = EXPECTED_PDF_HEADER + b"1.7\n" + b"x" * 4096
+UUID_10 = str(uuid.UUID("00000000-0000-0000-0000-000000000010"))
+
+
+def _body(size: int) -> bytearray:
+    body = bytearray(size)
+    body[:len(EXPECTED_PDF_HEADER)] = EXPECTED_PDF_HEADER
+    return body
+
+
+def _pdf(size: int) -> bytes:
+    """A one-page PDF padded to about ``size`` bytes with a content stream."""
+    padding = b"0" * max(0, size - 400)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+               b"<< /Type /Page /Parent 2 0 R /Contents 4 0 R >>",
+               b"<< /Length %d >>\nstream\n" % len(padding) + padding + b"\nendstream"]
+    out, offsets = b"%PDF-1.7\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 5\n0000000000 65535 f \n" + b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    return out + b"trailer\n<< /Size 5 /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % xref
+
+
+def _large_table(rules: int) -> ResponseTable:
+    """The packaged table plus ``rules`` suffix, prefix, exact and a few regex rules that miss ``UUID_10``."""
+    data = load_rules(DEFAULT_TABLE_PATH)[0].data
+    extra = [Rule("suffix", f"{n:04x}f", data) for n in range(rules // 2)]
+    extra += [Rule("prefix", f"f{n:05x}", data) for n in range(rules // 4)]
+    extra += [Rule("exact", str(uuid.UUID(int=n << 64)), data) for n in range(1, rules // 4)]
+    extra += [Rule("regex", f"f{n}.*", data) for n in range(10)]
+    return ResponseTable(load_rules(DEFAULT_TABLE_PATH) + extra)
+
+
+def cases(max_body_mb: float, name_filter: str = "") -> List[Tuple[str, Callable[[], object]]]:
+    """The benchmark cases matching ``name_filter``; large bodies are only allocated for selected cases."""
+    service = ClassificationServiceImpl()
+    result = service.classify_pdf(UUID_10, SAMPLE_PDF_BODY)
+    collected = []
+
+    def add(name: str, make: Callable[[], Callable[[], object]]):
+        if name_filter in name:
+            collected.append((name, make()))
+
+    for length in (8, 64, 512, 4096):
+        value = ("Rechnung 2024-" * (length // 14 + 1))[:length]
+        for score in ("0.5", "0.9", "0.99"):
+            add(f"corrupt_value[len={length},score={score}]",
+                lambda value=value, score=score: lambda: service.corrupt_value(value, score))
+
+    sizes_kb = [1, 32, 1024, 10 * 1024, 100 * 1024, 500 * 1024]
+    for size_kb in (kb for kb in sizes_kb if kb <= max_body_mb * 1024):
+        add(f"assertValidBody[{size_kb}KB]",
+            lambda size_kb=size_kb: (lambda body: lambda: service.assertValidBody(body))(_body(size_kb * 1024)))
+        add(f"inspect_pdf[{size_kb}KB]",
+            lambda size_kb=size_kb: (lambda body: lambda: inspect_pdf(body))(_pdf(size_kb * 1024)))
+
+    add("ClassificationResult.to_dict", lambda: result.to_dict)
+    add("ClassificationResult.to_json", lambda: result.to_json)
+    add("ClassificationResult.model_dump_json", lambda: lambda: result.model_dump_json(by_alias=True))
+    add("classify_pdf", lambda: lambda: service.classify_pdf(UUID_10, SAMPLE_PDF_BODY))
+    add("classify_pdf_json", lambda: lambda: service.classify_pdf_json(UUID_10, SAMPLE_PDF_BODY))
+    for rules in (0, 5000):
+        add(f"ResponseTable.match[rules=+{rules}]",
+            lambda rules=rules: (lambda table: lambda: table.match(UUID_10))(_large_table(rules)))
+        add(f"ResponseTable.match[rules=+{rules},miss]",
+            lambda rules=rules: (lambda table: lambda: table.match(UUID_10[:-2] + "fe"))(_large_table(rules)))
+    return collected
+
+
+def measure(function: Callable[[], object], rounds: int, round_seconds: float) -> dict:
+    """Calibrate calls per round to about ``round_seconds`` and return per-call statistics in seconds."""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - started
+        if elapsed >= round_seconds / 2 or number >= 10_000_000:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(round_seconds / elapsed)))
+
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - started) / number)
+    median = statistics.median(timings)
+    return {
+        "min": min(timings),
+        "median": median,
+        "mean": statistics.fmean(timings),
+        "stddev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "ops": 1 / median if median else float("inf"),
+        "calls_per_round": number,
+        "rounds": rounds,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _previous_run(history: str) -> dict:
+    try:
+        with open(history) as f:
+            lines = [line for line in f if line.strip()]
+    except FileNotFoundError:
+        return {}
+    return json.loads(lines[-1])["results"] if lines else {}
+
+
+def _format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:8.2f} {unit}"
+    return f"{seconds / 1e-9:8.2f} ns"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--round-ms", type=float, default=100.0, help="target duration of one round")
+    parser.add_argument("--max-body-mb", type=float, default=500.0, help="largest assertValidBody and inspect_pdf body")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--history", default="benchmarks/microbench_history.jsonl",
+                        help="JSON lines file the run is appended to, empty to skip")
+    args = parser.parse_args()
+
+    previous = _previous_run(args.history) if args.history else {}
+    results = {}
+    print(f"{'case':48} {'median':>11} {'min':>11} {'ops/s':>12} {'vs prev':>8}")
+    for name, function in cases(args.max_body_mb, args.filter):
+        try:
+            stats = measure(function, args.rounds, args.round_ms / 1000)
+        except Exception as e:
+            # a failing path is reported, not fatal: the other cases are still worth having
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"{name:48} failed: {results[name]['error']}")
+            continue
+        results[name] = stats
+        change = ""
+        if "median" in previous.get(name, {}):
+            change = f"{(stats['median'] / previous[name]['median'] - 1) * 100:+7.1f}%"
+        print(f"{name:48} {_format_time(stats['median'])} {_format_time(stats['min'])} {stats['ops']:12.0f} {change:>8}")
+
+    if args.history:
+        entry = {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }
+        with open(args.history, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        print(f"appended to {args.history}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
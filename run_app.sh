@@ -4,7 +4,7 @@
 source .venv/bin/activate
 
 # Run the application
-uvicorn --app-dir src openapi_server.main:app --reload --host 0.0.0.0 --port 8080
+uvicorn --app-dir src openapi_server.main:app --reload --host 0.0.0.0 --port 8080 --no-access-log
 
 # Deactivate the virtual environment when the application is stopped
 deactivate
\ No newline at end of file
@@ -0,0 +1,229 @@
+# coding: utf-8
+
+"""
+Admission control: shed uploads the service cannot take right now, before reading them.
+
+``AdmissionMiddleware`` checks every upload (``POST`` request) against
+
+* ``settings.admission_max_in_flight``: uploads handled at a time,
+* ``settings.admission_max_queued_bytes``: the sum of the ``Content-Length``
+  of the uploads being handled; an upload is always admitted while nothing
+  else is, so one larger than the budget is not refused forever,
+* ``settings.admission_client_rate`` / ``admission_client_burst``: a token
+  bucket per client, keyed by the ``settings.admission_client_header``
+  header (an API key) or else the client IP.
+
+Overload is answered with 503 and rate-limited clients with 429, both right
+away and with ``Retry-After``, instead of queueing work whose latency would
+hurt every request. The limits are read from the settings on every request
+and can be changed at runtime with ``PATCH /api/v1/admission``; with a shared
+state directory the change reaches all workers. The counts are per process.
+"""
+
+import collections
+import dataclasses
+import json
+import logging
+import math
+import os
+import time
+from typing import Dict, Optional
+
+from openapi_server import metrics
+from openapi_server.settings import settings
+
+logger = logging.getLogger(__name__)
+
+LIMITS = ("admission_max_in_flight", "admission_max_queued_bytes", "admission_client_rate",
+          "admission_client_burst", "admission_retry_after")
+
+rejected_total = metrics.registry.counter(
+    "pdfclassifier_admission_rejected_total", "Uploads shed by admission control by reason.", ["reason"])
+
+
+@dataclasses.dataclass(frozen=True)
+class Rejection:
+    status: int
+    reason: str
+    detail: str
+    retry_after: int
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+
+    def take(self, rate: float, burst: float, now: float) -> float:
+        """Take a token, returning 0; without one, return the seconds until the next."""
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+class AdmissionController:
+    """Uploads in flight, their bytes and the token buckets of the clients of this process."""
+
+    # clients whose buckets are kept, the least recently seen are dropped first
+    MAX_CLIENTS = 10000
+    # seconds between checks for limits changed by another worker
+    SHARED_LIMITS_INTERVAL = 1.0
+
+    def __init__(self):
+        self.in_flight = 0
+        self.queued_bytes = 0
+        self._buckets: "collections.OrderedDict[str, TokenBucket]" = collections.OrderedDict()
+        self._shared_checked_at = 0.0
+        self._shared_mtime: Optional[float] = None
+
+    def admit(self, client: str, content_length: int) -> Optional[Rejection]:
+        """Count the upload in, or return why it is rejected."""
+        self._refresh_shared_limits()
+        retry_after = settings.admission_retry_after
+        if 0 < settings.admission_max_in_flight <= self.in_flight:
+            return self._reject(503, "in_flight", "Too many uploads in progress", retry_after)
+        if (settings.admission_max_queued_bytes > 0 and self.in_flight > 0
+                and self.queued_bytes + content_length > settings.admission_max_queued_bytes):
+            return self._reject(503, "queued_bytes", "Too many upload bytes in progress", retry_after)
+        if settings.admission_client_rate > 0:
+            wait = self._bucket(client).take(settings.admission_client_rate, self._burst(), time.monotonic())
+            if wait > 0:
+                return self._reject(429, "client_rate", "Client rate limit exceeded", math.ceil(wait))
+        self.in_flight += 1
+        self.queued_bytes += content_length
+        return None
+
+    def release(self, content_length: int):
+        self.in_flight -= 1
+        self.queued_bytes -= content_length
+
+    def snapshot(self) -> dict:
+        return {"in_flight": self.in_flight, "queued_bytes": self.queued_bytes, "clients": len(self._buckets)}
+
+    @staticmethod
+    def _reject(status: int, reason: str, detail: str, retry_after: int) -> Rejection:
+        rejected_total.labels(reason).inc()
+        return Rejection(status, reason, detail, retry_after)
+
+    @staticmethod
+    def _burst() -> float:
+        return float(settings.admission_client_burst or max(1.0, settings.admission_client_rate))
+
+    def _bucket(self, client: str) -> TokenBucket:
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self._burst(), time.monotonic())
+            if len(self._buckets) > self.MAX_CLIENTS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        return bucket
+
+    def _refresh_shared_limits(self):
+        if not settings.shared_state_dir:
+            return
+        now = time.monotonic()
+        if now - self._shared_checked_at < self.SHARED_LIMITS_INTERVAL:
+            return
+        self._shared_checked_at = now
+        path = _shared_limits_path()
+        try:
+            mtime = os.stat(path).st_mtime
+            if mtime == self._shared_mtime:
+                return
+            with open(path) as f:
+                limits = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.exception("Reading the admission limits %s failed", path)
+            return
+        self._shared_mtime = mtime
+        for name, value in limits.items():
+            if name in LIMITS:
+                setattr(settings, name, value)
+
+
+def _shared_limits_path() -> str:
+    return os.path.join(settings.shared_state_dir, "admission.json")
+
+
+def current_limits() -> Dict[str, float]:
+    return {name: getattr(settings, name) for name in LIMITS}
+
+
+def update_limits(changes: Dict[str, float]) -> Dict[str, float]:
+    """Change limits of ``LIMITS`` at runtime, for all workers sharing the state directory."""
+    unknown = set(changes) - set(LIMITS)
+    if unknown:
+        raise ValueError(f"Unknown admission limits {sorted(unknown)}, expected some of {LIMITS}")
+    for name, value in changes.items():
+        setattr(settings, name, value)
+    if settings.shared_state_dir:
+        path = _shared_limits_path()
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(current_limits(), f)
+        os.replace(temporary, path)
+    return current_limits()
+
+
+controller = AdmissionController()
+
+metrics.registry.function("pdfclassifier_admission_in_flight", "Uploads admitted and being handled.", "gauge",
+                          lambda: controller.in_flight)
+metrics.registry.function("pdfclassifier_admission_queued_bytes",
+                          "Content-Length sum of the uploads being handled.", "gauge",
+                          lambda: controller.queued_bytes)
+
+
+def _client(scope, header: bytes) -> str:
+    for name, value in scope.get("headers") or ():
+        if name == header:
+            return "key:" + value.decode("latin-1")
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+def _content_length(scope) -> int:
+    for name, value in scope.get("headers") or ():
+        if name == b"content-length":
+            try:
+                return max(0, int(value))
+            except ValueError:
+                return 0
+    return 0
+
+
+class AdmissionMiddleware:
+    """ASGI middleware admitting uploads through ``controller`` before their body is read."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = _content_length(scope)
+        client = _client(scope, settings.admission_client_header.lower().encode("latin-1"))
+        rejection = controller.admit(client, content_length)
+        if rejection is not None:
+            body = json.dumps({"detail": rejection.detail}).encode("utf-8")
+            await send({"type": "http.response.start", "status": rejection.status, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(rejection.retry_after).encode("latin-1")),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(content_length)
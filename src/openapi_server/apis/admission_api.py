@@ -0,0 +1,47 @@
+# coding: utf-8
+
+"""
+Runtime view and tuning of admission control, see ``openapi_server.admission``.
+"""
+
+from typing import Optional
+
+from fastapi import APIRouter
+from pydantic import BaseModel, ConfigDict, Field
+
+from openapi_server.admission import controller, current_limits, update_limits
+
+router = APIRouter()
+
+
+class AdmissionLimits(BaseModel):
+    """Limits to change; omitted ones keep their value, 0 lifts a limit."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    admission_max_in_flight: Optional[int] = Field(None, ge=0)
+    admission_max_queued_bytes: Optional[int] = Field(None, ge=0)
+    admission_client_rate: Optional[float] = Field(None, ge=0)
+    admission_client_burst: Optional[int] = Field(None, ge=0)
+    admission_retry_after: Optional[int] = Field(None, ge=0)
+
+
+@router.get(
+    "/admission",
+    responses={200: {"description": "The admission limits and this process's uploads in flight"}},
+    tags=["admission"],
+    summary="Admission control limits and state",
+)
+async def get_admission() -> dict:
+    return {"limits": current_limits(), **controller.snapshot()}
+
+
+@router.patch(
+    "/admission",
+    responses={200: {"description": "The admission limits after the change"}},
+    tags=["admission"],
+    summary="Change admission control limits at runtime",
+)
+async def patch_admission(limits: AdmissionLimits) -> dict:
+    """Apply the given limits; with a shared state directory every worker picks them up within a second."""
+    return {"limits": update_limits(limits.model_dump(exclude_none=True)), **controller.snapshot()}
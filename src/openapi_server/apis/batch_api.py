@@ -0,0 +1,255 @@
+# coding: utf-8
+
+"""
+Batch classification: many (uuid, pdf) pairs in one request.
+
+``POST /classify/batch`` accepts either
+
+* ``multipart/form-data`` with one file part per document, the part's field
+  name (or, failing that, the filename without ``.pdf``) being the uuid, or
+* ``application/x-pdf-batch``, a length-prefixed stream of records, each an
+  ASCII header line ``<uuid> <length>\\n`` followed by ``length`` bytes of PDF.
+
+Each document goes through the implementation's ``classify_pdf_async`` like a
+single upload. Results are streamed back as NDJSON in completion order, one
+line per document carrying its ``index`` in the request; per-document errors
+are reported inline with their status and detail and do not fail the batch.
+"""
+
+import asyncio
+import json
+from typing import AsyncIterator, Optional, Tuple, Union
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.datastructures import UploadFile
+from starlette.requests import ClientDisconnect
+
+from openapi_server import request_context
+from openapi_server.apis.classification_api import get_implementation, get_latency_profile
+from openapi_server.apis.classification_api_base import BaseClassificationApi
+from openapi_server.result_cache import classify_cached
+from openapi_server.settings import settings
+
+BATCH_STREAM_MEDIA_TYPE = "application/x-pdf-batch"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# longest accepted record header: uuid, blank, decimal length, newline
+_MAX_RECORD_HEADER = 128
+
+# a batch item is (index, uuid, body) or (index, uuid, error) for items rejected while reading
+BatchItem = Tuple[int, str, Union[bytes, HTTPException]]
+
+router = APIRouter()
+
+
+class BatchStreamingResponse(StreamingResponse):
+    """
+    ``StreamingResponse`` that leaves the receive channel to the request body.
+
+    Results are streamed while the batch is still being uploaded; the stock
+    response would listen for a disconnect on the same channel and swallow
+    the remaining body messages. A disconnect surfaces from the body reader.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+
+async def read_length_prefixed(request: Request, max_item_size: int) -> AsyncIterator[BatchItem]:
+    """Parse ``<uuid> <length>\\n<bytes>`` records from the request stream as they arrive."""
+    buffer = bytearray()
+    stream = request.stream().__aiter__()
+    index = 0
+    exhausted = False
+
+    async def fill() -> bool:
+        nonlocal exhausted
+        if exhausted:
+            return False
+        try:
+            buffer.extend(await stream.__anext__())
+        except StopAsyncIteration:
+            exhausted = True
+            return False
+        return True
+
+    while True:
+        newline = buffer.find(b"\n", 0, _MAX_RECORD_HEADER)
+        while newline < 0 and len(buffer) < _MAX_RECORD_HEADER:
+            if not await fill():
+                break
+            newline = buffer.find(b"\n", 0, _MAX_RECORD_HEADER)
+        if newline < 0:
+            if buffer.strip():
+                yield index, "", HTTPException(status_code=400, detail="Malformed batch record header")
+            return
+
+        header = bytes(buffer[:newline]).decode("ascii", errors="replace").split()
+        del buffer[:newline + 1]
+        if len(header) != 2 or not header[1].isdigit():
+            # the stream cannot be resynchronized after a broken header
+            yield index, header[0] if header else "", HTTPException(status_code=400, detail="Malformed batch record header")
+            return
+        uuid, length = header[0], int(header[1])
+
+        if length > max_item_size:
+            # discard the record instead of buffering it
+            remaining = length
+            while remaining > 0 and (buffer or await fill()):
+                skipped = min(remaining, len(buffer))
+                del buffer[:skipped]
+                remaining -= skipped
+            if remaining > 0:
+                yield index, uuid, HTTPException(status_code=400, detail="Truncated batch record")
+                return
+            yield index, uuid, HTTPException(status_code=413, detail=f"PDF body exceeds the maximum size of {max_item_size} bytes")
+        else:
+            while len(buffer) < length and await fill():
+                pass
+            if len(buffer) < length:
+                yield index, uuid, HTTPException(status_code=400, detail="Truncated batch record")
+                return
+            body = bytes(buffer[:length])
+            del buffer[:length]
+            yield index, uuid, body
+        index += 1
+
+
+async def read_multipart(request: Request, max_items: int, max_item_size: int) -> AsyncIterator[BatchItem]:
+    """Yield one item per file part of a ``multipart/form-data`` request."""
+    async with request.form(max_files=max_items, max_fields=max_items) as form:
+        index = 0
+        for field_name, value in form.multi_items():
+            if not isinstance(value, UploadFile):
+                continue
+            uuid = _multipart_uuid(field_name, value.filename)
+            if value.size is not None and value.size > max_item_size:
+                yield index, uuid, HTTPException(status_code=413, detail=f"PDF body exceeds the maximum size of {max_item_size} bytes")
+            else:
+                yield index, uuid, await value.read()
+            index += 1
+
+
+def _multipart_uuid(field_name: str, filename: Optional[str]) -> str:
+    if field_name not in ("file", "files") or not filename:
+        return field_name
+    return filename[:-4] if filename.lower().endswith(".pdf") else filename
+
+
+def _result_line(index: int, uuid: str, result) -> bytes:
+    if not isinstance(result, (bytes, bytearray)):
+        result = result.model_dump_json(by_alias=True).encode("utf-8")
+    head = json.dumps({"index": index, "uuid": uuid, "status": 200}, ensure_ascii=False,
+                      separators=(",", ":")).encode("utf-8")
+    return head[:-1] + b',"result":' + bytes(result) + b"}\n"
+
+
+def _error_line(index: Optional[int], uuid: Optional[str], status_code: int, detail) -> bytes:
+    return json.dumps({"index": index, "uuid": uuid, "status": status_code, "detail": detail},
+                      ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+async def classify_batch(
+        items: AsyncIterator[BatchItem],
+        implementation: BaseClassificationApi,
+        concurrency: int,
+) -> AsyncIterator[bytes]:
+    """Classify ``items`` with at most ``concurrency`` in flight, yielding NDJSON lines in completion order."""
+    lines: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(concurrency)
+    tasks = []
+
+    async def run_item(index: int, uuid: str, body: bytes):
+        try:
+            with request_context.bind(correlation_id=uuid):
+                result, _ = await classify_cached(implementation, uuid, body)
+            line = _result_line(index, uuid, result)
+        except HTTPException as e:
+            line = _error_line(index, uuid, e.status_code, e.detail)
+        except Exception as e:
+            line = _error_line(index, uuid, 500, f"Internal server error during classification: {e}")
+        finally:
+            slots.release()
+        await lines.put(line)
+
+    async def produce():
+        try:
+            # a slot is taken before the next item is read, which bounds the bodies held in memory
+            await slots.acquire()
+            try:
+                async for index, uuid, body in items:
+                    if isinstance(body, HTTPException):
+                        slots.release()
+                        await lines.put(_error_line(index, uuid, body.status_code, body.detail))
+                    else:
+                        tasks.append(asyncio.create_task(run_item(index, uuid, body)))
+                    await slots.acquire()
+            except HTTPException as e:
+                # the request itself could not be read any further, e.g. a malformed multipart body
+                await lines.put(_error_line(None, None, e.status_code, e.detail))
+            slots.release()
+            await asyncio.gather(*tasks)
+        finally:
+            await lines.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (line := await lines.get()) is not None:
+            yield line
+        await producer
+    finally:
+        # the client went away or the batch is done: stop whatever is still running
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
+
+
+@router.post(
+    "/classify/batch",
+    responses={
+        200: {"description": "NDJSON stream with one result or error object per document, in completion order",
+              "content": {NDJSON_MEDIA_TYPE: {}}},
+        415: {"description": "Unsupported batch content type"},
+    },
+    tags=["classification"],
+    summary="Classify many PDFs uploaded in one request",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {"schema": {"type": "object", "additionalProperties": {"type": "string", "format": "binary"}}},
+                BATCH_STREAM_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+            },
+        },
+    },
+)
+async def classify_pdf_batch(
+    request: Request,
+    x_corruption_seed: Optional[str] = Header(None, alias="X-Corruption-Seed", description="Seed for deterministic corruption of the mocked values; overrides the configured seed."),
+    latency_profile: Optional[str] = Depends(get_latency_profile),
+    implementation: BaseClassificationApi = Depends(get_implementation),
+) -> BatchStreamingResponse:
+    """Upload many PDFs, each with its own uuid, and receive the classification results as NDJSON."""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        items = read_multipart(request, settings.batch_max_items, settings.body_max_size)
+    elif content_type.startswith(BATCH_STREAM_MEDIA_TYPE):
+        items = read_length_prefixed(request, settings.body_max_size)
+    else:
+        raise HTTPException(status_code=415, detail=f"Batch uploads must be multipart/form-data or {BATCH_STREAM_MEDIA_TYPE}")
+
+    seed = x_corruption_seed if x_corruption_seed is not None else settings.corruption_seed
+
+    async def stream() -> AsyncIterator[bytes]:
+        # the response is produced after the route returned, so the context is bound here
+        with request_context.bind(corruption_seed=seed, latency_profile=latency_profile):
+            async for line in classify_batch(items, implementation, settings.batch_concurrency):
+                yield line
+
+    return BatchStreamingResponse(stream(), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,21 @@
+# coding: utf-8
+
+from fastapi import APIRouter
+
+from openapi_server.result_cache import get_result_cache
+
+router = APIRouter()
+
+
+@router.get(
+    "/cache/stats",
+    responses={200: {"description": "Hit and miss counters and size of the result cache"}},
+    tags=["cache"],
+    summary="Result cache statistics",
+)
+async def cache_stats() -> dict:
+    """Return the counters of the result cache; ``enabled`` is false if the cache is off."""
+    cache = get_result_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.snapshot()}
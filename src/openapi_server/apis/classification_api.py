@@ -1,9 +1,10 @@
 # coding: utf-8
 
-from typing import Dict, List  # noqa: F401
+from typing import Dict, List, Optional  # noqa: F401
 import importlib
 import pkgutil
 
+from openapi_server import request_context
 from openapi_server.apis.classification_api_base import BaseClassificationApi
 import openapi_server.implementation
 
@@ -14,20 +15,44 @@ from fastapi import (  # noqa: F401
     Depends,
     Form,
     Header,
+    HTTPException,
     Path,
     Query,
+    Request,
     Response,
     Security,
     status,
 )
 
+from openapi_server.body_stream import read_pdf_body
+from openapi_server.implementation.latency import parse_profile
+from openapi_server.metrics import time_stage
 from openapi_server.models.extra_models import TokenModel  # noqa: F401
 from openapi_server.models.classification_result import ClassificationResult
 from openapi_server.models.error import Error
+from openapi_server.registry import registry
+from openapi_server.result_cache import classify_cached
+from openapi_server.settings import settings
 
 
 router = APIRouter()
 
+
+def get_implementation() -> BaseClassificationApi:
+    return registry.get(settings.implementation)
+
+
+def get_latency_profile(
+    x_latency_profile: Optional[str] = Header(None, alias="X-Latency-Profile", description="Simulated latency profile of the mock, e.g. 'fixed:200'; overrides the configured profile."),
+) -> Optional[str]:
+    if x_latency_profile is not None:
+        try:
+            parse_profile(x_latency_profile)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return x_latency_profile
+
+
 ns_pkg = openapi_server.implementation
 for _, name, _ in pkgutil.iter_modules(ns_pkg.__path__, ns_pkg.__name__ + "."):
     importlib.import_module(name)
@@ -38,14 +63,53 @@ for _, name, _ in pkgutil.iter_modules(ns_pkg.__path__, ns_pkg.__name__ + "."):
     responses={
         200: {"model": ClassificationResult, "description": "PDF classification successful"},
         400: {"model": Error, "description": "The uploaded file is either no PDF or could not be accessed properly"},
+        413: {"model": Error, "description": "The uploaded file exceeds the configured maximum body size"},
+        429: {"description": "The client's rate limit is exceeded, retry after the Retry-After seconds"},
+        503: {"description": "The service is overloaded, retry after the Retry-After seconds"},
     },
     tags=["classification"],
     summary="Classify a PDF uploaded as binary data into type with id-values",
-    response_model_by_alias=True,
+    # the JSON of a ClassificationResult is returned as rendered, see the 200 response above
+    response_model=None,
+    openapi_extra={
+        "requestBody": {
+            "description": "The PDF as binary data.",
+            "required": True,
+            "content": {"application/pdf": {"schema": {"type": "string", "format": "binary"}}},
+        },
+    },
 )
 async def classify_pdf(
+    request: Request,
     uuid: str = Path(..., description="The uuid in the path sets the user&#39;s process id for the uploaded pdf."),
-    body: bytes = Body(None, description="The PDF as binary data.", media_type="application/pdf"),
-) -> ClassificationResult:
+    x_corruption_seed: Optional[str] = Header(None, alias="X-Corruption-Seed", description="Seed for deterministic corruption of the mocked values; overrides the configured seed."),
+    latency_profile: Optional[str] = Depends(get_latency_profile),
+    implementation: BaseClassificationApi = Depends(get_implementation),
+) -> Response:
     """Upload a PDF as binary and inspect the contents. The data is uploaded in binary form and the result is a structure that returns the type of the document and a key-value list of type-specific identifiers. """
-    return BaseClassificationApi.subclasses[0]().classify_pdf(uuid, body)
+    seed = x_corruption_seed if x_corruption_seed is not None else settings.corruption_seed
+    with request_context.bind(corruption_seed=seed, latency_profile=latency_profile):
+        return await _classify(request, uuid, implementation)
+
+
+async def _classify(request: Request, uuid: str, implementation: BaseClassificationApi) -> Response:
+    if not settings.stream_body:
+        with time_stage("body_read"):
+            body = await request.body()
+        return await _respond(implementation, uuid, body)
+    with time_stage("body_read"):
+        spooled = await read_pdf_body(
+            request,
+            spool_threshold=settings.body_spool_threshold,
+            max_size=settings.body_max_size,
+            spool_dir=settings.body_spool_dir,
+        )
+    # the implementation reads the upload in place, it stays open until the result is there
+    with spooled:
+        return await _respond(implementation, uuid, spooled.getbuffer(), spooled.digest)
+
+
+async def _respond(implementation: BaseClassificationApi, uuid: str, body, digest: Optional[str] = None) -> Response:
+    result, hit = await classify_cached(implementation, uuid, body, digest)
+    headers = None if hit is None else {"X-Cache": "HIT" if hit else "MISS"}
+    return Response(content=result, media_type="application/json", headers=headers)
@@ -1,19 +1,106 @@
 # coding: utf-8
 
-from typing import ClassVar, Dict, List, Tuple  # noqa: F401
+from typing import ClassVar, Dict, List, Optional, Tuple, Union  # noqa: F401
 
+from openapi_server.executor import run_sync
+from openapi_server.metrics import time_stage
 from openapi_server.models.classification_result import ClassificationResult
 
+# An uploaded PDF: bytes, or a read-only memoryview of the upload (see the buffer contract below)
+PdfBody = Union[bytes, bytearray, memoryview]
+
+
 class BaseClassificationApi:
+    """
+    Base class of the classification implementations.
+
+    Buffer contract: the ``body`` passed to the ``classify_pdf*`` methods is
+    ``bytes`` or a read-only ``memoryview`` of the upload, memory-mapped once
+    the upload was spooled to disk. Use ``len``, slices and APIs taking the
+    buffer protocol (``hashlib``, ``zlib``, ``struct.unpack_from``, file
+    writes), none of which copy it; ``bytes(body)`` copies the whole upload.
+    The body is only valid during the call, copy what has to outlive it.
+    """
+
     subclasses: ClassVar[Tuple] = ()
+    # name used to select the implementation via PDFCLASSIFIER_IMPLEMENTATION
+    implementation_name: ClassVar[Optional[str]] = None
+    # bump when the results for the same input change, so cached results are not reused
+    implementation_version: ClassVar[str] = "1"
 
     def __init_subclass__(cls, **kwargs):
         super().__init_subclass__(**kwargs)
         BaseClassificationApi.subclasses = BaseClassificationApi.subclasses + (cls,)
+
+    @classmethod
+    def find_implementation(cls, name: Optional[str] = None) -> type:
+        """Return the registered implementation called ``name`` (or its class name), or the first one registered."""
+        if not cls.subclasses:
+            raise LookupError("No classification implementation registered")
+        if not name:
+            return cls.subclasses[0]
+        for impl in cls.subclasses:
+            if name in (impl.implementation_name, impl.__name__):
+                return impl
+        known = ", ".join(impl.implementation_name or impl.__name__ for impl in cls.subclasses)
+        raise LookupError(f"Unknown classification implementation '{name}', known: {known}")
+
+    def result_cache_key(self, uuid: str, body_digest: str) -> Optional[str]:
+        """Key under which the result for this upload is cached, None to bypass the result cache.
+
+        The default assumes the result depends on the body only; the ``custom_id``
+        of a cached result is replaced with the requested uuid on a hit."""
+        name = self.implementation_name or type(self).__name__
+        return f"{name}:{self.implementation_version}:{body_digest}"
+
+    def validate_cached_request(self, uuid: str, body: PdfBody) -> str:
+        """Check a request answered from the result cache as the implementation would check it.
+
+        Raises the ``HTTPException`` the implementation would answer an invalid
+        request with, and returns the ``custom_id`` the cached result is given.
+        The default accepts the uuid as it is."""
+        return uuid
+
+    @classmethod
+    def preload(cls) -> None:
+        """Called in the parent of forked workers (``openapi_server.serve``) before forking; build state they can share here."""
+
+    async def startup(self) -> None:
+        """Called once when the application starts, before the first request; acquire warm state here."""
+
+    async def shutdown(self) -> None:
+        """Called once when the application stops; release what ``startup`` acquired."""
+
     def classify_pdf(
         self,
         uuid: str,
-        body: bytearray,
+        body: PdfBody,
     ) -> ClassificationResult:
         """Upload a PDF as binary and inspect the contents. The data is uploaded in binary form and the result is a structure that returns the type of the document and a key-value list of type-specific identifiers. """
-        ...
\ No newline at end of file
+        ...
+
+    def classify_pdf_json(
+        self,
+        uuid: str,
+        body: PdfBody,
+    ) -> bytes:
+        """The response of ``classify_pdf`` as JSON-encoded bytes.
+
+        Implementations that can render their response without building the models
+        override this; the default serializes the result of ``classify_pdf``."""
+        result = self.classify_pdf(uuid, body)
+        with time_stage("serialization"):
+            return result.model_dump_json(by_alias=True).encode("utf-8")
+
+    async def classify_pdf_async(
+        self,
+        uuid: str,
+        body: PdfBody,
+    ) -> Union[ClassificationResult, bytes]:
+        """Non-blocking variant of ``classify_pdf`` used by the router.
+
+        Returns either the response model or its JSON encoding as ``bytes``.
+        Implementations doing I/O override this with a native coroutine. The default
+        runs the synchronous ``classify_pdf_json`` on the bounded executor (see
+        ``openapi_server.executor``) so it never blocks the event loop."""
+        return await run_sync(self.classify_pdf_json, uuid, body)
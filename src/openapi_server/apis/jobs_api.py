@@ -0,0 +1,104 @@
+# coding: utf-8
+
+"""
+Asynchronous classification: ``POST /jobs/{uuid}`` queues the upload and
+answers 202 with a job id right away, ``GET /jobs/{job_id}`` returns the job's
+state and, once finished, its result. ``?wait=<seconds>`` long-polls until
+the job finished; an ``X-Callback-Url`` given at submission receives the
+finished job as a JSON ``POST`` if its host is in
+``settings.jobs_callback_allowlist``.
+"""
+
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Path, Query, Request, Response
+
+from openapi_server.body_stream import read_pdf_body
+from openapi_server.jobs import Job, JobManager, QueueFullError, get_job_manager
+from openapi_server.models.error import Error
+from openapi_server.settings import settings
+
+router = APIRouter()
+
+
+def _job_manager() -> JobManager:
+    manager = get_job_manager()
+    if manager is None:
+        raise HTTPException(status_code=503, detail="The job service is not running")
+    return manager
+
+
+@router.post(
+    "/jobs/{uuid}",
+    status_code=202,
+    responses={
+        202: {"description": "Job accepted; poll the Location header for the result"},
+        400: {"model": Error, "description": "The uploaded file is either no PDF or could not be accessed properly, or the callback URL is not allowed"},
+        413: {"model": Error, "description": "The uploaded file exceeds the configured maximum body size"},
+        429: {"model": Error, "description": "The job queue is full, retry later"},
+    },
+    tags=["jobs"],
+    summary="Queue a PDF for classification and return a job id",
+    openapi_extra={
+        "requestBody": {
+            "description": "The PDF as binary data.",
+            "required": True,
+            "content": {"application/pdf": {"schema": {"type": "string", "format": "binary"}}},
+        },
+    },
+)
+async def submit_job(
+    request: Request,
+    uuid: str = Path(..., description="The uuid in the path sets the user&#39;s process id for the uploaded pdf."),
+    x_callback_url: Optional[str] = Header(None, alias="X-Callback-Url", description="URL receiving the finished job as JSON POST."),
+    x_corruption_seed: Optional[str] = Header(None, alias="X-Corruption-Seed", description="Seed for deterministic corruption of the mocked values; overrides the configured seed."),
+) -> Response:
+    """Upload a PDF and receive a job id immediately; the classification runs in the background."""
+    manager = _job_manager()
+    if manager.queued >= manager.queue_depth:
+        # reject before reading the body
+        raise HTTPException(status_code=429, detail="Job queue is full", headers={"Retry-After": "1"})
+    if x_callback_url is not None and not manager.callback_allowed(x_callback_url):
+        raise HTTPException(status_code=400, detail="X-Callback-Url must be an http(s) URL to an allowed host")
+    seed = x_corruption_seed if x_corruption_seed is not None else settings.corruption_seed
+    if settings.stream_body:
+        # the job owns the spooled upload from here on, large ones stay on disk until the job ran
+        upload = await read_pdf_body(
+            request,
+            spool_threshold=settings.body_spool_threshold,
+            max_size=settings.body_max_size,
+            spool_dir=settings.body_spool_dir,
+        )
+    else:
+        upload = await request.body()
+    job = await _submit(manager, uuid, upload, x_callback_url, seed)
+    return Response(content=job.to_json(), status_code=202, media_type="application/json",
+                    headers={"Location": f"{request.url.path.rsplit('/jobs/', 1)[0]}/jobs/{job.id}"})
+
+
+async def _submit(manager: JobManager, uuid: str, body, callback_url: Optional[str], seed: Optional[str]) -> Job:
+    try:
+        return await manager.submit(uuid, body, callback_url=callback_url, corruption_seed=seed)
+    except QueueFullError:
+        raise HTTPException(status_code=429, detail="Job queue is full", headers={"Retry-After": "1"})
+
+
+@router.get(
+    "/jobs/{job_id}",
+    responses={
+        200: {"description": "The job with its status and, once done, the classification result"},
+        404: {"model": Error, "description": "Unknown or expired job"},
+    },
+    tags=["jobs"],
+    summary="Get the state and result of a classification job",
+)
+async def get_job(
+    job_id: str = Path(..., description="The job id returned on submission."),
+    wait: float = Query(0, ge=0, description="Seconds to wait for an unfinished job before answering (long-poll)."),
+) -> Response:
+    """Return the job; with ``wait`` the answer is delayed until the job finished or the time ran out."""
+    manager = _job_manager()
+    job = await manager.wait(job_id, min(wait, settings.jobs_max_wait))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return Response(content=job.to_json(), media_type="application/json")
@@ -0,0 +1,19 @@
+# coding: utf-8
+
+from fastapi import APIRouter, Response
+
+from openapi_server.metrics import CONTENT_TYPE, render
+
+router = APIRouter()
+
+
+@router.get(
+    "/metrics",
+    responses={200: {"description": "Metrics in the Prometheus text exposition format",
+                     "content": {"text/plain": {}}}},
+    tags=["metrics"],
+    summary="Prometheus metrics of the service",
+)
+async def metrics() -> Response:
+    """Per-stage timings, classification and request counters, in-flight requests and body sizes."""
+    return Response(content=render(), media_type=CONTENT_TYPE)
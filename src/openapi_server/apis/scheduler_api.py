@@ -0,0 +1,22 @@
+# coding: utf-8
+
+"""
+Runtime view of the cost scheduler, see ``openapi_server.scheduler``.
+"""
+
+from fastapi import APIRouter
+
+from openapi_server.scheduler import scheduler
+
+router = APIRouter()
+
+
+@router.get(
+    "/scheduler",
+    responses={200: {"description": "Queues of the cost scheduler and its cost model, configured and fitted"}},
+    tags=["scheduler"],
+    summary="Cost scheduler queues and model calibration",
+)
+async def get_scheduler() -> dict:
+    """Return this process's queues, the configured cost model and one fitted to the recent samples."""
+    return scheduler.snapshot()
@@ -0,0 +1,174 @@
+# coding: utf-8
+
+"""
+Streaming ingestion of uploaded PDF bodies.
+
+Instead of letting FastAPI buffer the whole upload as ``bytes`` the body is
+read chunk-wise from the ASGI receive stream. The ``%PDF-`` header is checked
+as soon as the first bytes arrive, so non-PDF uploads are rejected with 400
+before the rest of the body is transferred. Accepted bodies are written to a
+``BytesIO`` up to a configurable threshold and moved to a ``TemporaryFile``
+on disk beyond it; uploads above the configured maximum size are rejected
+with 413. The SHA-256 of the body is computed while it is
+written, so content-addressed lookups need no second pass over the upload.
+
+``SpooledBody.getbuffer`` hands the body on without copying it: a read-only
+``memoryview`` of the in-memory buffer, or of an ``mmap`` of the spool file
+once it rolled over to disk, so the memory a request needs does not grow with
+the size of its upload. The view is only valid until the body is closed.
+"""
+
+import hashlib
+import io
+import logging
+import mmap
+import tempfile
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+from openapi_server.implementation.classification_service import EXPECTED_PDF_HEADER
+
+logger = logging.getLogger(__name__)
+
+# The header is judged once one byte more than the header has arrived, so
+# that a body consisting of nothing but a (broken) header is still reported
+# as "too short" exactly like the buffered validation does.
+_HEADER_DECISION_SIZE = len(EXPECTED_PDF_HEADER) + 1
+
+
+class SpooledBody:
+    """An uploaded body held in memory up to ``spool_threshold`` bytes, in a temporary file beyond."""
+
+    def __init__(self, spool_threshold: int, spool_dir: Optional[str] = None):
+        self.spool_threshold = spool_threshold
+        self.spool_dir = spool_dir
+        self.file = io.BytesIO()
+        self.rolled_to_disk = False
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self._view: Optional[memoryview] = None
+        self._mmap: Optional[mmap.mmap] = None
+
+    def write(self, chunk: bytes):
+        if not self.rolled_to_disk and self.size + len(chunk) > self.spool_threshold:
+            self._roll_over()
+        self.file.write(chunk)
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+
+    @property
+    def digest(self) -> str:
+        """Hex SHA-256 of everything written so far."""
+        return self.sha256.hexdigest()
+
+    def _roll_over(self):
+        spool = tempfile.TemporaryFile(mode="w+b", dir=self.spool_dir)
+        try:
+            spool.write(self.file.getbuffer())
+        except BaseException:
+            spool.close()
+            raise
+        self.file.close()
+        self.file, self.rolled_to_disk = spool, True
+
+    def getvalue(self) -> bytes:
+        """Return the complete body as ``bytes``."""
+        self.file.seek(0)
+        return self.file.read()
+
+    def getbuffer(self) -> memoryview:
+        """
+        Return the complete body as a read-only ``memoryview`` without copying it.
+
+        Bodies that rolled over to disk are memory-mapped, so their pages are
+        read from the spool file on access. The view and slices of it must not
+        be used after ``close``.
+        """
+        if self._view is not None:
+            return self._view
+        if self.size == 0:
+            view = memoryview(b"")
+        elif self.rolled_to_disk:
+            self.file.flush()
+            self._mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(self._mmap)
+        else:
+            # BytesIO.getvalue shares its buffer with the returned bytes until the next write
+            view = memoryview(self.file.getvalue())
+        self._view = view
+        return view
+
+    def close(self):
+        view, self._view, buffer, self._mmap = self._view, None, self._mmap, None
+        releases = [self.file.close]
+        if buffer is not None:
+            releases.insert(0, buffer.close)
+        if view is not None:
+            releases.insert(0, view.release)
+        for release in releases:
+            try:
+                release()
+            except BufferError:
+                # the body is still in use, e.g. by a cancelled classification; it is freed with the last reference
+                logger.debug("Body buffer still referenced when its upload was closed")
+
+    def __enter__(self) -> "SpooledBody":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _assert_header(head: bytes, complete: bool):
+    """Validate the first bytes of an upload, mirroring ``assertValidBody``."""
+    if complete and len(head) == 0:
+        raise HTTPException(status_code=400, detail="PDF body must be present")
+    if complete and len(head) <= len(EXPECTED_PDF_HEADER):
+        raise HTTPException(status_code=400, detail="PDF body too short")
+    if head[0:len(EXPECTED_PDF_HEADER)] != EXPECTED_PDF_HEADER:
+        raise HTTPException(status_code=400, detail="Invalid file format: Does not appear to be a PDF.")
+
+
+def _too_large(max_size: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"PDF body exceeds the maximum size of {max_size} bytes")
+
+
+async def read_pdf_body(
+        request: Request,
+        spool_threshold: int,
+        max_size: int,
+        spool_dir: Optional[str] = None,
+) -> SpooledBody:
+    """
+    Read the request body into a ``SpooledBody``, failing fast on bad uploads.
+
+    Raises:
+        HTTPException: 400 if the body is missing, too short or does not start
+            with the PDF header, 413 if it exceeds ``max_size``.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > max_size:
+        raise _too_large(max_size)
+
+    spooled = SpooledBody(spool_threshold, spool_dir)
+    head = b''
+    header_checked = False
+    try:
+        async for chunk in request.stream():
+            if not chunk:
+                continue
+            if not header_checked:
+                head += chunk[:_HEADER_DECISION_SIZE]
+                if len(head) >= _HEADER_DECISION_SIZE:
+                    _assert_header(head, complete=False)
+                    header_checked = True
+            if spooled.size + len(chunk) > max_size:
+                raise _too_large(max_size)
+            spooled.write(chunk)
+        if not header_checked:
+            _assert_header(head, complete=True)
+    except BaseException:
+        spooled.close()
+        raise
+    return spooled
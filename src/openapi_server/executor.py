@@ -0,0 +1,103 @@
+# coding: utf-8
+
+"""
+Bounded executor for synchronous classification implementations.
+
+The routes are ``async``; calling a synchronous ``classify_pdf`` directly from
+them blocks the event loop for every other in-flight request. ``run_sync``
+hands such calls to a bounded thread pool (default) or process pool (for
+CPU-bound implementations), sized by ``settings.executor_workers``. Threads
+get the arguments as they are; memory views, which cannot be pickled, are
+copied to ``bytes`` on their way to a worker process.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import os
+import threading
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException
+
+from openapi_server import request_context
+from openapi_server.settings import settings
+
+EXECUTOR_KINDS = ("thread", "process")
+
+_executor: Optional[concurrent.futures.Executor] = None
+_executor_kind: Optional[str] = None
+_lock = threading.Lock()
+
+
+class _RemoteHTTPException:
+    """Picklable stand-in for an ``HTTPException`` raised in a worker process."""
+
+    def __init__(self, exc: HTTPException):
+        self.status_code = exc.status_code
+        self.detail = exc.detail
+        self.headers = exc.headers
+
+    def to_exception(self) -> HTTPException:
+        return HTTPException(status_code=self.status_code, detail=self.detail, headers=self.headers)
+
+
+def _call_in_process(fn: Callable, args: tuple, context: request_context.RequestContext) -> Any:
+    # HTTPException cannot be unpickled, so it travels back as a plain value
+    try:
+        with request_context.use(context):
+            return fn(*args)
+    except HTTPException as e:
+        return _RemoteHTTPException(e)
+
+
+def default_workers(kind: str) -> int:
+    cpus = os.cpu_count() or 1
+    if kind == "process":
+        return cpus
+    return min(32, cpus + 4)
+
+
+def get_executor() -> concurrent.futures.Executor:
+    """Return the shared executor, creating it from the settings on first use."""
+    global _executor, _executor_kind
+    if _executor is not None:
+        return _executor
+    with _lock:
+        if _executor is None:
+            kind = settings.executor_kind
+            if kind not in EXECUTOR_KINDS:
+                raise ValueError(f"Unknown executor kind '{kind}', expected one of {EXECUTOR_KINDS}")
+            workers = settings.executor_workers or default_workers(kind)
+            if kind == "process":
+                _executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            else:
+                _executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                                  thread_name_prefix="classify")
+            _executor_kind = kind
+    return _executor
+
+
+def shutdown_executor(wait: bool = True):
+    """Shut the shared executor down; the next ``run_sync`` creates a fresh one."""
+    global _executor, _executor_kind
+    with _lock:
+        executor, _executor, _executor_kind = _executor, None, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+async def run_sync(fn: Callable, *args) -> Any:
+    """Run the synchronous ``fn(*args)`` on the shared executor without blocking the event loop."""
+    executor = get_executor()
+    loop = asyncio.get_running_loop()
+    if _executor_kind == "process":
+        args = tuple(bytes(arg) if isinstance(arg, memoryview) else arg for arg in args)
+        result = await loop.run_in_executor(executor, _call_in_process, fn, args, request_context.current())
+        if isinstance(result, _RemoteHTTPException):
+            raise result.to_exception()
+        return result
+    # threads get a copy of the request's context variables
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(ctx.run, fn, *args))
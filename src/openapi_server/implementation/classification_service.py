@@ -1,207 +1,37 @@
 # openapi_server/implementation/classification_service.py
 import datetime
+import hashlib
+import json
+import logging
 import random
-import string
 import uuid
+from typing import Dict, NamedTuple, Optional
 
 from fastapi import HTTPException
 
 # Assuming your models are correctly defined and imported
-from openapi_server.apis.classification_api_base import BaseClassificationApi
+from openapi_server import request_context
+from openapi_server.apis.classification_api_base import BaseClassificationApi, PdfBody
+from openapi_server.implementation.corruption import PRINTABLE_CHARS, CorruptionEngine, default_engine  # noqa: F401
+from openapi_server.implementation.latency import LatencySimulator, default_simulator
+from openapi_server.implementation.mock_table import DEFAULT_TABLE_PATH, SUFFIX, TableWatcher, load_rules
+from openapi_server.implementation.pdf_structure import PdfBudgetExceeded, PdfStructure, PdfStructureError, inspect_pdf
+from openapi_server.metrics import classifications_total, time_stage
 from openapi_server.models.classification_result import ClassificationResult
 from openapi_server.models.result_item import ResultItem
 from openapi_server.models.qualified_value import QualifiedValue
+from openapi_server.settings import settings
+
+logger = logging.getLogger(__name__)
 
 EXPECTED_PDF_HEADER = b'%PDF-'  # Note the b prefix for bytes
 
 # --- Data for Mock Responses ---
-# Map UUID endings (last 2 digits as string) to response data dictionaries
-MOCK_RESPONSES = {
-    "10": {
-        "kind": "INVOICE",
-        "doc_id_val": "DOC123", "doc_id_score": 0.99,
-        "doc_date_sic_val": "2024-01-01", "doc_date_sic_score": 0.9,
-        "doc_date_parsed": "2024-01-01T10:00:00Z",
-        "doc_subject_val": "KFZ Reparatur", "doc_subject_score": 0.8
-    },
-    "11": {
-        "kind": "INVOICE",
-        "doc_id_val": "DOC124", "doc_id_score": 0.89,
-        "doc_date_sic_val": "2025-03-12", "doc_date_sic_score": 0.7,
-        "doc_date_parsed": "2025-03-12T00:00:00Z",  # Corrected 'ß'
-        "doc_subject_val": "Ihr Einkauf vielen Dank", "doc_subject_score": 0.8
-    },
-    "12": {
-        "kind": "INVOICE",
-        "doc_id_val": "DOC125", "doc_id_score": 0.79,
-        "doc_date_sic_val": "2025-03-13", "doc_date_sic_score": 0.6,
-        "doc_date_parsed": "2025-03-13T00:00:00Z",  # Corrected 'ß'
-        "doc_subject_val": "Ihr Einkauf vielen Dank", "doc_subject_score": 0.7
-    },
-    # Cases 13-19 are identical to 12
-    "13": {"kind": "INVOICE",
-           "doc_id_val": "DOC126", "doc_id_score": 0.69,
-           "doc_date_sic_val": "2025-03-13", "doc_date_sic_score": 0.5,
-           "doc_date_parsed": "2025-03-13T00:00:00Z",
-           "doc_subject_val": "Ihr Einkauf vielen Dank", "doc_subject_score": 0.6},
-    "14": {"kind": "INVOICE", "doc_id_val": "DOC127", "doc_id_score": 0.59, "doc_date_sic_val": "2025-02-12",
-           "doc_date_sic_score": 0.5, "doc_date_parsed": "2025-02-12T00:00:00Z",
-           "doc_subject_val": "Ihr Einkauf vielen Dank", "doc_subject_score": 0.5},
-    "15": {"kind": "INVOICE", "doc_id_val": "DOC128", "doc_id_score": 0.49, "doc_date_sic_val": "2025-01-11",
-           "doc_date_sic_score": 0.4, "doc_date_parsed": "2025-01-11T00:00:00Z",
-           "doc_subject_val": "Ihr Einkauf vielen Dank", "doc_subject_score": 0.4},
-    "17": {"kind": "INVOICE", "doc_id_val": "DOC129", "doc_id_score": 0.39, "doc_date_sic_val": "2024-12-10",
-           "doc_date_sic_score": 0.3, "doc_date_parsed": "2024-12-10T00:00:00Z",
-           "doc_subject_val": "Ihr Einkauf vielen Dank", "doc_subject_score": 0.3},
-    "18": {"kind": "INVOICE", "doc_id_val": "DOC130", "doc_id_score": 0.29, "doc_date_sic_val": "2024-11-11",
-           "doc_date_sic_score": 0.2, "doc_date_parsed": "2024-11-11T00:00:00Z",
-           "doc_subject_val": "Ihr Einkauf vielen Dank", "doc_subject_score": 0.2},
-    "19": {"kind": "INVOICE", "doc_id_val": "DOC131", "doc_id_score": 0.19, "doc_date_sic_val": "2024-10-09",
-           "doc_date_sic_score": 0.1, "doc_date_parsed": "2024-10-09T00:00:00Z",
-           "doc_subject_val": "Ihr Einkauf vielen Dank", "doc_subject_score": 0.1},
-    "20": {
-        "kind": "STATEMENT",
-        "doc_id_val": "DE92 1234 5678 9123 87", "doc_id_score": 0.99,
-        "doc_date_sic_val": "2025-04-01", "doc_date_sic_score": 0.9,
-        "doc_date_parsed": "2025-04-01T00:00:00Z",  # Corrected 'ß'
-        "doc_subject_val": "Kontoauszug 3-25", "doc_subject_score": 0.7
-    },
-    "21": {
-        "kind": "STATEMENT",
-        "doc_id_val": "DE92 1234 5678 9123 87", "doc_id_score": 0.89,
-        "doc_date_sic_val": "2025-03-01", "doc_date_sic_score": 0.9,
-        "doc_date_parsed": "2025-03-01T00:00:00Z",  # Corrected 'ß'
-        "doc_subject_val": "Kontoauszug 2-25", "doc_subject_score": 0.7
-    },
-    "22": {
-        "kind": "STATEMENT",
-        "doc_id_val": "DE92 1234 5678 9123 87", "doc_id_score": 0.79,
-        "doc_date_sic_val": "2025-02-01", "doc_date_sic_score": 0.9,
-        "doc_date_parsed": "2025-02-01T00:00:00Z",  # Corrected 'ß'
-        "doc_subject_val": "Kontoauszug 1-25", "doc_subject_score": 0.7
-    },
-    "23": {
-        "kind": "STATEMENT",
-        "doc_id_val": "DE92 1234 5678 9123 87", "doc_id_score": 0.69,
-        "doc_date_sic_val": "2025-01-01", "doc_date_sic_score": 0.9,
-        "doc_date_parsed": "2025-01-01T00:00:00Z",  # Corrected 'ß'
-        "doc_subject_val": "Kontoauszug 12-24", "doc_subject_score": 0.7
-    },
-    "24": {
-        "kind": "STATEMENT",
-        "doc_id_val": "DE92 1234 5678 9123 87", "doc_id_score": 0.59,
-        "doc_date_sic_val": "2024-12-01", "doc_date_sic_score": 0.9,
-        "doc_date_parsed": "2024-12-01T00:00:00Z",
-        "doc_subject_val": "Kontoauszug 11-24", "doc_subject_score": 0.7
-    },
-    "25": {
-        "kind": "STATEMENT",
-        "doc_id_val": "DE92 1234 5678 9123 87", "doc_id_score": 0.49,
-        "doc_date_sic_val": "2024-11-01", "doc_date_sic_score": 0.9,
-        "doc_date_parsed": "2024-11-01T00:00:00Z",  # Corrected year from 2025
-        "doc_subject_val": "Kontoauszug 10-24", "doc_subject_score": 0.7
-    },
-    "26": {
-        "kind": "STATEMENT",
-        "doc_id_val": "DE92 1234 5678 9123 87", "doc_id_score": 0.39,
-        "doc_date_sic_val": "2024-10-01", "doc_date_sic_score": 0.9,
-        "doc_date_parsed": "2024-10-01T00:00:00Z",  # Corrected year from 2025
-        "doc_subject_val": "Kontoauszug 09-24", "doc_subject_score": 0.7
-    },
-    "27": {
-        "kind": "STATEMENT",
-        "doc_id_val": "DE92 1234 5678 9123 87", "doc_id_score": 0.29,
-        "doc_date_sic_val": "2024-09-01", "doc_date_sic_score": 0.9,
-        "doc_date_parsed": "2024-09-01T00:00:00Z",  # Corrected year from 2025
-        "doc_subject_val": "Kontoauszug 08-24", "doc_subject_score": 0.7
-    },
-    "28": {
-        "kind": "STATEMENT",
-        "doc_id_val": "DE92 1234 5678 9123 87", "doc_id_score": 0.19,
-        "doc_date_sic_val": "2024-08-01", "doc_date_sic_score": 0.9,
-        "doc_date_parsed": "2024-08-01T00:00:00Z",  # Corrected year from 2025
-        "doc_subject_val": "Kontoauszug 07-24", "doc_subject_score": 0.7
-    },
-    "29": {
-        "kind": "STATEMENT",
-        "doc_id_val": "DE92 1234 5678 9123 87", "doc_id_score": 0.09,
-        "doc_date_sic_val": "2024-07-01", "doc_date_sic_score": 0.9,
-        "doc_date_parsed": "2024-07-01T00:00:00Z",  # Corrected year from 2025
-        "doc_subject_val": "Kontoauszug 06-24", "doc_subject_score": 0.7
-    },
-    "30": {
-        "kind": "LETTER",
-        "doc_id_val": "K7-22389", "doc_id_score": 0.99,
-        "doc_date_sic_val": "2025-04-21", "doc_date_sic_score": 0.99,
-        "doc_date_parsed": "2025-04-21T00:00:00Z",
-        "doc_subject_val": "Versicherungsfall 4711", "doc_subject_score": 0.7
-    },
-    "31": {
-        "kind": "LETTER",
-        "doc_id_val": "K7-22389", "doc_id_score": 0.89,
-        "doc_date_sic_val": "2025-04-01", "doc_date_sic_score": 0.89,
-        "doc_date_parsed": "2025-04-01T00:00:00Z",
-        "doc_subject_val": "Versicherungsfall 4711", "doc_subject_score": 0.7
-    },
-    "32": {
-        "kind": "LETTER",
-        "doc_id_val": "K7-22389", "doc_id_score": 0.79,
-        "doc_date_sic_val": "2025-03-11", "doc_date_sic_score": 0.79,
-        "doc_date_parsed": "2025-03-11T00:00:00Z",
-        "doc_subject_val": "Beitragsanpassung", "doc_subject_score": 0.7
-    },
-    "33": {
-        "kind": "LETTER",
-        "doc_id_val": "B-2025-SSA-KGA", "doc_id_score": 0.69,
-        "doc_date_sic_val": "2025-01-12", "doc_date_sic_score": 0.69,
-        "doc_date_parsed": "2025-01-12T00:00:00Z",
-        "doc_subject_val": "Kindergeld Bertram", "doc_subject_score": 0.7
-    },
-    "34": {
-        "kind": "LETTER",
-        "doc_id_val": "Klasse 7b", "doc_id_score": 0.59,
-        "doc_date_sic_val": "2024-12-22", "doc_date_sic_score": 0.59,
-        "doc_date_parsed": "2024-12-22T00:00:00Z",
-        "doc_subject_val": "Einladung zum Elternabend", "doc_subject_score": 0.7
-    },
-    "35": {
-        "kind": "LETTER",
-        "doc_id_val": "Wandern", "doc_id_score": 0.49,
-        "doc_date_sic_val": "2024-11-10", "doc_date_sic_score": 0.49,
-        "doc_date_parsed": "2024-11-10T00:00:00Z",
-        "doc_subject_val": "Wanderfreunde Bergisch-Gladbach", "doc_subject_score": 0.7
-    },
-    "36": {
-        "kind": "LETTER",
-        "doc_id_val": "Lotto-DE", "doc_id_score": 0.39,
-        "doc_date_sic_val": "2024-10-01", "doc_date_sic_score": 0.39,
-        "doc_date_parsed": "2024-10-01T00:00:00Z",
-        "doc_subject_val": "Hxx-123-so-aaaayxy", "doc_subject_score": 0.2
-    },
-    "37": {
-        "kind": "LETTER",
-        "doc_id_val": "", "doc_id_score": 0.29,
-        "doc_date_sic_val": "2024-09-01", "doc_date_sic_score": 0.29,
-        "doc_date_parsed": "2024-09-01T00:00:00Z",
-        "doc_subject_val": "", "doc_subject_score": 0.0
-    },
-    "38": {  # Note: Table had 39 then 38, assuming 38 comes before 39
-        "kind": "LETTER",
-        "doc_id_val": "", "doc_id_score": 0.19,
-        "doc_date_sic_val": "2024-08-01", "doc_date_sic_score": 0.19,
-        "doc_date_parsed": "2024-08-01T00:00:00Z",
-        "doc_subject_val": "", "doc_subject_score": 0.0
-    },
-    "39": {
-        "kind": "LETTER",
-        "doc_id_val": "", "doc_id_score": 0.09,
-        "doc_date_sic_val": "2024-07-01", "doc_date_sic_score": 0.09,
-        "doc_date_parsed": "2024-07-01T00:00:00Z",
-        "doc_subject_val": "", "doc_subject_score": 0.0
-    },
-}
+# The responses are rules in a table file, see mock_table. These are the suffix
+# rules of the packaged table, mapping UUID endings to response data dictionaries.
+MOCK_RESPONSES = {rule.pattern: rule.data for rule in load_rules(DEFAULT_TABLE_PATH) if rule.match == SUFFIX}
 
-# --- Default response if UUID ending doesn't match ---
+# --- Default response if no rule matches the UUID ---
 DEFAULT_RESPONSE_DATA = {
     "kind": "UNKNOWN",
     "doc_id_val": "N/A", "doc_id_score": 0.0,
@@ -211,14 +41,127 @@ DEFAULT_RESPONSE_DATA = {
 }
 
 
-# Define a set of characters to use for random replacement.
-# This excludes control characters but includes common text characters.
-PRINTABLE_CHARS = string.ascii_letters + string.digits + string.punctuation + ' '
+# --- Precompiled response templates ---
+# Each rule is validated and serialized once when its table is loaded. Per
+# request only the corrupted values, class_id and custom_id are filled in.
+_PLACEHOLDERS = ("class_id", "custom_id", "doc_id", "doc_date_sic", "doc_subject")
+
+
+def _placeholder(name: str) -> str:
+    return f"@@{name}@@"
+
+
+class ResponseTemplate(NamedTuple):
+    """A pre-validated mock response with its JSON pre-serialized around the per-request values."""
+    kind: str
+    doc_id_val: str
+    doc_id_score: float
+    doc_date_sic_val: str
+    doc_date_sic_score: float
+    doc_date_parsed: Optional[datetime.datetime]
+    doc_subject_val: str
+    doc_subject_score: float
+    # the serialized response split at the placeholders, len(_PLACEHOLDERS) + 1 parts
+    json_fragments: tuple
+
+    def to_model(self, class_id: str, custom_id: str, doc_id: str, doc_date_sic: str,
+                 doc_subject: str) -> ClassificationResult:
+        """Build the response model from already validated values, skipping pydantic validation."""
+        return ClassificationResult.model_construct(
+            class_id=class_id,
+            custom_id=custom_id,
+            result=ResultItem.model_construct(
+                kind=self.kind,
+                doc_id=QualifiedValue.model_construct(value=doc_id, score=self.doc_id_score),
+                doc_date_sic=QualifiedValue.model_construct(value=doc_date_sic, score=self.doc_date_sic_score),
+                doc_date_parsed=self.doc_date_parsed,
+                doc_subject=QualifiedValue.model_construct(value=doc_subject, score=self.doc_subject_score),
+            ),
+        )
+
+    def to_json(self, class_id: str, custom_id: str, doc_id: str, doc_date_sic: str, doc_subject: str) -> bytes:
+        """Render the response as JSON bytes, identical to the serialized response model."""
+        fragments = self.json_fragments
+        return b"".join((
+            fragments[0], _json_string(class_id),
+            fragments[1], _json_string(custom_id),
+            fragments[2], _json_string(doc_id),
+            fragments[3], _json_string(doc_date_sic),
+            fragments[4], _json_string(doc_subject),
+            fragments[5],
+        ))
+
+
+def _json_string(value: str) -> bytes:
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def compile_response_template(response_data: Dict) -> ResponseTemplate:
+    """Validate the response data of one table rule and pre-serialize its JSON."""
+    try:
+        parsed_date = datetime.datetime.fromisoformat(response_data["doc_date_parsed"])
+    except ValueError:
+        parsed_date = None
+
+    # Validate once through the real models, with placeholders for the per-request values
+    skeleton = ClassificationResult(
+        class_id=_placeholder("class_id"),
+        custom_id=_placeholder("custom_id"),
+        result=ResultItem(
+            kind=response_data["kind"],
+            doc_id=QualifiedValue(value=_placeholder("doc_id"), score=response_data["doc_id_score"]),
+            doc_date_sic=QualifiedValue(value=_placeholder("doc_date_sic"), score=response_data["doc_date_sic_score"]),
+            doc_date_parsed=parsed_date,
+            doc_subject=QualifiedValue(value=_placeholder("doc_subject"), score=response_data["doc_subject_score"]),
+        ),
+    )
+    rest = skeleton.model_dump_json(by_alias=True).encode("utf-8")
+    fragments = []
+    for name in _PLACEHOLDERS:
+        fragment, rest = rest.split(_json_string(_placeholder(name)), 1)
+        fragments.append(fragment)
+    fragments.append(rest)
+
+    return ResponseTemplate(
+        kind=skeleton.result.kind,
+        doc_id_val=response_data["doc_id_val"],
+        doc_id_score=skeleton.result.doc_id.score,
+        doc_date_sic_val=response_data["doc_date_sic_val"],
+        doc_date_sic_score=skeleton.result.doc_date_sic.score,
+        doc_date_parsed=parsed_date,
+        doc_subject_val=response_data["doc_subject_val"],
+        doc_subject_score=skeleton.result.doc_subject.score,
+        json_fragments=tuple(fragments),
+    )
+
+
+def seeded_rng(seed: str, uuid_str: str) -> random.Random:
+    """Per-request RNG derived from the global or per-request seed and the request UUID."""
+    return random.Random(hashlib.sha256(f"{seed}:{uuid_str}".encode("utf-8")).digest())
+
+
+DEFAULT_RESPONSE_TEMPLATE = compile_response_template(DEFAULT_RESPONSE_DATA)
+# the table of settings.mock_table_path with each rule compiled to a ResponseTemplate
+response_tables = TableWatcher(compile_response_template)
+
+
+def _canonical_uuid(uuid_str: str) -> str:
+    try:
+        return str(uuid.UUID(uuid_str))
+    except ValueError:
+        return uuid_str
+
 
 class ClassificationServiceImpl(BaseClassificationApi):
     """
     Concrete implementation of the Classification API logic.
     """
+    implementation_name = "mock"
+
+    # engine used to corrupt the mock values, replace it with a seeded one for reproducible output
+    corruption_engine: CorruptionEngine = default_engine
+    # simulated backend latency and slot limit, configured through the latency_* settings
+    latency_simulator: LatencySimulator = default_simulator
 
     @staticmethod
     def corrupt_value(original_value, score_str):
@@ -233,90 +176,141 @@ class ClassificationServiceImpl(BaseClassificationApi):
         Returns:
             str: The potentially corrupted string.
         """
-        if not original_value:  # Handle empty or None values
-            return ""
-        try:
-            score = float(score_str)
-            if not (0.0 <= score <= 1.0):  # Ensure score is a valid probability
-                score = 1.0  # Default to no corruption if score is invalid
-        except (ValueError, TypeError):
-            # If score is not a valid float or None, return original value (no corruption)
-            return original_value
-
-        corrupted_char_list = []
-        for char_code in original_value:
-            if random.random() < score:
-                corrupted_char_list.append(char_code)
-            else:
-                corrupted_char_list.append(random.choice(PRINTABLE_CHARS))
-        return "".join(corrupted_char_list)
+        return default_engine.corrupt(original_value, score_str)
 
     def classify_pdf(
             self,
             uuid_param_str: str,
-            body: bytes
+            body: PdfBody
     ) -> ClassificationResult:
         """
         Actual implementation to classify the PDF.
-        Returns a mocked response based on the last two digits of uuid_param.
+        Returns the mocked response of the table rule matching uuid_param.
         """
-        print(f"--- Inside ClassificationServiceImpl.classify_pdf ---")
-        print(f"Received UUID: {uuid_param_str}")
-        print(f"Received body length: {len(body) if body else 0} bytes")
+        template, values = self._fill_template(uuid_param_str, body)
+        with time_stage("model_construction"):
+            return template.to_model(*values)
 
-        # Ensure the uuid_param_str is a string
+    def classify_pdf_json(
+            self,
+            uuid_param_str: str,
+            body: PdfBody
+    ) -> bytes:
+        """
+        Same as classify_pdf, but renders the precompiled JSON template directly.
+        """
+        template, values = self._fill_template(uuid_param_str, body)
+        with time_stage("serialization"):
+            return template.to_json(*values)
+
+    def result_cache_key(self, uuid_param_str: str, body_digest: str) -> Optional[str]:
+        """
+        The mocked result depends on the table and its rule matching the uuid,
+        and with a corruption seed on the whole uuid. The validation settings
+        are part of the key: a cached result was produced from this very body
+        under them, so it passed the structure check a hit would repeat.
+        """
+        seed = request_context.current().corruption_seed
+        table = response_tables.table()
+        if seed is None:
+            entry = table.match(_canonical_uuid(uuid_param_str))
+            selector = f"{table.version}:{'default' if entry is None else entry.key}"
+        else:
+            selector = f"{table.version}:{seed}:{_canonical_uuid(uuid_param_str)}"
+        validation = f"{settings.pdf_validation}:{settings.pdf_reject_encrypted}"
+        return f"{super().result_cache_key(uuid_param_str, body_digest)}:{validation}:{selector}"
+
+    def validate_cached_request(self, uuid_param_str: str, body: PdfBody) -> str:
         uuid_param = self.assertValidUuidParam(uuid_param_str)
+        self.assertValidBody(body)
+        return str(uuid_param)
+
+    @classmethod
+    def preload(cls) -> None:
+        # compiled once in the parent, the workers share it and only start watching the file
+        response_tables.load()
+
+    async def startup(self) -> None:
+        # a broken table fails the start instead of the first request
+        response_tables.table()
+
+    async def shutdown(self) -> None:
+        response_tables.stop()
+
+    async def classify_pdf_async(
+            self,
+            uuid_param_str: str,
+            body: PdfBody
+    ) -> bytes:
+        """
+        Like the default, but first waits out the simulated backend latency.
+        """
+        async with self.latency_simulator.slot():
+            await self.latency_simulator.delay(uuid_param_str, len(body) if body else 0)
+            return await super().classify_pdf_async(uuid_param_str, body)
+
+    def _fill_template(self, uuid_param_str: str, body: PdfBody):
+        """Validate the request and pick the template and per-request values for the response."""
+        # Ensure the uuid_param_str is a string
+        with time_stage("parse_uuid"):
+            uuid_param = self.assertValidUuidParam(uuid_param_str)
 
         # Ensure the body is somewhat a PDF
-        self.assertValidBody(body)
+        with time_stage("validate_body"):
+            self.assertValidBody(body)
+        if settings.pdf_validation == "structure":
+            with time_stage("validate_structure"):
+                structure = self.assertValidStructure(body)
+            logger.debug("PDF %s with %s pages", structure.version, structure.page_count,
+                         extra={"page_count": structure.page_count, "encrypted": structure.encrypted,
+                                "xref": structure.xref})
 
         try:
             # --- Determine response based on UUID ---
             uuid_str = str(uuid_param)
             uuid_ending = uuid_str[-2:]  # Get last two characters
 
-            # Get the specific response data, or use default if not found
-            response_data = MOCK_RESPONSES.get(uuid_ending, DEFAULT_RESPONSE_DATA)
-            print(f"Using response data for UUID ending: '{uuid_ending}'")
-
-            # --- Construct the ResultItem ---
-            # Use the specific data from the selected dictionary
-            try:
-                parsed_date = datetime.datetime.fromisoformat(response_data["doc_date_parsed"])
-            except ValueError:
-                parsed_date = None
-
-            result_item = ResultItem(
-                kind=response_data["kind"],
-                doc_id=QualifiedValue(value=ClassificationServiceImpl.corrupt_value(response_data["doc_id_val"], response_data["doc_id_score"]),
-                                      score=response_data["doc_id_score"]),
-                doc_date_sic=QualifiedValue(value=ClassificationServiceImpl.corrupt_value(response_data["doc_date_sic_val"], response_data["doc_date_sic_score"]),
-                                            score=response_data["doc_date_sic_score"]),
-                doc_date_parsed=parsed_date,
-                doc_subject=QualifiedValue(value=ClassificationServiceImpl.corrupt_value(response_data["doc_subject_val"], response_data["doc_subject_score"]),
-                                           score=response_data["doc_subject_score"])
-            )
+            # Get the template of the matching rule, or use default if none matches
+            entry = response_tables.table().match(uuid_str)
+            template = DEFAULT_RESPONSE_TEMPLATE if entry is None else entry.value
+
+            seed = request_context.current().corruption_seed
+            if seed is None:
+                engine = self.corruption_engine
+                class_id = str(uuid.uuid4())  # Generate a new unique ID for this classification result
+            else:
+                # Deterministic mode: identical (seed, uuid) requests produce identical responses
+                rng = seeded_rng(seed, uuid_str)
+                engine = self.corruption_engine.with_rng(rng)
+                class_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
 
-            # --- Construct the final ClassificationResult ---
-            response_model = ClassificationResult(
-                class_id=str(uuid.uuid4()),  # Generate a new unique ID for this classification result
-                custom_id=uuid_str,  # Use the input UUID as the custom ID
-                result=result_item  # Assign the constructed ResultItem
+            # Corrupt all values of the response in one batch
+            with time_stage("corrupt"):
+                corrupted = engine.corrupt_many((
+                    (template.doc_id_val, template.doc_id_score),
+                    (template.doc_date_sic_val, template.doc_date_sic_score),
+                    (template.doc_subject_val, template.doc_subject_score),
+                ))
+            values = (
+                class_id,
+                uuid_str,  # Use the input UUID as the custom ID
+                *corrupted,
             )
-            return response_model
+            classifications_total.labels(template.kind, uuid_ending).inc()
+            logger.debug("Classified %d bytes with the response of rule '%s'", len(body),
+                         "default" if entry is None else entry.key,
+                         extra={"template": template.kind, "seeded": seed is not None})
+            return template, values
 
         except Exception as e:
             # Log the detailed error for debugging
-            print(f"Error during classification processing for UUID {uuid_param}: {e}")
-            import traceback
-            traceback.print_exc()  # Print the full traceback to the console
+            logger.exception("Error during classification processing for UUID %s", uuid_param)
 
             # Return a generic 500 error to the client
             raise HTTPException(status_code=500,
                                 detail=f"Internal server error during classification: An unexpected error occurred. {e}")
-            # --- END OF YOUR LOGIC ---
 
-    def assertValidBody(self, body:bytes):
+    def assertValidBody(self, body: PdfBody):
         if not body or len(body) == 0:
             raise HTTPException(status_code=400, detail="PDF body must be present")
         if len(body) <= len(EXPECTED_PDF_HEADER):
@@ -324,6 +318,19 @@ class ClassificationServiceImpl(BaseClassificationApi):
         if not body or not body[0:len(EXPECTED_PDF_HEADER)] == EXPECTED_PDF_HEADER:
             raise HTTPException(status_code=400, detail="Invalid file format: Does not appear to be a PDF.")
 
+    def assertValidStructure(self, body: PdfBody) -> PdfStructure:
+        """Check the trailer, xref and page tree of the body, within the configured time budget."""
+        budget_ms = settings.pdf_validation_budget_ms
+        try:
+            structure = inspect_pdf(body, budget_ms=budget_ms)
+        except PdfBudgetExceeded:
+            raise HTTPException(status_code=400, detail=f"PDF structure could not be validated within {budget_ms} ms")
+        except PdfStructureError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid PDF structure: {e}")
+        if structure.encrypted and settings.pdf_reject_encrypted:
+            raise HTTPException(status_code=400, detail="Encrypted PDFs are not supported")
+        return structure
+
     def assertValidUuidParam(self, uuid_param_str: str) -> uuid.UUID:
         try:
             return uuid.UUID(uuid_param_str)
@@ -0,0 +1,232 @@
+# openapi_server/implementation/corruption.py
+"""
+Batched corruption of mock values.
+
+Each character of a value is kept with probability ``score`` and otherwise
+replaced by a random printable character, exactly like the former
+per-character ``random.random()`` / ``random.choice()`` loop. Instead of two
+Python-level RNG calls per character, ``CorruptionEngine`` draws one block of
+random bytes for all strings of a batch:
+
+* 4 bytes per character form an unsigned 32 bit integer ``u``; the character
+  is kept if ``u < round(score * 2**32)``.
+* One replacement character per position is produced by mapping random
+  bytes through a 256-entry ``bytes.translate`` table. Bytes that would bias
+  the choice (``>= 2 * 95``) are deleted by the same call and redrawn.
+
+Batches shorter than ``BLOCK_MIN_CHARS`` characters are cheaper to corrupt with
+per-character draws from the same RNG than to set up a block for, so they
+keep using it. Without an injected RNG the block bytes are sliced from a pool refilled from
+``os.urandom`` in large blocks, so short values do not cost a syscall each.
+If NumPy is installed, batches of at least ``NUMPY_MIN_CHARS`` characters are
+compared vectorized; both paths consume the random bytes identically, so a
+seeded RNG gives the same output with and without NumPy.
+"""
+import array
+import functools
+import os
+import random
+import string
+import sys
+import threading
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:  # NumPy is an optional accelerator
+    numpy = None
+
+# Define a set of characters to use for random replacement.
+# This excludes control characters but includes common text characters.
+PRINTABLE_CHARS = string.ascii_letters + string.digits + string.punctuation + ' '
+
+_DECISION_BYTES = 4
+_DECISION_RANGE = 1 << (8 * _DECISION_BYTES)
+_UINT32_TYPECODE = next(code for code in "IL" if array.array(code).itemsize == _DECISION_BYTES)
+
+# batches shorter than this use per-character RNG draws instead of a random block
+BLOCK_MIN_CHARS = 64
+# batches shorter than this are cheaper in pure Python than with NumPy's call overhead
+NUMPY_MIN_CHARS = 256
+# refill size of the os.urandom pool
+RANDOM_POOL_SIZE = 64 * 1024
+
+
+@functools.lru_cache(maxsize=16)
+def _translation_table(alphabet: str) -> Tuple[Optional[bytes], bytes, int]:
+    """byte -> replacement character table; bytes above the last full multiple of the alphabet are deleted."""
+    usable = 256 - 256 % len(alphabet)
+    table = bytes(ord(alphabet[b % len(alphabet)]) if b < usable else 0 for b in range(256)) \
+        if alphabet.isascii() else None
+    return table, bytes(range(usable, 256)), usable
+
+
+@functools.lru_cache(maxsize=1024)
+def _cached_keep_threshold(score) -> Optional[int]:
+    return _keep_threshold(score)
+
+
+def _keep_threshold(score) -> Optional[int]:
+    """Map a score to the 32 bit keep threshold, ``None`` meaning "leave the value untouched"."""
+    try:
+        score = float(score)
+    except (ValueError, TypeError):
+        # If score is not a valid float or None, the value is not corrupted
+        return None
+    if not (0.0 <= score <= 1.0):  # Ensure score is a valid probability
+        return None  # Default to no corruption if score is invalid
+    threshold = round(score * _DECISION_RANGE)
+    return None if threshold >= _DECISION_RANGE else threshold
+
+
+class CorruptionEngine:
+    """
+    Corrupts many strings in one pass from a single block of random bytes.
+
+    Args:
+        rng: Source of random bytes, anything with a ``randbytes(n)`` method such
+            as a seeded ``random.Random``. Defaults to ``os.urandom``.
+        alphabet: Characters used as replacements, at most 256.
+        use_numpy: Enable (``True``) or disable (``False``) the NumPy path for
+            large batches; by default it is used when NumPy is installed.
+    """
+
+    def __init__(self, rng: Optional[random.Random] = None, alphabet: str = PRINTABLE_CHARS,
+                 use_numpy: Optional[bool] = None):
+        if not 0 < len(alphabet) <= 256:
+            raise ValueError("alphabet must contain between 1 and 256 characters")
+        if use_numpy and numpy is None:
+            raise ValueError("NumPy is not installed")
+        self.rng = rng
+        self.alphabet = alphabet
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        self._table, self._rejected, self._usable = _translation_table(alphabet)
+        self._pool = b""
+        self._pool_pos = 0
+        self._pool_lock = threading.Lock()
+
+    def with_rng(self, rng: random.Random) -> "CorruptionEngine":
+        """A copy of this engine drawing from ``rng``."""
+        return CorruptionEngine(rng, self.alphabet, self.use_numpy)
+
+    def random_bytes(self, n: int) -> bytes:
+        if self.rng is not None:
+            return self.rng.randbytes(n)
+        if n > RANDOM_POOL_SIZE // 4:
+            return os.urandom(n)
+        with self._pool_lock:
+            if self._pool_pos + n > len(self._pool):
+                self._pool = os.urandom(RANDOM_POOL_SIZE)
+                self._pool_pos = 0
+            start = self._pool_pos
+            self._pool_pos += n
+            return self._pool[start:start + n]
+
+    def corrupt(self, value: str, score) -> str:
+        """Corrupt a single value, see ``corrupt_many``."""
+        return self.corrupt_many(((value, score),))[0]
+
+    def corrupt_many(self, items: Iterable[Tuple[str, object]]) -> List[str]:
+        """
+        Corrupt ``(value, score)`` pairs, keeping each character with probability ``score``.
+
+        Empty values become ``""``; values with a score that is no float or lies
+        outside ``[0, 1]`` are returned unchanged.
+        """
+        items = list(items)
+        results = ["" if not value else value for value, _ in items]
+        # only strings that can actually change take part in the batch
+        batch = []
+        for index, (value, score) in enumerate(items):
+            if value:
+                try:
+                    threshold = _cached_keep_threshold(score)
+                except TypeError:  # unhashable score
+                    threshold = _keep_threshold(score)
+                if threshold is not None:
+                    batch.append((index, value, threshold))
+        if not batch:
+            return results
+
+        total = sum(len(value) for _, value, _ in batch)
+        if total < BLOCK_MIN_CHARS:
+            corrupted = self._apply_per_character(batch)
+            for (index, _, _), value in zip(batch, corrupted):
+                results[index] = value
+            return results
+
+        # one block for the keep decisions and (usually all of) the replacement characters
+        decision_size = total * _DECISION_BYTES
+        block = self.random_bytes(decision_size + self._replacement_draw_size(total))
+        decisions = block[:decision_size]
+        replacements = self._replacements(total, block[decision_size:])
+        if self.use_numpy and total >= NUMPY_MIN_CHARS:
+            corrupted = self._apply_numpy(batch, decisions, replacements)
+        else:
+            corrupted = self._apply_python(batch, decisions, replacements)
+        for (index, _, _), value in zip(batch, corrupted):
+            results[index] = value
+        return results
+
+    def _replacement_draw_size(self, count: int) -> int:
+        # expected acceptance rate is usable / 256, draw a little more than needed
+        return count * 256 // self._usable + 8
+
+    def _replacements(self, count: int, raw: bytes) -> str:
+        """Map ``raw`` to ``count`` unbiased replacement characters, drawing more bytes if it falls short."""
+        chunks = []
+        missing = count
+        while missing > 0:
+            if raw is None:
+                raw = self.random_bytes(self._replacement_draw_size(missing))
+            if self._table is not None:
+                accepted = raw.translate(self._table, self._rejected).decode("ascii")
+            else:
+                alphabet = self.alphabet
+                accepted = "".join(alphabet[b % len(alphabet)] for b in raw if b < self._usable)
+            chunks.append(accepted[:missing])
+            missing -= len(chunks[-1])
+            raw = None
+        return "".join(chunks)
+
+    def _apply_per_character(self, batch: Sequence[Tuple[int, str, int]]) -> List[str]:
+        rng = self.rng if self.rng is not None else random
+        draw, choice, alphabet = rng.random, rng.choice, self.alphabet
+        results = []
+        for _, value, threshold in batch:
+            score = threshold / _DECISION_RANGE
+            results.append("".join([char if draw() < score else choice(alphabet) for char in value]))
+        return results
+
+    @staticmethod
+    def _apply_python(batch: Sequence[Tuple[int, str, int]], decisions: bytes, replacements: str) -> List[str]:
+        words = array.array(_UINT32_TYPECODE, decisions)
+        if sys.byteorder == "big":
+            words.byteswap()  # the random block is interpreted little endian everywhere
+        results = []
+        offset = 0
+        for _, value, threshold in batch:
+            end = offset + len(value)
+            results.append("".join([char if word < threshold else replacement for char, word, replacement
+                                    in zip(value, words[offset:end], replacements[offset:end])]))
+            offset = end
+        return results
+
+    @staticmethod
+    def _apply_numpy(batch: Sequence[Tuple[int, str, int]], decisions: bytes, replacements: str) -> List[str]:
+        lengths = [len(value) for _, value, _ in batch]
+        words = numpy.frombuffer(decisions, dtype="<u4")
+        thresholds = numpy.repeat(numpy.array([threshold for _, _, threshold in batch], dtype=numpy.uint64), lengths)
+        codepoints = numpy.frombuffer("".join(value for _, value, _ in batch).encode("utf-32-le"), dtype="<u4")
+        replacement_codepoints = numpy.frombuffer(replacements.encode("utf-32-le"), dtype="<u4")
+        joined = numpy.where(words < thresholds, codepoints, replacement_codepoints).astype("<u4").tobytes().decode("utf-32-le")
+
+        results = []
+        offset = 0
+        for length in lengths:
+            results.append(joined[offset:offset + length])
+            offset += length
+        return results
+
+
+default_engine = CorruptionEngine()
@@ -0,0 +1,236 @@
+# coding: utf-8
+
+"""
+Simulated latency for the mock implementation.
+
+A latency profile is written as ``name`` or ``name:param=value,...``; a
+parameter without a name fills the profile's first parameter, so
+``fixed:200`` equals ``fixed:ms=200``. All times are in milliseconds.
+
+=============  ======================  ==========================================
+profile        parameters              delay
+=============  ======================  ==========================================
+``none``                               no delay
+``fixed``      ``ms``                  always ``ms``
+``normal``     ``mean``, ``stddev``    normally distributed, never negative
+``lognormal``  ``median``, ``sigma``   log-normally distributed (long right tail)
+``size``       ``ms_per_mb``, ``base`` ``base`` plus ``ms_per_mb`` per MiB of body
+``spike``      ``base``, ``p99``,      ``base``, except for a fraction ``rate`` of
+               ``rate``                requests placed so that the p99 is ``p99``
+=============  ======================  ==========================================
+
+Parameters are finite and not negative, ``median`` is above 0 and ``rate``
+at most 1; other values raise ``ValueError``, so a bad header is answered
+with 400 instead of failing or sleeping forever during the request.
+
+The profile of a request is the ``X-Latency-Profile`` header if given, else
+the profile configured for the longest matching UUID suffix in
+``settings.latency_suffix_profiles`` (``suffix=profile;suffix=profile``), else
+``settings.latency_profile``. Delays are ``asyncio.sleep`` calls, so waiting
+requests cost no thread. ``settings.latency_slots`` emulates a backend that
+handles only that many requests at a time; further requests queue for a slot.
+"""
+
+import asyncio
+import contextlib
+import dataclasses
+import functools
+import math
+import random
+from typing import AsyncIterator, ClassVar, Dict, Optional, Tuple
+
+from openapi_server import request_context
+from openapi_server.settings import settings
+
+_MIB = 1024 * 1024
+
+
+@dataclasses.dataclass(frozen=True)
+class LatencyProfile:
+    """No delay; base class of the profiles."""
+
+    # parameters that must be above 0, and shares that must be at most 1
+    positive: ClassVar[Tuple[str, ...]] = ()
+    fractions: ClassVar[Tuple[str, ...]] = ()
+
+    def __post_init__(self):
+        for field in dataclasses.fields(self):
+            value = getattr(self, field.name)
+            if not math.isfinite(value):
+                raise ValueError(f"Parameter '{field.name}' must be finite, got {value}")
+            if field.name in self.positive and value <= 0:
+                raise ValueError(f"Parameter '{field.name}' must be above 0, got {value:g}")
+            if value < 0:
+                raise ValueError(f"Parameter '{field.name}' must not be negative, got {value:g}")
+            if field.name in self.fractions and value > 1:
+                raise ValueError(f"Parameter '{field.name}' must be from 0 to 1, got {value:g}")
+
+    def delay_ms(self, body_size: int, rng: random.Random) -> float:
+        return 0.0
+
+
+@dataclasses.dataclass(frozen=True)
+class FixedLatency(LatencyProfile):
+    ms: float = 0.0
+
+    def delay_ms(self, body_size: int, rng: random.Random) -> float:
+        return self.ms
+
+
+@dataclasses.dataclass(frozen=True)
+class NormalLatency(LatencyProfile):
+    mean: float = 100.0
+    stddev: float = 20.0
+
+    def delay_ms(self, body_size: int, rng: random.Random) -> float:
+        return max(0.0, rng.gauss(self.mean, self.stddev))
+
+
+@dataclasses.dataclass(frozen=True)
+class LogNormalLatency(LatencyProfile):
+    median: float = 100.0
+    sigma: float = 0.5
+
+    positive = ("median",)
+
+    def delay_ms(self, body_size: int, rng: random.Random) -> float:
+        return rng.lognormvariate(math.log(self.median), self.sigma)
+
+
+@dataclasses.dataclass(frozen=True)
+class SizeLatency(LatencyProfile):
+    ms_per_mb: float = 10.0
+    base: float = 0.0
+
+    def delay_ms(self, body_size: int, rng: random.Random) -> float:
+        return self.base + self.ms_per_mb * body_size / _MIB
+
+
+@dataclasses.dataclass(frozen=True)
+class SpikeLatency(LatencyProfile):
+    base: float = 10.0
+    p99: float = 1000.0
+    # share of requests that spike; above 1% the p99 falls inside the spikes
+    rate: float = 0.02
+
+    fractions = ("rate",)
+
+    def delay_ms(self, body_size: int, rng: random.Random) -> float:
+        if rng.random() >= self.rate:
+            return self.base
+        # spikes are uniform in [p99 / 2, high], with high chosen so that the
+        # 99th percentile of all requests lands on p99
+        low = self.p99 / 2
+        quantile = 1 - 0.01 / self.rate if self.rate > 0.01 else 0.0
+        high = low + (self.p99 - low) / quantile if quantile > 0 else self.p99
+        return rng.uniform(low, high)
+
+
+PROFILES: Dict[str, type] = {
+    "none": LatencyProfile,
+    "fixed": FixedLatency,
+    "normal": NormalLatency,
+    "lognormal": LogNormalLatency,
+    "size": SizeLatency,
+    "spike": SpikeLatency,
+}
+
+
+@functools.lru_cache(maxsize=256)
+def parse_profile(spec: str) -> LatencyProfile:
+    """Parse ``name:param=value,...``, raising ``ValueError`` on unknown profiles or parameters, or bad values."""
+    name, _, params = spec.strip().partition(":")
+    try:
+        profile_cls = PROFILES[name.strip().lower()]
+    except KeyError:
+        raise ValueError(f"Unknown latency profile '{name}', expected one of {tuple(PROFILES)}")
+    fields = [field.name for field in dataclasses.fields(profile_cls)]
+    values = {}
+    for position, param in enumerate(part for part in params.split(",") if part.strip()):
+        key, sep, value = param.partition("=")
+        if not sep:
+            if position >= len(fields):
+                raise ValueError(f"Too many parameters for latency profile '{name}'")
+            key, value = fields[position], key
+        key = key.strip()
+        if key not in fields:
+            raise ValueError(f"Unknown parameter '{key}' of latency profile '{name}', expected one of {fields}")
+        try:
+            values[key] = float(value)
+        except ValueError:
+            raise ValueError(f"Parameter '{key}' of latency profile '{name}' must be a number, got '{value.strip()}'")
+    try:
+        return profile_cls(**values)
+    except ValueError as e:
+        raise ValueError(f"Latency profile '{name}': {e}")
+
+
+@functools.lru_cache(maxsize=16)
+def parse_suffix_profiles(spec: str) -> Tuple[Tuple[str, LatencyProfile], ...]:
+    """Parse ``suffix=profile;suffix=profile`` into pairs, the longest suffix first."""
+    pairs = []
+    for entry in spec.split(";"):
+        if not entry.strip():
+            continue
+        suffix, sep, profile = entry.partition("=")
+        if not sep:
+            raise ValueError(f"Latency suffix entry '{entry}' must be 'suffix=profile'")
+        pairs.append((suffix.strip().lower(), parse_profile(profile)))
+    return tuple(sorted(pairs, key=lambda pair: -len(pair[0])))
+
+
+def resolve_profile(uuid: str) -> Optional[LatencyProfile]:
+    """Return the latency profile of the current request for ``uuid``, None if it has none."""
+    spec = request_context.current().latency_profile
+    if spec is not None:
+        return parse_profile(spec)
+    if settings.latency_suffix_profiles:
+        lowered = uuid.lower()
+        for suffix, profile in parse_suffix_profiles(settings.latency_suffix_profiles):
+            if lowered.endswith(suffix):
+                return profile
+    if settings.latency_profile:
+        return parse_profile(settings.latency_profile)
+    return None
+
+
+class LatencySimulator:
+    """Applies the resolved latency profile and the backend slot limit to a classification."""
+
+    def __init__(self, rng: Optional[random.Random] = None):
+        self.rng = rng or random.Random()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_key: Optional[tuple] = None
+
+    def _semaphore(self) -> Optional[asyncio.Semaphore]:
+        limit = settings.latency_slots
+        if limit <= 0:
+            return None
+        # one semaphore per event loop and limit, so a changed setting takes effect
+        key = (asyncio.get_running_loop(), limit)
+        if self._slots_key != key:
+            self._slots, self._slots_key = asyncio.Semaphore(limit), key
+        return self._slots
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one of the ``settings.latency_slots`` backend slots, if limited."""
+        semaphore = self._semaphore()
+        if semaphore is None:
+            yield
+            return
+        async with semaphore:
+            yield
+
+    async def delay(self, uuid: str, body_size: int) -> float:
+        """Sleep for the delay of the request's profile, returning the delay in seconds."""
+        profile = resolve_profile(uuid)
+        if profile is None:
+            return 0.0
+        seconds = profile.delay_ms(body_size, self.rng) / 1000
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+        return seconds
+
+
+default_simulator = LatencySimulator()
@@ -0,0 +1,339 @@
+# openapi_server/implementation/mock_table.py
+
+"""
+The mock's response table: which canned response a request UUID gets.
+
+The table is a file of rules, each a match kind, a pattern and the response
+fields (``kind``, ``doc_id_val``, ``doc_id_score``, ...):
+
+* ``exact``  the whole UUID
+* ``suffix`` the end of the UUID, of any length
+* ``prefix`` the start of the UUID, of any length
+* ``regex``  a regular expression matching the whole UUID
+
+The UUID is matched in its canonical lowercase form. An exact rule wins over
+suffix rules, the longest matching suffix over shorter ones and over prefix
+rules, the longest prefix over regex rules, and among regex rules the first
+in the file wins. UUIDs no rule matches get the default response.
+
+Tables are CSV, JSON or SQLite files, told apart by their extension:
+
+* ``.csv`` with a header row; the pattern is in the ``pattern`` or the
+  ``UUID Ending`` column and the kind in an optional ``match`` column,
+  ``suffix`` if missing or empty
+* ``.json`` with a list of such rows as objects, or an object mapping
+  suffixes to response fields
+* ``.sqlite``, ``.sqlite3`` or ``.db`` with the rows in a ``mock_responses`` table
+
+``ResponseTable`` compiles the rules into an index: dicts for exact UUIDs and
+for the suffixes and prefixes of each length in use, and one combined
+expression for the regex rules, so a lookup costs a handful of dict probes
+however many rules there are. Regex rules that cannot share one expression
+(duplicate group names, numbered back references) are tried one by one. ``TableWatcher`` loads the table configured in
+``settings.mock_table_path`` and polls the file every
+``settings.mock_table_reload_interval`` seconds in a background thread; a
+changed file is loaded and compiled aside and swapped in as a whole, so a
+request sees either the old or the new table. A file that fails to load
+leaves the current table in place.
+"""
+
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from openapi_server import metrics
+from openapi_server.settings import settings
+
+logger = logging.getLogger(__name__)
+
+EXACT, SUFFIX, PREFIX, REGEX = "exact", "suffix", "prefix", "regex"
+MATCH_KINDS = (EXACT, SUFFIX, PREFIX, REGEX)
+
+# the table shipped with the package, also read by the scanner mock
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_responses.csv")
+# table of the rows in a SQLite table file
+SQLITE_TABLE = "mock_responses"
+
+_PATTERN_COLUMNS = ("pattern", "UUID Ending")
+# numbered back references and conditionals, which would point at another group in an alternation of the
+# rules; escaped backslashes are matched first, so a literal backslash before a digit is not taken for one
+_NUMBERED_REFERENCE = re.compile(r"\\\\|\\[1-9]|\(\?\([0-9]")
+
+table_reloads_total = metrics.registry.counter(
+    "pdfclassifier_mock_table_reloads_total", "Loads of the mock response table by outcome.", ["outcome"])
+table_rules = metrics.registry.gauge(
+    "pdfclassifier_mock_table_rules", "Rules in the active mock response table.")
+
+
+class Rule(NamedTuple):
+    match: str
+    pattern: str
+    data: Dict[str, Any]
+
+    @property
+    def key(self) -> str:
+        return f"{self.match}:{self.pattern}"
+
+
+class Entry(NamedTuple):
+    """A compiled rule: its ``key`` identifies it within a table, ``value`` is the compiled response."""
+    key: str
+    value: Any
+
+
+def _rule(row: Dict[str, Any]) -> Rule:
+    row = dict(row)
+    match = (row.pop("match", None) or SUFFIX).strip().lower()
+    pattern = None
+    for column in _PATTERN_COLUMNS:
+        value = row.pop(column, None)
+        if pattern is None and value not in (None, ""):
+            pattern = str(value).strip()
+    if match not in MATCH_KINDS:
+        raise ValueError(f"Unknown match kind '{match}', expected one of {MATCH_KINDS}")
+    if not pattern:
+        raise ValueError(f"{match} rule without a pattern: {row}")
+    if match == EXACT:
+        pattern = str(uuid.UUID(pattern))
+    elif match == REGEX:
+        re.compile(pattern)
+    else:
+        pattern = pattern.lower()
+    data = {name: float(value) if name.endswith("_score") and value not in (None, "") else value
+            for name, value in row.items()}
+    return Rule(match, pattern, data)
+
+
+def _rows(path: str) -> Iterable[Dict[str, Any]]:
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+    if extension == ".json":
+        with open(path, encoding="utf-8") as f:
+            document = json.load(f)
+        if isinstance(document, dict):
+            return [{"pattern": suffix, **fields} for suffix, fields in document.items()]
+        return document
+    if extension in (".sqlite", ".sqlite3", ".db"):
+        # read-only, so a missing file is an error instead of a new empty database
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            connection.row_factory = sqlite3.Row
+            return [dict(row) for row in connection.execute(f"SELECT * FROM {SQLITE_TABLE}")]
+        finally:
+            connection.close()
+    raise ValueError(f"Unknown mock table format '{extension}', expected .csv, .json, .sqlite, .sqlite3 or .db")
+
+
+def load_rules(path: str) -> List[Rule]:
+    """Read the rules of the table file at ``path`` in file order.
+
+    Raises:
+        ValueError: on an unknown format, match kind or invalid pattern, or a
+            pattern given twice for the same match kind.
+        OSError, sqlite3.Error: if the file cannot be read.
+    """
+    rules, keys = [], set()
+    for number, row in enumerate(_rows(path), 1):
+        try:
+            rule = _rule(row)
+        except (ValueError, re.error) as e:
+            raise ValueError(f"{path}, rule {number}: {e}") from e
+        if rule.key in keys:
+            raise ValueError(f"{path}, rule {number}: duplicate {rule.match} rule '{rule.pattern}'")
+        keys.add(rule.key)
+        rules.append(rule)
+    return rules
+
+
+def _by_length(entries: Iterable[Tuple[str, Entry]]) -> List[Tuple[int, Dict[str, Entry]]]:
+    """Group patterns by length, longest first."""
+    groups: Dict[int, Dict[str, Entry]] = {}
+    for pattern, entry in entries:
+        groups.setdefault(len(pattern), {})[pattern] = entry
+    return sorted(groups.items(), reverse=True)
+
+
+def _compiled(compile: Callable[[Dict[str, Any]], Any], rule: Rule) -> Any:
+    try:
+        return compile(rule.data)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"{rule.match} rule '{rule.pattern}' is no valid response: {e!r}") from e
+
+
+class ResponseTable:
+    """Immutable index of the rules, ``compile`` turns each rule's fields into its ``Entry.value``."""
+
+    def __init__(self, rules: List[Rule], compile: Callable[[Dict[str, Any]], Any] = dict, version: str = ""):
+        # identifies the table's content, e.g. for cache keys
+        self.version = version
+        self.rules = tuple(rules)
+        entries = [(rule, Entry(rule.key, _compiled(compile, rule))) for rule in rules]
+        self._exact = {rule.pattern: entry for rule, entry in entries if rule.match == EXACT}
+        self._suffixes = _by_length((rule.pattern, entry) for rule, entry in entries if rule.match == SUFFIX)
+        self._prefixes = _by_length((rule.pattern, entry) for rule, entry in entries if rule.match == PREFIX)
+        regex_rules = [(re.compile(rule.pattern), entry) for rule, entry in entries if rule.match == REGEX]
+        self._regex, self._regex_groups = self._combine(regex_rules)
+        self._regex_rules = regex_rules
+
+    @staticmethod
+    def _combine(regex_rules):
+        """One alternation of all regex rules and the entry of each rule's outer group, None if they do not combine."""
+        if not regex_rules:
+            return None, {}
+        if any(reference.group() != "\\\\"
+               for compiled, _ in regex_rules for reference in _NUMBERED_REFERENCE.finditer(compiled.pattern)):
+            return None, {}
+        groups, parts, group = {}, [], 1
+        for compiled, entry in regex_rules:
+            groups[group] = entry
+            parts.append(f"({compiled.pattern})")
+            group += compiled.groups + 1
+        try:
+            return re.compile("|".join(parts)), groups
+        except re.error:
+            # e.g. the same group name in two rules
+            return None, {}
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def match(self, uuid_str: str) -> Optional[Entry]:
+        """The entry of the rule with the highest precedence matching the canonical ``uuid_str``, None for none."""
+        entry = self._exact.get(uuid_str)
+        if entry is not None:
+            return entry
+        for length, patterns in self._suffixes:
+            entry = patterns.get(uuid_str[-length:])
+            if entry is not None:
+                return entry
+        for length, patterns in self._prefixes:
+            entry = patterns.get(uuid_str[:length])
+            if entry is not None:
+                return entry
+        if self._regex is not None:
+            found = self._regex.fullmatch(uuid_str)
+            # the outer group of the matching alternative closes last
+            return None if found is None else self._regex_groups[found.lastindex]
+        for compiled, entry in self._regex_rules:
+            if compiled.fullmatch(uuid_str):
+                return entry
+        return None
+
+
+def _digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def load_table(path: str, compile: Callable[[Dict[str, Any]], Any] = dict) -> ResponseTable:
+    """Load and compile the table file at ``path``, raising like ``load_rules``."""
+    version = _digest(path)
+    return ResponseTable(load_rules(path), compile, version)
+
+
+def _stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class TableWatcher:
+    """The table of the configured file, reloaded in a background thread when the file changes."""
+
+    def __init__(self, compile: Callable[[Dict[str, Any]], Any] = dict):
+        self.compile = compile
+        self._table: Optional[ResponseTable] = None
+        self._path: Optional[str] = None
+        self._stamp: Optional[Tuple[int, int, int]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    @staticmethod
+    def path() -> str:
+        return settings.mock_table_path or DEFAULT_TABLE_PATH
+
+    def table(self) -> ResponseTable:
+        """The current table, loaded on first use or when ``settings.mock_table_path`` changed."""
+        table = self.load()
+        if self._pid != os.getpid():
+            # first use in this process: also in pool workers forked after the watcher started
+            self._watch()
+        return table
+
+    def load(self) -> ResponseTable:
+        """Like ``table`` but without watching the file, e.g. in a process about to fork workers."""
+        table = self._table
+        if table is None or self._path != self.path():
+            with self._lock:
+                if self._table is None or self._path != self.path():
+                    self._load(self.path())
+                table = self._table
+        return table
+
+    def reload(self) -> bool:
+        """Load the file again if it changed since the last load; True if a new table was swapped in."""
+        path = self.path()
+        stamp = _stamp(path)
+        if stamp == self._stamp and path == self._path:
+            return False
+        with self._lock:
+            try:
+                self._load(path)
+            except (OSError, ValueError, sqlite3.Error) as e:
+                # a broken file is reported once, the next change is tried again
+                self._stamp = stamp
+                table_reloads_total.labels("failed").inc()
+                logger.error("Keeping the current mock table, %s failed to load: %s", path, e)
+                return False
+        logger.info("Reloaded the mock table from %s with %d rules", path, len(self._table))
+        return True
+
+    def _load(self, path: str):
+        stamp = _stamp(path)
+        table = load_table(path, self.compile)
+        if _stamp(path) != stamp:
+            # written to while we read it, the next poll loads the finished file
+            raise ValueError(f"{path} changed while loading")
+        self._table, self._path, self._stamp = table, path, stamp
+        table_reloads_total.labels("ok").inc()
+        table_rules.set(len(table))
+
+    def _watch(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop = threading.Event()
+            interval = settings.mock_table_reload_interval
+            if interval > 0:
+                self._thread = threading.Thread(target=self._run, args=(self._stop, interval),
+                                                name="mock-table-watcher", daemon=True)
+                self._thread.start()
+
+    def _run(self, stop: threading.Event, interval: float):
+        while not stop.wait(interval):
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Watching the mock table failed")
+
+    def stop(self):
+        """Stop watching; the next ``table`` call starts again."""
+        with self._lock:
+            self._stop.set()
+            thread, self._thread, self._pid = self._thread, None, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
@@ -0,0 +1,552 @@
+# coding: utf-8
+
+"""
+Structural validation of PDF bodies, reading only what the structure points to.
+
+``inspect_pdf`` starts where a PDF reader starts, at the end: the ``%%EOF``
+marker and the ``startxref`` offset are searched in the last
+``TAIL_SIZE`` bytes. From there it parses the cross-reference table or
+stream (following ``/Prev`` through incremental updates), the trailer, the
+document catalog and the page tree root, and reports the page count and
+whether the document is encrypted. Only those windows of the body are read,
+never the whole of it, so the cost does not grow with the size of the
+upload; the body can be anything sliceable (``bytes``, ``mmap``,
+``memoryview``).
+
+Each call runs within a ``Budget`` of wall and CPU time, checked inside the
+loops that decode streams, and decompressed streams, nesting and predictor
+rows are bounded in size. Malformed documents raise ``PdfStructureError``,
+whatever part of the parser they trip; running out of budget raises its
+subclass ``PdfBudgetExceeded``. Encrypted documents are reported, not rejected: their
+strings and streams are encrypted, so a page tree inside an object stream
+leaves the page count unknown.
+"""
+
+import dataclasses
+import re
+import time
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+# %%EOF has to be within the last 1024 bytes (PDF 32000-1, 7.5.5); a little slack for trailing garbage
+TAIL_SIZE = 2048
+# first window read for an object, grown up to MAX_OBJECT_SIZE for larger ones
+OBJECT_WINDOW = 4096
+MAX_OBJECT_SIZE = 1024 * 1024
+# upper bound of a decompressed xref or object stream
+MAX_DECODED_SIZE = 4 * 1024 * 1024
+# upper bound of the /Columns of a PNG predictor, xref stream rows are a few bytes
+MAX_COLUMNS = 4096
+# arrays and dictionaries nested deeper than this are rejected instead of recursed into
+MAX_NESTING = 64
+# cross-reference sections followed through /Prev
+MAX_SECTIONS = 64
+
+_WHITESPACE = b"\x00\t\n\x0c\r "
+_DELIMITERS = b"()<>[]{}/%"
+_NUMBER = re.compile(rb"[+-]?(\d+\.?\d*|\.\d+)")
+_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+_XREF_SUBSECTION = re.compile(rb"(\d+)\s+(\d+)[ \t]*(\r\n|\r|\n)")
+_REFERENCE = re.compile(rb"\s+(\d+)\s+R(?=[\s/<>\[\]()%])")
+# a number this close to the end of a window might be the start of a cut-off "n g R"
+_REFERENCE_LOOKAHEAD = 24
+
+
+class PdfStructureError(ValueError):
+    """The body is not a structurally valid PDF."""
+
+
+class PdfBudgetExceeded(PdfStructureError):
+    """Validating the body took more time or memory than allowed."""
+
+
+class Ref(NamedTuple):
+    number: int
+    generation: int
+
+
+class Name(str):
+    """A PDF name such as ``/Type``, without the slash."""
+
+
+@dataclasses.dataclass(frozen=True)
+class PdfStructure:
+    version: str
+    # "table" or "stream"
+    xref: str
+    # /Size of the trailer: object numbers in use plus one
+    objects: int
+    # None if it cannot be read, e.g. from an object stream of an encrypted document
+    page_count: Optional[int]
+    encrypted: bool
+    # sections appended to the original document
+    incremental_updates: int
+
+
+class Budget:
+    """Wall and CPU time allowed for validating one document."""
+
+    def __init__(self, ms: float):
+        self.ms = ms
+        self._deadline = time.perf_counter() + ms / 1000
+        self._cpu_deadline = time.thread_time() + ms / 1000
+
+    def check(self):
+        if time.perf_counter() > self._deadline or time.thread_time() > self._cpu_deadline:
+            raise PdfBudgetExceeded(f"Validation exceeded its budget of {self.ms:g} ms")
+
+
+class _Truncated(Exception):
+    """The object continues past the end of the window it is parsed from."""
+
+
+def _skip_whitespace(data: bytes, pos: int) -> int:
+    while pos < len(data):
+        if data[pos] in _WHITESPACE:
+            pos += 1
+        elif data[pos] == 0x25:  # % comment up to the end of the line
+            while pos < len(data) and data[pos] not in b"\r\n":
+                pos += 1
+        else:
+            return pos
+    raise _Truncated()
+
+
+def _token_end(data: bytes, pos: int) -> int:
+    while pos < len(data) and data[pos] not in _WHITESPACE and data[pos] not in _DELIMITERS:
+        pos += 1
+    if pos == len(data):
+        raise _Truncated()
+    return pos
+
+
+def parse_object(data: bytes, pos: int, depth: int = 0) -> Tuple[Any, int]:
+    """Parse the object at ``pos``, returning it and the position after it."""
+    if depth > MAX_NESTING:
+        raise PdfStructureError(f"Objects nested deeper than {MAX_NESTING} levels at offset {pos}")
+    pos = _skip_whitespace(data, pos)
+    head = data[pos:pos + 2]
+    if head == b"<<":
+        result: Dict[str, Any] = {}
+        pos += 2
+        while True:
+            pos = _skip_whitespace(data, pos)
+            if data[pos:pos + 2] == b">>":
+                return result, pos + 2
+            key, pos = parse_object(data, pos, depth + 1)
+            if not isinstance(key, Name):
+                raise PdfStructureError(f"Dictionary key is not a name at offset {pos}")
+            result[key], pos = parse_object(data, pos, depth + 1)
+    if head[:1] == b"[":
+        items = []
+        pos += 1
+        while True:
+            pos = _skip_whitespace(data, pos)
+            if data[pos:pos + 1] == b"]":
+                return items, pos + 1
+            item, pos = parse_object(data, pos, depth + 1)
+            items.append(item)
+    if head[:1] == b"/":
+        end = _token_end(data, pos + 1)
+        return Name(data[pos + 1:end].decode("latin-1")), end
+    if head[:1] == b"(":
+        return _parse_literal_string(data, pos)
+    if head[:1] == b"<":
+        end = data.find(b">", pos)
+        if end < 0:
+            raise _Truncated()
+        digits = re.sub(rb"\s", b"", data[pos + 1:end]).decode("latin-1")
+        try:
+            return bytes.fromhex(digits + "0" * (len(digits) % 2)), end + 1
+        except ValueError:
+            raise PdfStructureError(f"Malformed hex string at offset {pos}")
+    number = _NUMBER.match(data, pos)
+    if number:
+        end = number.end()
+        if len(data) - end < _REFERENCE_LOOKAHEAD:
+            raise _Truncated()
+        if b"." in number.group():
+            return float(number.group()), end
+        value = int(number.group())
+        # "n g R" is a reference
+        reference = _REFERENCE.match(data, end)
+        if reference:
+            return Ref(value, int(reference.group(1))), reference.end()
+        return value, end
+    end = _token_end(data, pos)
+    keyword = data[pos:end]
+    if not keyword:
+        raise PdfStructureError(f"Unexpected {data[pos:pos + 1]!r} at offset {pos}")
+    return {b"true": True, b"false": False, b"null": None}.get(keyword, keyword), end
+
+
+def _parse_literal_string(data: bytes, pos: int) -> Tuple[bytes, int]:
+    depth = 0
+    start = pos
+    while pos < len(data):
+        byte = data[pos]
+        if byte == 0x5C:  # backslash escapes the next byte
+            pos += 2
+            continue
+        if byte == 0x28:
+            depth += 1
+        elif byte == 0x29:
+            depth -= 1
+            if depth == 0:
+                return data[start + 1:pos], pos + 1
+        pos += 1
+    raise _Truncated()
+
+
+class _XrefTable:
+    kind = "table"
+
+    def __init__(self, reader: "_Reader", subsections: List[Tuple[int, int, int]]):
+        self.reader = reader
+        # (first object number, count, offset of the first 20-byte entry)
+        self.subsections = subsections
+
+    def entry(self, number: int) -> Optional[Tuple[int, int, int]]:
+        for first, count, offset in self.subsections:
+            if first <= number < first + count:
+                line = self.reader.read(offset + (number - first) * 20, 20).split()
+                if len(line) < 3 or line[2] not in (b"n", b"f") or not (line[0].isdigit() and line[1].isdigit()):
+                    raise PdfStructureError(f"Malformed xref entry for object {number}")
+                return (1 if line[2] == b"n" else 0), int(line[0]), int(line[1])
+        return None
+
+
+class _XrefStream:
+    kind = "stream"
+
+    def __init__(self, data: bytes, widths: List[int], index: List[int]):
+        self.data = data
+        self.widths = widths
+        self.row_size = sum(widths)
+        # (first object number, count, row of the first entry)
+        self.subsections = []
+        row = 0
+        for first, count in zip(index[::2], index[1::2]):
+            self.subsections.append((first, count, row))
+            row += count
+        if row * self.row_size > len(data):
+            raise PdfStructureError("Xref stream is shorter than its /Index")
+
+    def entry(self, number: int) -> Optional[Tuple[int, int, int]]:
+        for first, count, row in self.subsections:
+            if first <= number < first + count:
+                pos = (row + number - first) * self.row_size
+                fields = []
+                for width in self.widths:
+                    fields.append(int.from_bytes(self.data[pos:pos + width], "big"))
+                    pos += width
+                if self.widths[0] == 0:
+                    fields[0] = 1
+                return fields[0], fields[1], fields[2]
+        return None
+
+
+def _png_unpredict(data: bytes, columns: int, budget: Budget) -> bytes:
+    """Undo the PNG predictors (one filter byte per row) of an xref or object stream."""
+    rows = []
+    previous = bytearray(columns)
+    for pos in range(0, len(data) - columns, columns + 1):
+        budget.check()
+        kind = data[pos]
+        row = bytearray(data[pos + 1:pos + 1 + columns])
+        for i in range(columns):
+            left = row[i - 1] if i else 0
+            up = previous[i]
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif kind == 3:
+                row[i] = (row[i] + ((left + up) >> 1)) & 0xFF
+            elif kind == 4:
+                upper_left = previous[i - 1] if i else 0
+                estimate = left + up - upper_left
+                distances = (abs(estimate - left), abs(estimate - up), abs(estimate - upper_left))
+                row[i] = (row[i] + (left, up, upper_left)[distances.index(min(distances))]) & 0xFF
+        rows.append(bytes(row))
+        previous = row
+    return b"".join(rows)
+
+
+class _Encrypted(Exception):
+    """The object is in an encrypted object stream."""
+
+
+class _Reader:
+
+    def __init__(self, body, budget: Budget):
+        self.body = body
+        self.size = len(body)
+        self.budget = budget
+        self.sections: List[Any] = []
+        self.trailer: Dict[str, Any] = {}
+        self._object_streams: Dict[int, Tuple[bytes, List[int]]] = {}
+
+    def read(self, offset: int, size: int) -> bytes:
+        return bytes(self.body[offset:offset + size])
+
+    def read_window(self, offset: int, size: int) -> bytes:
+        """``read``, padded when it reaches the end of the body so a number there is not taken for truncated."""
+        data = self.read(offset, size)
+        if offset + size >= self.size:
+            data += b" " * _REFERENCE_LOOKAHEAD
+        return data
+
+    def parse_at(self, offset: int) -> Tuple[Any, int, bytes, int]:
+        """Parse ``n g obj <object>`` at ``offset``; returns the object, its end, the window and its start."""
+        window = OBJECT_WINDOW
+        while True:
+            self.budget.check()
+            data = self.read_window(offset, window)
+            try:
+                number, pos = parse_object(data, 0)
+                _, pos = parse_object(data, pos)
+                keyword, pos = parse_object(data, pos)
+                if not isinstance(number, int) or keyword != b"obj":
+                    raise PdfStructureError(f"No object at offset {offset}")
+                value, pos = parse_object(data, pos)
+                return (number, value), pos, data, offset
+            except _Truncated:
+                if offset + window >= self.size or window >= MAX_OBJECT_SIZE:
+                    raise PdfStructureError(f"Object at offset {offset} is truncated or too large")
+                window *= 4
+
+    def stream_data(self, dictionary: Dict[str, Any], data: bytes, pos: int, window_start: int) -> bytes:
+        """Read and decode the stream following ``dictionary``, which ended at ``pos`` of ``data``."""
+        match = re.compile(rb"\s*stream(\r\n|\n|\r)").match(data, pos)
+        if not match:
+            raise PdfStructureError(f"Missing stream keyword after the dictionary at offset {window_start}")
+        length = self.resolve(dictionary.get("Length"))
+        if not isinstance(length, int) or length < 0:
+            raise PdfStructureError("Stream without a valid /Length")
+        start = window_start + match.end()
+        if start + length > self.size:
+            raise PdfStructureError("Stream runs past the end of the body")
+        raw = self.read(start, length)
+        filters = dictionary.get("Filter")
+        filters = filters if isinstance(filters, list) else [filters] if filters else []
+        if any(name != "FlateDecode" for name in filters):
+            raise PdfStructureError(f"Unsupported stream filter {filters}")
+        if filters:
+            decompressor = zlib.decompressobj()
+            try:
+                raw = decompressor.decompress(raw, MAX_DECODED_SIZE)
+            except zlib.error as e:
+                raise PdfStructureError(f"Corrupt stream: {e}")
+            if decompressor.unconsumed_tail:
+                raise PdfBudgetExceeded(f"Stream decompresses to more than {MAX_DECODED_SIZE} bytes")
+        parameters = self.resolve(dictionary.get("DecodeParms")) or {}
+        if isinstance(parameters, list):
+            parameters = self.resolve(parameters[0]) if parameters else None
+            parameters = parameters or {}
+        if not isinstance(parameters, dict):
+            raise PdfStructureError("Stream /DecodeParms is not a dictionary")
+        predictor = parameters.get("Predictor", 1)
+        if not isinstance(predictor, int):
+            raise PdfStructureError("Stream /Predictor is not a number")
+        if predictor >= 10:
+            columns = parameters.get("Columns", 1)
+            if not isinstance(columns, int) or not 0 < columns <= MAX_COLUMNS:
+                raise PdfStructureError(f"Stream /Columns must be a number from 1 to {MAX_COLUMNS}")
+            raw = _png_unpredict(raw, columns, self.budget)
+        self.budget.check()
+        return raw
+
+    def load_sections(self, offset: int):
+        seen = set()
+        while offset is not None:
+            if offset in seen or len(self.sections) >= MAX_SECTIONS:
+                raise PdfStructureError("Cyclic or too long /Prev chain of xref sections")
+            seen.add(offset)
+            if not 0 <= offset < self.size:
+                raise PdfStructureError(f"Xref offset {offset} is outside the body")
+            section, trailer = self.load_section(offset)
+            self.sections.append(section)
+            if isinstance(trailer.get("XRefStm"), int):
+                # hybrid-reference file: the stream holds the objects a pre-1.5 reader does not see
+                self.sections.append(self.load_section(trailer["XRefStm"])[0])
+            for key, value in trailer.items():
+                self.trailer.setdefault(key, value)
+            previous = trailer.get("Prev")
+            offset = previous if isinstance(previous, int) else None
+
+    def load_section(self, offset: int):
+        self.budget.check()
+        head = self.read(offset, 32).lstrip(_WHITESPACE)
+        if head.startswith(b"xref"):
+            return self._load_table(offset + self.read(offset, 32).index(b"xref") + 4)
+        (number, dictionary), pos, data, start = self.parse_at(offset)
+        if not isinstance(dictionary, dict) or dictionary.get("Type") != "XRef":
+            raise PdfStructureError(f"startxref offset {offset} points to neither an xref table nor stream")
+        widths = dictionary.get("W")
+        size = dictionary.get("Size")
+        if not (isinstance(widths, list) and len(widths) == 3 and all(isinstance(w, int) for w in widths)
+                and isinstance(size, int)):
+            raise PdfStructureError("Xref stream without valid /W and /Size")
+        index = dictionary.get("Index") or [0, size]
+        return _XrefStream(self.stream_data(dictionary, data, pos, start), widths, index), dictionary
+
+    def _load_table(self, pos: int):
+        subsections = []
+        while True:
+            self.budget.check()
+            data = self.read(pos, 64)
+            stripped = len(data) - len(data.lstrip(_WHITESPACE))
+            if data[stripped:].startswith(b"trailer"):
+                pos += stripped + len(b"trailer")
+                break
+            match = _XREF_SUBSECTION.match(data, stripped)
+            if not match:
+                raise PdfStructureError(f"Malformed xref subsection header at offset {pos}")
+            first, count = int(match.group(1)), int(match.group(2))
+            entries = pos + match.end()
+            subsections.append((first, count, entries))
+            pos = entries + count * 20
+            if pos > self.size:
+                raise PdfStructureError("Xref table runs past the end of the body")
+        window = OBJECT_WINDOW
+        while True:
+            try:
+                trailer, _ = parse_object(self.read_window(pos, window), 0)
+                break
+            except _Truncated:
+                if pos + window >= self.size or window >= MAX_OBJECT_SIZE:
+                    raise PdfStructureError("Truncated trailer")
+                window *= 4
+        if not isinstance(trailer, dict):
+            raise PdfStructureError("Trailer is not a dictionary")
+        return _XrefTable(self, subsections), trailer
+
+    def entry(self, number: int) -> Optional[Tuple[int, int, int]]:
+        for section in self.sections:
+            entry = section.entry(number)
+            if entry is not None:
+                return entry
+        return None
+
+    def resolve(self, value: Any, depth: int = 0) -> Any:
+        """Follow references until a direct object; None for free or missing objects."""
+        while isinstance(value, Ref):
+            if depth > 32:
+                raise PdfStructureError("Reference chain too long")
+            depth += 1
+            value = self.get_object(value.number)
+        return value
+
+    def get_object(self, number: int) -> Any:
+        self.budget.check()
+        entry = self.entry(number)
+        if entry is None or entry[0] == 0:
+            return None
+        kind, field2, field3 = entry
+        if kind == 1:
+            (found, value), _, _, _ = self.parse_at(field2)
+            if found != number:
+                raise PdfStructureError(f"Xref entry of object {number} points to object {found}")
+            return value
+        if kind == 2:
+            return self._compressed_object(field2, field3)
+        return None
+
+    def _compressed_object(self, stream_number: int, index: int) -> Any:
+        if "Encrypt" in self.trailer:
+            raise _Encrypted()
+        if stream_number not in self._object_streams:
+            entry = self.entry(stream_number)
+            if entry is None or entry[0] != 1:
+                raise PdfStructureError(f"Object stream {stream_number} is missing")
+            (_, dictionary), pos, data, start = self.parse_at(entry[1])
+            if not isinstance(dictionary, dict) or dictionary.get("Type") != "ObjStm":
+                raise PdfStructureError(f"Object {stream_number} is not an object stream")
+            decoded = self.stream_data(dictionary, data, pos, start)
+            first = dictionary.get("First")
+            if not isinstance(first, int):
+                raise PdfStructureError(f"Object stream {stream_number} without /First")
+            tokens = decoded[:first].split()
+            if not all(token.isdigit() for token in tokens):
+                raise PdfStructureError(f"Object stream {stream_number} has a malformed header")
+            header = [int(token) for token in tokens]
+            self._object_streams[stream_number] = (decoded, [first + offset for offset in header[1::2]])
+        decoded, offsets = self._object_streams[stream_number]
+        if index >= len(offsets):
+            raise PdfStructureError(f"Object stream {stream_number} has no object {index}")
+        try:
+            return parse_object(decoded + b" " * _REFERENCE_LOOKAHEAD, offsets[index])[0]
+        except _Truncated:
+            raise PdfStructureError(f"Truncated object in object stream {stream_number}")
+
+
+def inspect_pdf(body, budget_ms: float = 50.0) -> PdfStructure:
+    """
+    Validate the structure of the PDF in ``body`` and describe it.
+
+    Raises:
+        PdfStructureError: the body is no complete, well-formed PDF.
+        PdfBudgetExceeded: validation took longer than ``budget_ms``.
+    """
+    try:
+        return _inspect(body, budget_ms)
+    except PdfStructureError:
+        raise
+    except _Truncated:
+        raise PdfStructureError("Truncated object")
+    except (ArithmeticError, AttributeError, LookupError, RecursionError, TypeError, ValueError) as e:
+        # a malformed value the parser did not anticipate is still a malformed document
+        raise PdfStructureError(f"Malformed PDF ({type(e).__name__}: {e})") from e
+
+
+def _inspect(body, budget_ms: float) -> PdfStructure:
+    budget = Budget(budget_ms)
+    reader = _Reader(body, budget)
+    header = reader.read(0, 16)
+    version = re.match(rb"%PDF-(\d\.\d)", header)
+    if not version:
+        raise PdfStructureError("No %PDF-x.y header")
+
+    tail_start = max(0, reader.size - TAIL_SIZE)
+    tail = reader.read(tail_start, TAIL_SIZE)
+    eof = tail.rfind(b"%%EOF")
+    if eof < 0:
+        raise PdfStructureError("No %%EOF marker at the end, the PDF is truncated or no PDF")
+    startxref = None
+    for startxref in _STARTXREF.finditer(tail, 0, eof):
+        pass
+    if startxref is None:
+        raise PdfStructureError("No startxref before %%EOF")
+
+    try:
+        reader.load_sections(int(startxref.group(1)))
+    except _Truncated:
+        raise PdfStructureError("Truncated cross-reference section")
+    trailer = reader.trailer
+    if not isinstance(trailer.get("Root"), Ref):
+        raise PdfStructureError("Trailer without /Root")
+    encrypted = "Encrypt" in trailer
+
+    try:
+        catalog = reader.resolve(trailer["Root"])
+        if not isinstance(catalog, dict):
+            raise PdfStructureError("Document catalog is missing")
+        pages = reader.resolve(catalog.get("Pages"))
+        if not isinstance(pages, dict):
+            raise PdfStructureError("Page tree is missing")
+        page_count = reader.resolve(pages.get("Count"))
+        if not isinstance(page_count, int) or page_count < 0:
+            raise PdfStructureError("Page tree without a valid /Count")
+    except _Encrypted:
+        page_count = None
+
+    size = trailer.get("Size")
+    return PdfStructure(
+        version=version.group(1).decode("ascii"),
+        xref=reader.sections[0].kind,
+        objects=size if isinstance(size, int) else 0,
+        page_count=page_count,
+        encrypted=encrypted,
+        incremental_updates=len(reader.sections) - 1,
+    )
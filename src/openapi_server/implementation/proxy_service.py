@@ -0,0 +1,374 @@
+# openapi_server/implementation/proxy_service.py
+
+"""
+Proxy implementation: forwards uploads to an upstream classifier.
+
+Select it with ``PDFCLASSIFIER_IMPLEMENTATION=proxy`` and point
+``settings.proxy_upstream_url`` at the base URL of a service speaking this
+API (a real classifier, or another instance of this mock); uploads are posted
+to ``{proxy_upstream_url}/classify/{uuid}``, the uuid quoted as one path
+segment.
+
+One pooled ``httpx.AsyncClient`` per worker process keeps connections to the
+upstream alive (HTTP/1.1 keep-alive, or HTTP/2 with ``settings.proxy_http2``
+when the ``h2`` package is installed). The body is sent in chunks sliced from
+the upload's buffer, so a spooled upload is never read into memory as a whole.
+This is store-and-forward, not pass-through streaming: the route spools the
+complete upload (``read_pdf_body``) before the first byte goes upstream,
+because retries and hedges send the body again and the result cache keys on
+its digest. Memory stays bounded by the spool threshold, latency grows with
+the upload's transfer time.
+
+Connection errors, timeouts and 429/502/503/504 answers are retried up to
+``settings.proxy_retries`` times with full-jitter exponential backoff. A
+``CircuitBreaker`` stops sending to an upstream that failed
+``settings.proxy_breaker_failures`` times in a row and answers 503 until a
+trial request after ``settings.proxy_breaker_reset`` seconds succeeds. With
+``settings.proxy_hedge_after_ms`` an attempt the upstream has not answered
+within that time is sent a second time and the first answer wins, cutting
+the tail latency of a slow upstream instance. The mock's ``X-Corruption-Seed``
+and ``X-Latency-Profile`` headers are passed on, so a mock upstream behaves
+like the local mock would; they and the uuid are part of the result cache key.
+
+Synchronous callers (``classify_pdf``, ``classify_pdf_json``) get the same
+retry and circuit breaker rules over a pooled blocking ``httpx.Client``;
+they are not hedged, a blocked thread cannot race two requests.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import urllib.parse
+from typing import AsyncIterator, Iterator, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from openapi_server import metrics, request_context
+from openapi_server.apis.classification_api_base import BaseClassificationApi, PdfBody
+from openapi_server.models.classification_result import ClassificationResult
+from openapi_server.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# bytes of the upload sent per chunk
+CHUNK_SIZE = 64 * 1024
+# upstream answers worth another attempt
+RETRY_STATUSES = frozenset((429, 502, 503, 504))
+# upper bound of one backoff delay in seconds
+MAX_BACKOFF = 10.0
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+upstream_requests_total = metrics.registry.counter(
+    "pdfclassifier_proxy_upstream_requests_total", "Requests sent to the upstream classifier by outcome.", ["outcome"])
+upstream_seconds = metrics.registry.histogram(
+    "pdfclassifier_proxy_upstream_seconds", "Duration of requests to the upstream classifier.")
+retries_total = metrics.registry.counter(
+    "pdfclassifier_proxy_retries_total", "Attempts repeated after a failed upstream request.")
+hedges_total = metrics.registry.counter(
+    "pdfclassifier_proxy_hedges_total", "Hedged upstream requests by which request answered first.", ["winner"])
+circuit_state = metrics.registry.gauge(
+    "pdfclassifier_proxy_circuit_state", "State of the upstream circuit breaker: 0 closed, 1 half-open, 2 open.")
+
+
+class CircuitBreaker:
+    """Opens after ``failures`` consecutive failures and lets one trial request through after ``reset`` seconds."""
+
+    def __init__(self, failures: int, reset: float):
+        self.failures = failures
+        self.reset = reset
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        # synchronous callers share the breaker from the executor's threads
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        """Seconds until the next trial request, 0 if requests are let through."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset - time.monotonic())
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN and self.retry_after() == 0:
+                self._set(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._trial_running:
+                    return False
+                self._trial_running = True
+            return self.state != OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._trial_running = False
+            self._set(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or (self.failures > 0 and self.consecutive_failures >= self.failures):
+                self.opened_at = time.monotonic()
+                self._set(OPEN)
+
+    def abandon(self):
+        """Forget a request that ended without telling whether the upstream works."""
+        with self._lock:
+            self._trial_running = False
+
+    def _set(self, state: str):
+        if state != self.state:
+            logger.warning("Upstream circuit %s", state.replace("_", "-"))
+        self.state = state
+        circuit_state.set(_STATE_VALUES[state])
+
+
+class _RetryableStatus(Exception):
+    """An upstream answer worth another attempt."""
+
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"upstream answered {response.status_code}")
+        self.response = response
+
+
+def backoff(attempt: int, base_ms: float, rng: random.Random = random) -> float:
+    """Full-jitter exponential backoff in seconds before retry ``attempt`` (counted from 0)."""
+    return rng.uniform(0, min(MAX_BACKOFF, base_ms / 1000 * 2 ** attempt))
+
+
+def _sync_chunks(body: PdfBody) -> Iterator[memoryview]:
+    view = memoryview(body)
+    for start in range(0, len(view), CHUNK_SIZE):
+        yield view[start:start + CHUNK_SIZE]
+
+
+async def _chunks(body: PdfBody) -> AsyncIterator[memoryview]:
+    for chunk in _sync_chunks(body):
+        yield chunk
+
+
+def _path(uuid: str) -> str:
+    # one path segment whatever the uuid holds; dots too, or ".." would climb out of /classify
+    return "/classify/" + urllib.parse.quote(uuid, safe="").replace(".", "%2E")
+
+
+def _detail(response: httpx.Response) -> str:
+    try:
+        return json.loads(response.content)["detail"]
+    except (ValueError, KeyError, TypeError):
+        return response.text or response.reason_phrase
+
+
+class ProxyClassificationServiceImpl(BaseClassificationApi):
+    """Forwards uploads to the upstream classifier at ``settings.proxy_upstream_url``."""
+
+    implementation_name = "proxy"
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None,
+                 sync_transport: Optional[httpx.BaseTransport] = None):
+        # transports replace the network, e.g. an ``httpx.MockTransport``
+        self.transport = transport
+        self.sync_transport = sync_transport
+        self.breaker = CircuitBreaker(settings.proxy_breaker_failures, settings.proxy_breaker_reset)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._sync_client: Optional[httpx.Client] = None
+        self._sync_client_lock = threading.Lock()
+
+    @staticmethod
+    def _client_options() -> dict:
+        if not settings.proxy_upstream_url:
+            raise HTTPException(status_code=503, detail="No upstream classifier configured")
+        return dict(
+            base_url=settings.proxy_upstream_url,
+            http2=settings.proxy_http2,
+            limits=httpx.Limits(max_connections=settings.proxy_max_connections,
+                                max_keepalive_connections=settings.proxy_max_keepalive,
+                                keepalive_expiry=settings.proxy_keepalive_expiry),
+            timeout=httpx.Timeout(settings.proxy_timeout, connect=settings.proxy_connect_timeout),
+        )
+
+    def client(self) -> httpx.AsyncClient:
+        """The pooled client, created on first use if ``startup`` has not run."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(**self._client_options(), transport=self.transport)
+        return self._client
+
+    def sync_client(self) -> httpx.Client:
+        """The pooled blocking client of synchronous callers, created on first use."""
+        with self._sync_client_lock:
+            if self._sync_client is None:
+                self._sync_client = httpx.Client(**self._client_options(), transport=self.sync_transport)
+            return self._sync_client
+
+    async def startup(self) -> None:
+        if settings.proxy_http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                raise RuntimeError("PDFCLASSIFIER_PROXY_HTTP2 needs the h2 package, install httpx[http2]")
+        if settings.proxy_upstream_url:
+            self.client()
+
+    async def shutdown(self) -> None:
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+        with self._sync_client_lock:
+            sync_client, self._sync_client = self._sync_client, None
+        if sync_client is not None:
+            sync_client.close()
+
+    def result_cache_key(self, uuid: str, body_digest: str) -> Optional[str]:
+        """
+        The upstream answers for the uuid as well as the body, and may depend on
+        the forwarded seed and latency profile, so they are all part of the key.
+        """
+        context = request_context.current()
+        forwarded = json.dumps([settings.proxy_upstream_url, uuid, context.corruption_seed, context.latency_profile])
+        return f"{super().result_cache_key(uuid, body_digest)}:{forwarded}"
+
+    def classify_pdf(self, uuid: str, body: PdfBody) -> ClassificationResult:
+        return ClassificationResult.from_json(self.classify_pdf_json(uuid, body).decode("utf-8"))
+
+    def classify_pdf_json(self, uuid: str, body: PdfBody) -> bytes:
+        """Blocking ``classify_pdf_async``, with the same retries and circuit breaker but no hedging."""
+        attempt = 0
+        while True:
+            self._admit()
+            try:
+                response = self._send_sync(uuid, body)
+            except (httpx.HTTPError, _RetryableStatus) as e:
+                time.sleep(self._retry_delay(e, attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                self.breaker.abandon()
+                raise
+            return self._answer(response)
+
+    async def classify_pdf_async(self, uuid: str, body: PdfBody) -> bytes:
+        """
+        Return the upstream's answer for the upload.
+
+        Raises:
+            HTTPException: the upstream's own 4xx answers; 502 if it failed and
+                504 if it timed out on every attempt; 503 while the circuit is open.
+        """
+        attempt = 0
+        while True:
+            self._admit()
+            try:
+                response = await self._hedged(uuid, body)
+            except (httpx.HTTPError, _RetryableStatus) as e:
+                await asyncio.sleep(self._retry_delay(e, attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # cancelled, e.g. by a client disconnect: no verdict on the upstream
+                self.breaker.abandon()
+                raise
+            return self._answer(response)
+
+    def _admit(self):
+        if not self.breaker.allow():
+            upstream_requests_total.labels("circuit_open").inc()
+            raise HTTPException(status_code=503, detail="Upstream classifier unavailable",
+                                headers={"Retry-After": str(max(1, round(self.breaker.retry_after())))})
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Record the failed ``attempt`` and return the backoff before the next; raise if it was the last."""
+        self.breaker.record_failure()
+        if attempt >= settings.proxy_retries:
+            raise self._failure(error)
+        logger.info("Upstream attempt %d failed, retrying: %s", attempt + 1, str(error) or type(error).__name__)
+        retries_total.inc()
+        return backoff(attempt, settings.proxy_retry_backoff_ms)
+
+    def _answer(self, response: httpx.Response) -> bytes:
+        self.breaker.record_success()
+        if response.status_code >= 400:
+            raise HTTPException(status_code=response.status_code, detail=_detail(response))
+        return response.content
+
+    @staticmethod
+    def _failure(error: Exception) -> HTTPException:
+        if isinstance(error, httpx.TimeoutException):
+            return HTTPException(status_code=504, detail="Upstream classifier timed out")
+        if isinstance(error, _RetryableStatus):
+            return HTTPException(status_code=502, detail=f"Upstream classifier failed: {_detail(error.response)}")
+        return HTTPException(status_code=502, detail=f"Upstream classifier unreachable: {type(error).__name__}")
+
+    async def _hedged(self, uuid: str, body: PdfBody) -> httpx.Response:
+        """Send the upload, and once more if the first request is slower than ``settings.proxy_hedge_after_ms``."""
+        hedge_after = settings.proxy_hedge_after_ms / 1000
+        first = asyncio.create_task(self._send(uuid, body))
+        if hedge_after <= 0:
+            return await first
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        if done:
+            return first.result()
+        second = asyncio.create_task(self._send(uuid, body))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        hedges_total.labels("first" if task is first else "hedge").inc()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _send(self, uuid: str, body: PdfBody) -> httpx.Response:
+        headers = self._headers(body)
+        started = time.perf_counter()
+        try:
+            response = await self.client().post(_path(uuid), content=_chunks(body), headers=headers)
+        except httpx.HTTPError:
+            upstream_requests_total.labels("error").inc()
+            raise
+        finally:
+            upstream_seconds.observe(time.perf_counter() - started)
+        return self._checked(response)
+
+    def _send_sync(self, uuid: str, body: PdfBody) -> httpx.Response:
+        headers = self._headers(body)
+        started = time.perf_counter()
+        try:
+            response = self.sync_client().post(_path(uuid), content=_sync_chunks(body), headers=headers)
+        except httpx.HTTPError:
+            upstream_requests_total.labels("error").inc()
+            raise
+        finally:
+            upstream_seconds.observe(time.perf_counter() - started)
+        return self._checked(response)
+
+    @staticmethod
+    def _headers(body: PdfBody) -> dict:
+        headers = {"Content-Type": "application/pdf", "Content-Length": str(len(body))}
+        context = request_context.current()
+        if context.corruption_seed is not None:
+            headers["X-Corruption-Seed"] = context.corruption_seed
+        if context.latency_profile is not None:
+            headers["X-Latency-Profile"] = context.latency_profile
+        return headers
+
+    @staticmethod
+    def _checked(response: httpx.Response) -> httpx.Response:
+        if response.status_code in RETRY_STATUSES:
+            upstream_requests_total.labels("retryable").inc()
+            raise _RetryableStatus(response)
+        upstream_requests_total.labels("ok" if response.status_code < 400 else "rejected").inc()
+        return response
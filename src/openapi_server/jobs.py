@@ -0,0 +1,518 @@
+# coding: utf-8
+
+"""
+Asynchronous classification jobs: submit now, poll or get called back later.
+
+``JobManager`` accepts uploads into a bounded queue and classifies them on a
+fixed number of worker tasks. A full queue is reported to the caller (the
+route answers 429) instead of accepting unbounded work. Job state lives in a
+pluggable ``JobStore``: ``InMemoryJobStore`` evicts finished jobs after a TTL
+and keeps the uploads of queued jobs as they were read, spooled to disk
+beyond ``settings.body_spool_threshold``; ``SqliteJobStore`` keeps jobs
+(including the bodies of unfinished ones) in a SQLite file so they survive
+restarts and are requeued on startup, and is only called from threads so its
+I/O never blocks the event loop. Several
+worker processes can share one SQLite store: each runs the jobs submitted to
+it, any of them answers ``GET /jobs/{id}``, and a starting worker only
+requeues the unfinished jobs of workers that are gone.
+
+Finished jobs are posted to their ``X-Callback-Url`` only if it is an http(s)
+URL to a host of ``settings.jobs_callback_allowlist``; submissions with other
+callback URLs are rejected.
+"""
+
+import asyncio
+import collections
+import dataclasses
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.parse
+import uuid as uuid_lib
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import httpx
+from fastapi import HTTPException
+
+from openapi_server import metrics, request_context
+from openapi_server.apis.classification_api_base import BaseClassificationApi
+from openapi_server.body_stream import SpooledBody
+from openapi_server.result_cache import classify_cached
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED_STATES = (DONE, FAILED)
+
+# an uploaded body: ``bytes``, or the ``SpooledBody`` it was read into
+Upload = Union[bytes, SpooledBody]
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def _close(upload: Optional[Upload]):
+    if isinstance(upload, SpooledBody):
+        upload.close()
+
+
+def _buffer(upload: Upload):
+    return upload.getbuffer() if isinstance(upload, SpooledBody) else upload
+
+
+def parse_allowlist(allowlist: Sequence[str]) -> List[Tuple[str, Optional[int]]]:
+    """The (host pattern, port or None) of each ``host``, ``host:port`` or ``*.domain[:port]`` entry."""
+    parsed = []
+    for entry in allowlist:
+        entry = entry.strip()
+        if entry:
+            allowed = urllib.parse.urlsplit(f"//{entry}")
+            parsed.append(((allowed.hostname or "").rstrip("."), allowed.port))
+    return parsed
+
+
+def callback_allowed(url: str, allowlist: List[Tuple[str, Optional[int]]]) -> bool:
+    """
+    Whether ``url`` is an http(s) URL to a host and port of the parsed
+    ``allowlist``; entries without a port only allow the scheme's default one.
+    """
+    try:
+        parts = urllib.parse.urlsplit(url)
+        port = parts.port or _DEFAULT_PORTS.get(parts.scheme)
+    except ValueError:
+        return False
+    host = (parts.hostname or "").rstrip(".")
+    if parts.scheme not in _DEFAULT_PORTS or not host:
+        return False
+    for pattern, allowed_port in allowlist:
+        if (allowed_port or _DEFAULT_PORTS[parts.scheme]) != port:
+            continue
+        if host == pattern or (pattern.startswith("*.") and host.endswith(pattern[1:])):
+            return True
+    return False
+
+
+@dataclasses.dataclass
+class Job:
+    id: str
+    uuid: str
+    status: str = QUEUED
+    created_at: float = dataclasses.field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    # JSON-encoded ClassificationResult of a finished job
+    result: Optional[bytes] = None
+    error_status: Optional[int] = None
+    error_detail: Optional[str] = None
+    callback_url: Optional[str] = None
+    corruption_seed: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def to_json(self) -> bytes:
+        """The job as returned by ``GET /jobs/{id}`` and posted to callbacks."""
+        fields = {"job_id": self.id, "uuid": self.uuid, "status": self.status}
+        if self.error_status is not None:
+            fields["error"] = {"status": self.error_status, "detail": self.error_detail}
+        encoded = json.dumps(fields, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if self.result is None:
+            return encoded
+        return encoded[:-1] + b',"result":' + self.result + b"}"
+
+
+class QueueFullError(Exception):
+    """Raised by ``JobManager.submit`` when the queue depth limit is reached."""
+
+
+class JobStore:
+    """Storage of jobs and the bodies of jobs that have not run yet."""
+
+    # True if the methods do blocking I/O, the manager then calls them in a thread
+    blocking: bool = False
+
+    def create(self, job: Job, body: Upload) -> None:
+        """Store a new job; the store owns ``body`` from now on and closes a ``SpooledBody`` when done with it."""
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Job]:
+        raise NotImplementedError
+
+    def update(self, job: Job) -> None:
+        raise NotImplementedError
+
+    def take_body(self, job_id: str) -> Optional[Upload]:
+        """Return the body of a job about to run; the caller owns and closes it."""
+        raise NotImplementedError
+
+    def unfinished(self) -> List[Job]:
+        """Jobs that were queued or running in a process that is gone, claimed for requeueing by this one."""
+        return []
+
+    def evict_expired(self, now: float) -> int:
+        """Drop finished jobs whose TTL elapsed, returning how many were dropped."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class InMemoryJobStore(JobStore):
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._jobs: Dict[str, Job] = {}
+        # the uploads themselves: a copy would hold every queued body in memory
+        self._bodies: Dict[str, Upload] = {}
+        # finished job ids in order of completion, the oldest first
+        self._finished: "collections.OrderedDict[str, float]" = collections.OrderedDict()
+
+    def create(self, job: Job, body: Upload) -> None:
+        self._jobs[job.id] = job
+        self._bodies[job.id] = body if isinstance(body, (bytes, SpooledBody)) else bytes(body)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is not None and job.finished and job.finished_at + self.ttl < time.time():
+            return None
+        return job
+
+    def update(self, job: Job) -> None:
+        self._jobs[job.id] = job
+        if job.finished:
+            _close(self._bodies.pop(job.id, None))
+            self._finished[job.id] = job.finished_at
+
+    def take_body(self, job_id: str) -> Optional[Upload]:
+        return self._bodies.pop(job_id, None)
+
+    def evict_expired(self, now: float) -> int:
+        evicted = 0
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if finished_at + self.ttl >= now:
+                break
+            del self._finished[job_id]
+            self._jobs.pop(job_id, None)
+            evicted += 1
+        return evicted
+
+    def close(self) -> None:
+        bodies, self._bodies = self._bodies, {}
+        for body in bodies.values():
+            _close(body)
+
+
+class SqliteJobStore(JobStore):
+
+    blocking = True
+
+    def __init__(self, ttl: float, path: str):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, uuid TEXT NOT NULL, status TEXT NOT NULL,"
+            " created_at REAL NOT NULL, finished_at REAL, result BLOB,"
+            " error_status INTEGER, error_detail TEXT, callback_url TEXT, corruption_seed TEXT, body BLOB,"
+            " owner TEXT)")
+        if "owner" not in {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}:
+            # databases written before jobs had an owning process
+            self._db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        # "pid:token", the token tells this process from an earlier one with the same pid
+        self.owner = f"{os.getpid()}:{uuid_lib.uuid4().hex[:12]}"
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)")
+
+    _COLUMNS = ("id", "uuid", "status", "created_at", "finished_at", "result",
+                "error_status", "error_detail", "callback_url", "corruption_seed")
+
+    def _execute(self, sql: str, parameters=()):
+        with self._lock:
+            return self._db.execute(sql, parameters).fetchall()
+
+    def create(self, job: Job, body: Upload) -> None:
+        values = [getattr(job, column) for column in self._COLUMNS]
+        try:
+            self._execute(f"INSERT INTO jobs ({', '.join(self._COLUMNS)}, body, owner) VALUES ({', '.join('?' * 12)})",
+                          (*values, _buffer(body), self.owner))
+        finally:
+            _close(body)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        rows = self._execute(f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?"
+                             " AND (finished_at IS NULL OR finished_at >= ?)", (job_id, time.time() - self.ttl))
+        return Job(**dict(zip(self._COLUMNS, rows[0]))) if rows else None
+
+    def update(self, job: Job) -> None:
+        assignments = ", ".join(f"{column} = ?" for column in self._COLUMNS[1:])
+        body_update = ", body = NULL" if job.finished else ""
+        self._execute(f"UPDATE jobs SET {assignments}{body_update} WHERE id = ?",
+                      (*(getattr(job, column) for column in self._COLUMNS[1:]), job.id))
+
+    def take_body(self, job_id: str) -> Optional[bytes]:
+        # the body stays until the job finished, so a crash mid-run can requeue it
+        rows = self._execute("SELECT body FROM jobs WHERE id = ?", (job_id,))
+        return rows[0][0] if rows else None
+
+    def _orphaned(self, owner: Optional[str]) -> bool:
+        if owner is None:
+            return True
+        if owner == self.owner:
+            return False
+        pid = int(owner.split(":", 1)[0])
+        return pid == os.getpid() or not metrics.process_alive(pid)
+
+    def unfinished(self) -> List[Job]:
+        with self._lock:
+            # the immediate transaction keeps workers starting together from claiming the same jobs
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(f"SELECT {', '.join(self._COLUMNS)}, owner FROM jobs"
+                                        f" WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)).fetchall()
+                orphans = [row[:-1] for row in rows if self._orphaned(row[-1])]
+                self._db.executemany("UPDATE jobs SET owner = ? WHERE id = ?",
+                                     [(self.owner, row[0]) for row in orphans])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return [Job(**dict(zip(self._COLUMNS, row))) for row in orphans]
+
+    def evict_expired(self, now: float) -> int:
+        with self._lock:
+            return self._db.execute("DELETE FROM jobs WHERE finished_at < ?", (now - self.ttl,)).rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+JOB_STORES = {
+    "memory": lambda settings: InMemoryJobStore(settings.jobs_ttl),
+    "sqlite": lambda settings: SqliteJobStore(settings.jobs_ttl, settings.jobs_sqlite_path),
+}
+
+
+def create_job_store(settings) -> JobStore:
+    try:
+        factory = JOB_STORES[settings.jobs_store]
+    except KeyError:
+        raise ValueError(f"Unknown job store '{settings.jobs_store}', expected one of {tuple(JOB_STORES)}")
+    return factory(settings)
+
+
+class JobManager:
+    """Bounded queue plus worker tasks classifying submitted jobs."""
+
+    # seconds between sweeps of expired jobs and of jobs left by exited workers
+    SWEEP_INTERVAL = 30.0
+    # seconds between store lookups of a long-poll, for jobs another worker runs
+    WAIT_POLL_INTERVAL = 0.25
+    CALLBACK_ATTEMPTS = 3
+
+    def __init__(self, store: JobStore, implementation: BaseClassificationApi, workers: int, queue_depth: int,
+                 callback_timeout: float = 10.0, callback_allowlist: Sequence[str] = ()):
+        self.store = store
+        self.implementation = implementation
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.callback_timeout = callback_timeout
+        self.callback_allowlist = parse_allowlist(callback_allowlist)
+        self._queue: Optional[asyncio.Queue] = None
+        # submissions between the depth check and their place in the queue
+        self._submitting = 0
+        self._tasks: List[asyncio.Task] = []
+        self._waiters: Dict[str, asyncio.Event] = {}
+        self._callbacks: set = set()
+        self._http: Optional[httpx.AsyncClient] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        # the depth limit is enforced by submit(), so recovered jobs always fit
+        self._queue = asyncio.Queue()
+        self._http = httpx.AsyncClient(timeout=self.callback_timeout)
+        await self._requeue_orphans()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweep_periodically()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._callbacks, return_exceptions=True)
+        self._tasks = []
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        await self._store(self.store.close)
+
+    async def _store(self, method: Callable, *args) -> Any:
+        """Call a store method, in a thread if the store does blocking I/O."""
+        if self.store.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    def callback_allowed(self, url: str) -> bool:
+        return callback_allowed(url, self.callback_allowlist)
+
+    async def submit(self, uuid: str, body: Upload, callback_url: Optional[str] = None,
+                     corruption_seed: Optional[str] = None) -> Job:
+        """
+        Queue a job, raising ``QueueFullError`` if the queue depth limit is reached.
+
+        The job owns ``body`` from now on; it is closed if the job is not queued.
+        """
+        if self._queue.qsize() + self._submitting >= self.queue_depth:
+            _close(body)
+            raise QueueFullError()
+        job = Job(id=str(uuid_lib.uuid4()), uuid=uuid, callback_url=callback_url, corruption_seed=corruption_seed)
+        self._submitting += 1
+        try:
+            await self._store(self.store.create, job, body)
+        finally:
+            self._submitting -= 1
+        self._queue.put_nowait(job.id)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await self._store(self.store.get, job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """Return the job once it finished or ``timeout`` seconds passed (long-poll)."""
+        job = await self.get(job_id)
+        if job is None or job.finished or timeout <= 0:
+            return job
+        deadline = time.monotonic() + timeout
+        event = self._waiters.setdefault(job_id, asyncio.Event())
+        try:
+            while not event.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(event.wait(), min(remaining, self.WAIT_POLL_INTERVAL))
+                except asyncio.TimeoutError:
+                    job = await self.get(job_id)
+                    if job is None or job.finished:
+                        return job
+        finally:
+            if not event.is_set() and self._waiters.get(job_id) is event:
+                # nobody here will set it when the job runs in another worker
+                del self._waiters[job_id]
+        return await self.get(job_id)
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = await self._store(self.store.get, job_id)
+        upload = await self._store(self.store.take_body, job_id)
+        if job is None or upload is None:
+            _close(upload)
+            return
+        job.status = RUNNING
+        await self._store(self.store.update, job)
+        try:
+            with request_context.bind(corruption_seed=job.corruption_seed, correlation_id=job.uuid):
+                job.result, _ = await classify_cached(self.implementation, job.uuid, _buffer(upload))
+            job.status = DONE
+        except asyncio.CancelledError:
+            # a classification thread may still read the upload, it is freed with the last reference
+            raise
+        except HTTPException as e:
+            job.error_status, job.error_detail, job.status = e.status_code, str(e.detail), FAILED
+        except Exception as e:
+            job.error_status, job.error_detail, job.status = 500, f"Internal server error during classification: {e}", FAILED
+        _close(upload)
+        job.finished_at = time.time()
+        await self._store(self.store.update, job)
+
+        event = self._waiters.pop(job_id, None)
+        if event is not None:
+            event.set()
+        if job.callback_url:
+            task = asyncio.create_task(self._callback(job))
+            self._callbacks.add(task)
+            task.add_done_callback(self._callbacks.discard)
+
+    async def _callback(self, job: Job):
+        if not self.callback_allowed(job.callback_url):
+            # e.g. a requeued job submitted under an earlier allowlist
+            logger.warning("Not calling back job %s, %s is not allowed", job.id, job.callback_url,
+                           extra={"correlation_id": job.uuid})
+            return
+        payload = job.to_json()
+        for attempt in range(self.CALLBACK_ATTEMPTS):
+            try:
+                response = await self._http.post(job.callback_url, content=payload,
+                                                  headers={"Content-Type": "application/json"})
+                if response.status_code < 500:
+                    return
+            except httpx.HTTPError as e:
+                logger.warning("Callback for job %s to %s failed: %s", job.id, job.callback_url, e,
+                               extra={"correlation_id": job.uuid})
+            await asyncio.sleep((2 ** attempt) * (0.5 + random.random()))
+        logger.error("Giving up callback for job %s to %s", job.id, job.callback_url,
+                     extra={"correlation_id": job.uuid})
+
+    async def _requeue_orphans(self):
+        # what a previous process, or a worker that exited since, left unfinished
+        for job in await self._store(self.store.unfinished):
+            job.status = QUEUED
+            await self._store(self.store.update, job)
+            self._queue.put_nowait(job.id)
+
+    async def _sweep_periodically(self):
+        while True:
+            await asyncio.sleep(self.SWEEP_INTERVAL)
+            await self._store(self.store.evict_expired, time.time())
+            await self._requeue_orphans()
+
+
+_manager: Optional[JobManager] = None
+
+
+async def start_jobs(implementation: BaseClassificationApi, settings) -> JobManager:
+    """Create and start the shared job manager from the settings."""
+    global _manager
+    # opening a SQLite store is blocking I/O
+    store = await asyncio.to_thread(create_job_store, settings)
+    manager = JobManager(store, implementation, settings.jobs_workers, settings.jobs_queue_depth,
+                         settings.jobs_callback_timeout, settings.jobs_callback_allowlist.split(","))
+    await manager.start()
+    _manager = manager
+    return manager
+
+
+async def stop_jobs():
+    global _manager
+    manager, _manager = _manager, None
+    if manager is not None:
+        await manager.stop()
+
+
+def get_job_manager() -> Optional[JobManager]:
+    return _manager
+
+
+metrics.registry.function("pdfclassifier_jobs_queued", "Jobs waiting for a worker.", "gauge",
+                          lambda: None if _manager is None else _manager.queued)
@@ -10,16 +10,63 @@
 
     Do not edit the class manually.
 """  # noqa: E501
-from sys import prefix
+import os
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
+from openapi_server.admission import AdmissionMiddleware
+from openapi_server.apis.admission_api import router as AdmissionApiRouter
+from openapi_server.apis.batch_api import router as BatchApiRouter
+from openapi_server.apis.cache_api import router as CacheApiRouter
 from openapi_server.apis.classification_api import router as ClassificationApiRouter
+from openapi_server.apis.jobs_api import router as JobsApiRouter
+from openapi_server.apis.metrics_api import router as MetricsApiRouter
+from openapi_server.apis.scheduler_api import router as SchedulerApiRouter
+from openapi_server.executor import shutdown_executor
+from openapi_server.jobs import start_jobs, stop_jobs
+from openapi_server.metrics import MetricsMiddleware, start_sharing, stop_sharing
+from openapi_server.registry import registry
+from openapi_server.result_cache import close_result_cache
+from openapi_server.settings import settings
+from openapi_server.structured_logging import AccessLogMiddleware, configure_logging, stop_logging
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    if settings.shared_state_dir:
+        start_sharing(os.path.join(settings.shared_state_dir, "metrics"))
+    implementation = await registry.start(settings.implementation)
+    await start_jobs(implementation, settings)
+    try:
+        yield
+    finally:
+        await stop_jobs()
+        await registry.stop()
+        shutdown_executor()
+        close_result_cache()
+        stop_sharing()
+        stop_logging()
+
 
 app = FastAPI(
     title="PDF Classifier API",
     description="REST API to classify PDF files using a smart backend",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+# the batch route must precede /classify/{uuid}, which would otherwise match "batch" as uuid
+app.include_router(BatchApiRouter, prefix="/api/v1")
 app.include_router(ClassificationApiRouter, prefix="/api/v1")
+app.include_router(JobsApiRouter, prefix="/api/v1")
+app.include_router(CacheApiRouter, prefix="/api/v1")
+app.include_router(AdmissionApiRouter, prefix="/api/v1")
+app.include_router(SchedulerApiRouter, prefix="/api/v1")
+app.include_router(MetricsApiRouter)
+
+# innermost, so shed uploads are still logged and counted
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(AccessLogMiddleware)
+app.add_middleware(MetricsMiddleware)
@@ -0,0 +1,508 @@
+# coding: utf-8
+
+"""
+In-process metrics rendered in the Prometheus text exposition format.
+
+Counters and histograms keep one cell per thread that only that thread
+writes, so recording takes no lock; ``GET /metrics`` sums the cells. Gauges
+are few and updated from the event loop, they use a lock.
+
+Metrics are per process. Workers started by ``openapi_server.serve`` share
+them through ``settings.shared_state_dir``: each worker writes a snapshot of
+its metrics there every ``SHARE_INTERVAL`` seconds, and ``render`` sums the
+snapshots of all workers into the answer of ``GET /metrics``. Counters and
+histograms of exited workers keep counting, their gauges are dropped. Stages
+run in a process executor are not recorded.
+"""
+
+import bisect
+import contextlib
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds, from 10µs to 10s
+STAGE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# bytes, from 1KiB to 512MiB in powers of 4
+SIZE_BUCKETS = tuple(float(1024 * 4 ** exponent) for exponent in range(11))
+
+
+class _ThreadCells:
+    """Per-thread value arrays; a thread only ever writes its own."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._local = threading.local()
+        self._cells: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def cell(self) -> List[float]:
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = [0.0] * self.size
+            with self._lock:
+                self._cells.append(cell)
+            self._local.cell = cell
+            return cell
+
+    def totals(self) -> List[float]:
+        with self._lock:
+            cells = list(self._cells)
+        return [sum(cell[i] for cell in cells) for i in range(self.size)]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# (sample name, formatted labels, value)
+Sample = Tuple[str, str, float]
+# (name, kind, documentation, samples); plain lists and strings so it survives JSON
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Return the child for the given label values, in ``labelnames`` order."""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self) -> Iterator[Tuple[Tuple[str, ...], object]]:
+        if not self.labelnames:
+            yield (), self._default
+        else:
+            with self._lock:
+                children = sorted(self._children.items())
+            yield from children
+
+    def collect(self) -> Family:
+        samples = []
+        for label_values, child in self._samples():
+            samples.extend(self._child_samples(label_values, child))
+        return self.name, self.kind, self.documentation, samples
+
+    def render(self) -> List[str]:
+        return _render_family(self.collect())
+
+    def _child_samples(self, label_values, child) -> List[Sample]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("_cells",)
+
+    def __init__(self):
+        self._cells = _ThreadCells(1)
+
+    def inc(self, amount: float = 1.0):
+        self._cells.cell()[0] += amount
+
+    @property
+    def value(self) -> float:
+        return self._cells.totals()[0]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    @property
+    def value(self) -> float:
+        return self._default.value
+
+    def _child_samples(self, label_values, child) -> List[Sample]:
+        return [(self.name, _format_labels(self.labelnames, label_values), child.value)]
+
+
+class _GaugeChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    @property
+    def value(self) -> float:
+        return self._default.value
+
+    def _child_samples(self, label_values, child) -> List[Sample]:
+        return [(self.name, _format_labels(self.labelnames, label_values), child.value)]
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "_cells")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # one slot per bucket, one for +Inf, one for the sum
+        self._cells = _ThreadCells(len(buckets) + 2)
+
+    def observe(self, value: float):
+        cell = self._cells.cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    @contextlib.contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def snapshot(self) -> Tuple[List[float], float, float]:
+        """Cumulative bucket counts (the last being +Inf), count and sum."""
+        totals = self._cells.totals()
+        cumulative, running = [], 0.0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, running, totals[-1]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = STAGE_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _child_samples(self, label_values, child) -> List[Sample]:
+        cumulative, count, total = child.snapshot()
+        samples = []
+        for bound, value in zip(self.buckets + (math.inf,), cumulative):
+            labels = _format_labels(self.labelnames, label_values, f'le="{_format_value(bound)}"')
+            samples.append((f"{self.name}_bucket", labels, value))
+        labels = _format_labels(self.labelnames, label_values)
+        samples.append((f"{self.name}_sum", labels, total))
+        samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class FunctionMetric:
+    """A value read at collection time, e.g. a queue length or a counter kept elsewhere."""
+
+    def __init__(self, name: str, documentation: str, kind: str, function: Callable[[], Optional[float]]):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.function = function
+
+    def collect(self) -> Optional[Family]:
+        value = self.function()
+        if value is None:
+            return None
+        return self.name, self.kind, self.documentation, [(self.name, "", value)]
+
+    def render(self) -> List[str]:
+        family = self.collect()
+        return [] if family is None else _render_family(family)
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = STAGE_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def function(self, name: str, documentation: str, kind: str, function: Callable[[], Optional[float]]):
+        return self.register(FunctionMetric(name, documentation, kind, function))
+
+    def collect(self) -> List[Family]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [family for family in (metric.collect() for metric in metrics) if family is not None]
+
+    def render(self) -> str:
+        return render_families(self.collect())
+
+
+def _render_family(family: Family) -> List[str]:
+    name, kind, documentation, samples = family
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{sample}{labels} {_format_value(value)}" for sample, labels, value in samples)
+    return lines
+
+
+def render_families(families: Iterable[Family]) -> str:
+    lines = []
+    for family in families:
+        lines.extend(_render_family(family))
+    return "\n".join(lines) + "\n"
+
+
+def merge_families(snapshots: Iterable[List[Family]]) -> List[Family]:
+    """Sum the samples of several processes' families, in the order they are first seen."""
+    merged: Dict[str, Tuple[str, str, Dict[Tuple[str, str], float]]] = {}
+    for families in snapshots:
+        for name, kind, documentation, samples in families:
+            _, _, values = merged.setdefault(name, (kind, documentation, {}))
+            for sample, labels, value in samples:
+                key = (sample, labels)
+                values[key] = values.get(key, 0.0) + value
+    return [(name, kind, documentation, [(sample, labels, value) for (sample, labels), value in values.items()])
+            for name, (kind, documentation, values) in merged.items()]
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "pdfclassifier_stage_seconds", "Time spent per processing stage of a classification.", ["stage"])
+classifications_total = registry.counter(
+    "pdfclassifier_classifications_total", "Classifications by returned kind and UUID suffix.", ["kind", "suffix"])
+http_requests_total = registry.counter(
+    "pdfclassifier_http_requests_total", "HTTP requests by route template and status code.", ["route", "status"])
+http_request_seconds = registry.histogram(
+    "pdfclassifier_http_request_seconds", "Duration of HTTP requests by route template.", ["route"])
+http_requests_in_flight = registry.gauge(
+    "pdfclassifier_http_requests_in_flight", "HTTP requests currently being handled.")
+request_body_bytes = registry.histogram(
+    "pdfclassifier_request_body_bytes", "Size of HTTP request bodies by route template.", ["route"],
+    buckets=SIZE_BUCKETS)
+
+
+def time_stage(stage: str):
+    """Context manager recording the duration of ``stage`` in ``pdfclassifier_stage_seconds``."""
+    return stage_seconds.labels(stage).time()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts, durations, body sizes and in-flight requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        request_bytes = 0
+
+        async def counting_receive():
+            nonlocal request_bytes
+            message = await receive()
+            request_bytes += len(message.get("body", b""))
+            return message
+
+        async def status_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, counting_receive, status_send)
+        finally:
+            http_requests_in_flight.dec()
+            route = route_template(scope) or "unmatched"
+            http_requests_total.labels(route, status).inc()
+            http_request_seconds.labels(route).observe(time.perf_counter() - started)
+            if request_bytes:
+                request_body_bytes.labels(route).observe(request_bytes)
+
+
+def route_template(scope) -> Optional[str]:
+    """The request path with its path parameters replaced by ``{name}``, None if no route matched."""
+    if "route" not in scope:
+        return None
+    by_value = {str(value): name for name, value in scope.get("path_params", {}).items()}
+    return "/".join(f"{{{by_value[part]}}}" if part in by_value else part for part in scope["path"].split("/"))
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedMetrics:
+    """Snapshots of this worker's metrics in a directory shared by all workers."""
+
+    # seconds between snapshots of this worker
+    SHARE_INTERVAL = 1.0
+
+    def __init__(self, directory: str, registry: "MetricsRegistry"):
+        self.directory = directory
+        self.registry = registry
+        self.pid = os.getpid()
+        self.path = os.path.join(directory, f"{self.pid}.json")
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.write()
+        self._thread = threading.Thread(target=self._share_periodically, name="metrics-share", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        # the last snapshot stays, the counters of an exited worker keep counting
+        self.write()
+
+    def write(self):
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump({"pid": self.pid, "families": self.registry.collect()}, f)
+        os.replace(temporary, self.path)
+
+    def _share_periodically(self):
+        while not self._stopped.wait(self.SHARE_INTERVAL):
+            try:
+                self.write()
+            except OSError:
+                logger.exception("Writing the metrics snapshot %s failed", self.path)
+
+    def render(self) -> str:
+        """This worker's live metrics summed with the latest snapshots of all other workers."""
+        snapshots = [self.registry.collect()]
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if snapshot["pid"] == self.pid:
+                continue
+            families = snapshot["families"]
+            if not process_alive(snapshot["pid"]):
+                families = [family for family in families if family[1] != "gauge"]
+            snapshots.append(families)
+        return render_families(merge_families(snapshots))
+
+
+_shared: Optional[SharedMetrics] = None
+
+
+def start_sharing(directory: str):
+    """Share this worker's metrics through ``directory``, see ``SharedMetrics``."""
+    global _shared
+    shared = SharedMetrics(directory, registry)
+    shared.start()
+    _shared = shared
+
+
+def stop_sharing():
+    global _shared
+    shared, _shared = _shared, None
+    if shared is not None:
+        shared.stop()
+
+
+def render() -> str:
+    """The metrics served by ``GET /metrics``, aggregated over all workers while sharing."""
+    shared = _shared
+    return registry.render() if shared is None else shared.render()
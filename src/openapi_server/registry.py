@@ -0,0 +1,59 @@
+# coding: utf-8
+
+"""
+Lifecycle-managed registry of the active classification implementation.
+
+One implementation instance is created per worker process when the
+application starts (see the lifespan in ``openapi_server.main``) and shared by
+all requests, so it can keep warm state such as model handles, connection
+pools or caches. The implementation is selected by name through
+``settings.implementation``; without a name the first registered subclass of
+``BaseClassificationApi`` is used.
+"""
+
+from typing import Optional
+
+import openapi_server.implementation  # noqa: F401  (registers the bundled implementations)
+from openapi_server.apis.classification_api_base import BaseClassificationApi
+
+
+class ImplementationRegistry:
+
+    def __init__(self):
+        self._instance: Optional[BaseClassificationApi] = None
+        self._started = False
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    async def start(self, name: Optional[str] = None) -> BaseClassificationApi:
+        """Instantiate the implementation called ``name`` and run its ``startup()`` hook."""
+        if self._started:
+            return self._instance
+        instance = BaseClassificationApi.find_implementation(name)()
+        await instance.startup()
+        self._instance = instance
+        self._started = True
+        return instance
+
+    async def stop(self):
+        """Run the ``shutdown()`` hook of the active implementation and drop it."""
+        instance, self._instance = self._instance, None
+        started, self._started = self._started, False
+        if instance is not None and started:
+            await instance.shutdown()
+
+    def get(self, name: Optional[str] = None) -> BaseClassificationApi:
+        """
+        Return the active implementation.
+
+        Apps driven without lifespan events (e.g. a bare ``TestClient``) get a
+        lazily created instance whose ``startup()`` hook has not run.
+        """
+        if self._instance is None:
+            self._instance = BaseClassificationApi.find_implementation(name)()
+        return self._instance
+
+
+registry = ImplementationRegistry()
@@ -0,0 +1,51 @@
+# coding: utf-8
+
+"""
+Per-request state that has to reach the implementation without changing the
+``classify_pdf(uuid, body)`` signature.
+
+The router binds a ``RequestContext`` for the duration of a request; the
+implementation reads it with ``current()``. Context variables follow the
+request into executor threads (``run_sync`` copies the context) and are
+passed explicitly to executor processes.
+"""
+
+import contextlib
+import contextvars
+import dataclasses
+from typing import Any, Iterator, Optional
+
+
+@dataclasses.dataclass(frozen=True)
+class RequestContext:
+    # seed for deterministic corruption, None corrupts randomly
+    corruption_seed: Optional[str] = None
+    # latency profile spec requested with the X-Latency-Profile header
+    latency_profile: Optional[str] = None
+    # id tying log records together, overrides the one of the request_log (e.g. per batch item)
+    correlation_id: Optional[str] = None
+    # structured_logging.RequestLog of the HTTP request: correlation id and sampling decision
+    request_log: Optional[Any] = None
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("request_context", default=RequestContext())
+
+
+def current() -> RequestContext:
+    """Return the context of the request being processed."""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def use(context: RequestContext) -> Iterator[RequestContext]:
+    """Make ``context`` the current request context within the ``with`` block."""
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
+
+
+def bind(**changes) -> "contextlib.AbstractContextManager[RequestContext]":
+    """Derive a context from the current one with ``changes`` applied and use it within the ``with`` block."""
+    return use(dataclasses.replace(current(), **changes))
@@ -0,0 +1,277 @@
+# coding: utf-8
+
+"""
+Content-addressed cache of classification results.
+
+Resubmitted documents (rescans, retries, duplicates) are answered from the
+cache instead of going through the implementation again. Results are keyed by
+``BaseClassificationApi.result_cache_key``, by default the implementation name
+and version plus the SHA-256 of the body, which ``read_pdf_body`` computes
+while the upload streams in.
+
+Lookups go to an LRU in-memory tier bounded by entry count, total bytes and
+TTL, then to an optional SQLite tier that survives restarts, read and written
+in a thread so its I/O never blocks the event loop; disk hits are promoted to
+memory. Only successful results are cached. A hit is checked
+with ``BaseClassificationApi.validate_cached_request`` before it is answered,
+so an invalid uuid or body fails as it would without the cache. The cache is
+created from the settings on first use (``get_result_cache``), and is None
+while ``settings.result_cache`` is off.
+"""
+
+import asyncio
+import collections
+import dataclasses
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+from openapi_server import metrics
+from openapi_server.apis.classification_api_base import BaseClassificationApi, PdfBody
+from openapi_server.scheduler import scheduler
+from openapi_server.settings import settings
+
+
+@dataclasses.dataclass
+class CacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+
+class MemoryCacheTier:
+    """LRU mapping of keys to result bytes, bounded by entries, bytes and TTL."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size_bytes = 0
+        self.evictions = 0
+        self._entries: "collections.OrderedDict[str, Tuple[float, bytes]]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self.size_bytes += len(value)
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, value = self._entries.pop(key)
+        self.size_bytes -= len(value)
+
+
+class SqliteCacheTier:
+    """Results kept in a SQLite file; expired rows are ignored and purged on startup."""
+
+    def __init__(self, path: str, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)")
+        self._db.execute("DELETE FROM results WHERE expires_at < ?", (time.time(),))
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM results WHERE key = ? AND expires_at >= ?",
+                                   (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, value: bytes):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                             (key, value, time.time() + self.ttl))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ResultCache:
+
+    def __init__(self, memory: MemoryCacheTier, disk: Optional[SqliteCacheTier] = None):
+        self.memory = memory
+        self.disk = disk
+        self.stats = CacheStats()
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self._memory_get(key)
+        if value is None and self.disk is not None:
+            value = self._disk_result(key, self.disk.get(key))
+        if value is None:
+            self.stats.misses += 1
+        return value
+
+    async def get_async(self, key: str) -> Optional[bytes]:
+        """``get`` with the disk tier read in a thread."""
+        value = self._memory_get(key)
+        if value is None and self.disk is not None:
+            value = self._disk_result(key, await asyncio.to_thread(self.disk.get, key))
+        if value is None:
+            self.stats.misses += 1
+        return value
+
+    def put(self, key: str, value: bytes):
+        self.stats.stores += 1
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    async def put_async(self, key: str, value: bytes):
+        """``put`` with the disk tier written in a thread."""
+        self.stats.stores += 1
+        self.memory.put(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.put, key, value)
+
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats.memory_hits += 1
+        return value
+
+    def _disk_result(self, key: str, value: Optional[bytes]) -> Optional[bytes]:
+        if value is not None:
+            self.stats.disk_hits += 1
+            self.memory.put(key, value)
+        return value
+
+    def snapshot(self) -> dict:
+        """Counters and sizes, as served by ``GET /cache/stats``."""
+        return {
+            **dataclasses.asdict(self.stats),
+            "hits": self.stats.hits,
+            "evictions": self.memory.evictions,
+            "entries": len(self.memory),
+            "bytes": self.memory.size_bytes,
+            "disk": self.disk is not None,
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+
+_cache: Optional[ResultCache] = None
+_lock = threading.Lock()
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Return the shared cache, creating it from the settings on first use; None if disabled."""
+    global _cache
+    if not settings.result_cache:
+        return None
+    with _lock:
+        if _cache is None:
+            memory = MemoryCacheTier(settings.result_cache_max_entries, settings.result_cache_max_bytes,
+                                     settings.result_cache_ttl)
+            disk = None
+            if settings.result_cache_sqlite_path:
+                disk = SqliteCacheTier(settings.result_cache_sqlite_path, settings.result_cache_ttl)
+            _cache = ResultCache(memory, disk)
+    return _cache
+
+
+def close_result_cache():
+    """Close the shared cache; the next ``get_result_cache`` creates a fresh one."""
+    global _cache
+    with _lock:
+        cache, _cache = _cache, None
+    if cache is not None:
+        cache.close()
+
+
+def _cache_stat(name: str):
+    def read() -> Optional[float]:
+        return None if _cache is None else getattr(_cache.stats, name)
+    return read
+
+
+metrics.registry.function("pdfclassifier_result_cache_hits_total", "Results answered from the result cache.",
+                          "counter", _cache_stat("hits"))
+metrics.registry.function("pdfclassifier_result_cache_misses_total", "Result cache lookups that missed.",
+                          "counter", _cache_stat("misses"))
+
+
+async def _shared_cache() -> Optional[ResultCache]:
+    if settings.result_cache and _cache is None and settings.result_cache_sqlite_path:
+        # opening the SQLite file purges expired rows, which is blocking I/O
+        return await asyncio.to_thread(get_result_cache)
+    return get_result_cache()
+
+
+def _with_custom_id(result: bytes, uuid: str) -> bytes:
+    document = json.loads(result)
+    if document.get("custom_id") == uuid:
+        return result
+    document["custom_id"] = uuid
+    return json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+async def classify_cached(
+        implementation: BaseClassificationApi,
+        uuid: str,
+        body: PdfBody,
+        body_digest: Optional[str] = None,
+) -> Tuple[bytes, Optional[bool]]:
+    """
+    Classify through the result cache; misses wait for a worker of the cost
+    scheduler (see ``openapi_server.scheduler``) before the implementation runs.
+
+    Returns the JSON result and whether it was a cache hit (None if the cache
+    was bypassed). ``body_digest`` is the hex SHA-256 of ``body`` if already
+    known, e.g. from ``SpooledBody.digest``.
+    """
+    cache = await _shared_cache()
+    key = None
+    if cache is not None:
+        key = implementation.result_cache_key(uuid, body_digest or hashlib.sha256(body).hexdigest())
+    if key is not None:
+        cached = await cache.get_async(key)
+        if cached is not None:
+            # a hit answers like the implementation: invalid requests fail, the uuid is its canonical form
+            custom_id = implementation.validate_cached_request(uuid, body)
+            return _with_custom_id(cached, custom_id), True
+
+    async with scheduler.slot(body):
+        result = await implementation.classify_pdf_async(uuid, body)
+    if not isinstance(result, (bytes, bytearray)):
+        result = result.model_dump_json(by_alias=True).encode("utf-8")
+    result = bytes(result)
+    if key is None:
+        return result, None
+    await cache.put_async(key, result)
+    return result, False
@@ -0,0 +1,258 @@
+# coding: utf-8
+
+"""
+Cost-aware scheduling of classifications: short documents first.
+
+With ``settings.scheduler`` on, ``classify_cached`` runs every classification
+that misses the result cache through ``scheduler.slot``. The slot estimates
+the cost of the document with a ``CostModel`` from its size and page count
+(the ``/Count`` of the page tree, read by ``inspect_pdf`` from the end of the
+body without parsing the rest, in a thread so a slow document never blocks the
+event loop; after ``settings.scheduler_page_count_timeout_ms`` the size alone
+is used) and queues it in the ``small`` or ``large``
+queue, split at ``settings.scheduler_large_cost_ms``. Each queue runs at most
+``settings.scheduler_small_workers`` / ``scheduler_large_workers``
+classifications at a time, so large documents never occupy the workers of
+small ones, and hands free workers to the waiting document with the lowest
+estimate first. Waiting documents age: every second waited takes
+``settings.scheduler_aging_ms_per_s`` off their estimate, so a large
+document is not starved by a stream of smaller ones.
+
+Estimated and actual costs are exported as histograms, and the most recent
+samples are kept so ``GET /api/v1/scheduler`` can fit the model's
+coefficients to them. Queues are per process.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import dataclasses
+import heapq
+import itertools
+import time
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from openapi_server import metrics
+from openapi_server.implementation.pdf_structure import inspect_pdf
+from openapi_server.settings import settings
+
+QUEUES = ("small", "large")
+# milliseconds the page count lookup may take before the size alone is used
+PAGE_COUNT_BUDGET_MS = 5.0
+# page counts read at the same time, off the event loop
+PAGE_COUNT_THREADS = 2
+# (body size, page count, estimated ms, actual ms) samples kept for calibration
+MAX_SAMPLES = 1000
+# actual / estimated cost, from 1/16 to 16
+RATIO_BUCKETS = tuple(2.0 ** exponent for exponent in range(-4, 5))
+
+_MIB = 1024 * 1024
+
+wait_seconds = metrics.registry.histogram(
+    "pdfclassifier_scheduler_wait_seconds", "Time classifications waited for a scheduler worker.", ["queue"])
+estimated_seconds = metrics.registry.histogram(
+    "pdfclassifier_scheduler_estimated_seconds", "Cost of classifications estimated by the cost model.", ["queue"])
+actual_seconds = metrics.registry.histogram(
+    "pdfclassifier_scheduler_actual_seconds", "Time classifications held a scheduler worker.", ["queue"])
+cost_ratio = metrics.registry.histogram(
+    "pdfclassifier_scheduler_cost_ratio", "Actual divided by estimated cost of classifications.", ["queue"],
+    buckets=RATIO_BUCKETS)
+queued = metrics.registry.gauge(
+    "pdfclassifier_scheduler_queued", "Classifications waiting for a scheduler worker.", ["queue"])
+running = metrics.registry.gauge(
+    "pdfclassifier_scheduler_running", "Classifications holding a scheduler worker.", ["queue"])
+
+
+@dataclasses.dataclass(frozen=True)
+class CostModel:
+    """Linear estimate of the milliseconds a classification takes."""
+
+    base_ms: float = 5.0
+    ms_per_mb: float = 10.0
+    ms_per_page: float = 20.0
+    # page count assumed per this many bytes when /Count cannot be read
+    bytes_per_page: int = 100 * 1024
+
+    @classmethod
+    def from_settings(cls) -> "CostModel":
+        return cls(settings.scheduler_cost_base_ms, settings.scheduler_cost_ms_per_mb,
+                   settings.scheduler_cost_ms_per_page, settings.scheduler_bytes_per_page)
+
+    def pages(self, size: int, page_count: Optional[int]) -> int:
+        if page_count is not None:
+            return page_count
+        return max(1, size // max(1, self.bytes_per_page))
+
+    def estimate_ms(self, size: int, page_count: Optional[int]) -> float:
+        return self.base_ms + self.ms_per_mb * size / _MIB + self.ms_per_page * self.pages(size, page_count)
+
+
+_page_count_executor = concurrent.futures.ThreadPoolExecutor(max_workers=PAGE_COUNT_THREADS,
+                                                             thread_name_prefix="page-count")
+
+
+def page_count(body) -> Optional[int]:
+    """The ``/Count`` of the body's page tree, None if it cannot be read within ``PAGE_COUNT_BUDGET_MS``."""
+    try:
+        return inspect_pdf(body, budget_ms=PAGE_COUNT_BUDGET_MS).page_count
+    except Exception:
+        # whatever the body does to the parser, its size still gives an estimate
+        return None
+
+
+async def page_count_async(body) -> Optional[int]:
+    """``page_count`` in a thread, None if it does not answer within ``settings.scheduler_page_count_timeout_ms``."""
+    if bytes(body[:5]) != b"%PDF-":
+        # no header, nothing to count: not worth a trip to the thread
+        return None
+    future = asyncio.get_running_loop().run_in_executor(_page_count_executor, page_count, body)
+    try:
+        # queued behind other page counts included
+        return await asyncio.wait_for(future, settings.scheduler_page_count_timeout_ms / 1000)
+    except asyncio.TimeoutError:
+        # the thread runs on until its budget is spent, the estimate does not wait for it
+        return None
+
+
+def fit_cost_model(samples: List[Tuple[int, Optional[int], float, float]], model: CostModel) -> Optional[CostModel]:
+    """
+    Least-squares fit of ``base_ms``, ``ms_per_mb`` and ``ms_per_page`` to the
+    actual costs of ``samples``; None if they do not determine all three.
+    """
+    rows = [(1.0, size / _MIB, float(model.pages(size, pages)), actual)
+            for size, pages, _, actual in samples]
+    # normal equations A^T A x = A^T y, solved by Gaussian elimination
+    matrix = [[sum(row[i] * row[j] for row in rows) for j in range(3)] + [sum(row[i] * row[3] for row in rows)]
+              for i in range(3)]
+    for column in range(3):
+        pivot = max(range(column, 3), key=lambda r: abs(matrix[r][column]))
+        if abs(matrix[pivot][column]) < 1e-9:
+            return None
+        matrix[column], matrix[pivot] = matrix[pivot], matrix[column]
+        for r in range(3):
+            if r != column:
+                factor = matrix[r][column] / matrix[column][column]
+                matrix[r] = [a - factor * b for a, b in zip(matrix[r], matrix[column])]
+    base_ms, ms_per_mb, ms_per_page = (matrix[i][3] / matrix[i][i] for i in range(3))
+    return dataclasses.replace(model, base_ms=base_ms, ms_per_mb=ms_per_mb, ms_per_page=ms_per_page)
+
+
+class _Queue:
+    __slots__ = ("name", "running", "waiting")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.running = 0
+        # (priority, sequence, future) of waiting classifications, see CostScheduler._acquire
+        self.waiting: List[Tuple[float, int, asyncio.Future]] = []
+
+    def limit(self) -> int:
+        return getattr(settings, f"scheduler_{self.name}_workers")
+
+    def has_room(self) -> bool:
+        limit = self.limit()
+        return limit <= 0 or self.running < limit
+
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self.waiting if not future.done())
+
+
+class CostScheduler:
+    """Shortest-estimated-job-first queues in front of the implementation."""
+
+    def __init__(self):
+        self.samples: Deque[Tuple[int, Optional[int], float, float]] = collections.deque(maxlen=MAX_SAMPLES)
+        self._sequence = itertools.count()
+        self._queues: Dict[str, _Queue] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _queue(self, name: str) -> _Queue:
+        # waiters are futures of one event loop, a new loop starts with fresh queues
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._queues, self._loop = {queue: _Queue(queue) for queue in QUEUES}, loop
+        return self._queues[name]
+
+    @staticmethod
+    def queue_name(estimate_ms: float) -> str:
+        return "large" if estimate_ms >= settings.scheduler_large_cost_ms else "small"
+
+    @contextlib.asynccontextmanager
+    async def slot(self, body) -> AsyncIterator[None]:
+        """Wait for a worker of the body's queue, if scheduling is on, and hold it."""
+        if not settings.scheduler:
+            yield
+            return
+        model = CostModel.from_settings()
+        size = len(body)
+        pages = await page_count_async(body)
+        estimate_ms = model.estimate_ms(size, pages)
+        queue = self._queue(self.queue_name(estimate_ms))
+
+        waited_since = time.perf_counter()
+        await self._acquire(queue, estimate_ms)
+        started = time.perf_counter()
+        wait_seconds.labels(queue.name).observe(started - waited_since)
+        try:
+            yield
+        finally:
+            actual_ms = (time.perf_counter() - started) * 1000
+            self._release(queue)
+            self.samples.append((size, pages, estimate_ms, actual_ms))
+            estimated_seconds.labels(queue.name).observe(estimate_ms / 1000)
+            actual_seconds.labels(queue.name).observe(actual_ms / 1000)
+            if estimate_ms > 0:
+                cost_ratio.labels(queue.name).observe(actual_ms / estimate_ms)
+
+    async def _acquire(self, queue: _Queue, estimate_ms: float):
+        if queue.has_room() and not queue.queued():
+            self._started(queue)
+            return
+        # the estimate minus the credit for waiting until now is this minus the same
+        # amount for everyone, so the order of the heap stays valid as time passes
+        priority = estimate_ms + settings.scheduler_aging_ms_per_s * time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(queue.waiting, (priority, next(self._sequence), future))
+        queued.labels(queue.name).inc()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # handed a worker while being cancelled, pass it on
+                self._release(queue)
+            else:
+                queued.labels(queue.name).dec()
+            raise
+
+    def _started(self, queue: _Queue):
+        queue.running += 1
+        running.labels(queue.name).inc()
+
+    def _release(self, queue: _Queue):
+        queue.running -= 1
+        running.labels(queue.name).dec()
+        while queue.waiting and queue.has_room():
+            _, _, future = heapq.heappop(queue.waiting)
+            if future.done():
+                continue
+            queued.labels(queue.name).dec()
+            self._started(queue)
+            future.set_result(None)
+
+    def snapshot(self) -> dict:
+        model = CostModel.from_settings()
+        fitted = fit_cost_model(list(self.samples), model) if self.samples else None
+        return {
+            "enabled": settings.scheduler,
+            "queues": {name: {"limit": getattr(settings, f"scheduler_{name}_workers"),
+                              "running": self._queues[name].running if name in self._queues else 0,
+                              "queued": self._queues[name].queued() if name in self._queues else 0}
+                       for name in QUEUES},
+            "model": dataclasses.asdict(model),
+            "samples": len(self.samples),
+            "fitted": None if fitted is None else dataclasses.asdict(fitted),
+        }
+
+
+scheduler = CostScheduler()
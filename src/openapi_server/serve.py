@@ -0,0 +1,270 @@
+# coding: utf-8
+
+"""
+Multi-process serving: ``python -m openapi_server.serve``.
+
+The parent process imports the application once, lets the implementation
+preload its state (``BaseClassificationApi.preload``, the compiled mock table
+of the mock implementation), binds the listening socket and forks the
+workers, each running uvicorn on the shared socket. All of that is shared
+with the workers copy-on-write; ``gc.freeze`` keeps the garbage collector
+from touching, and so copying, those pages.
+
+The parent replaces workers that exit and handles signals:
+
+* ``SIGHUP`` restarts the workers one at a time: a new worker is started and
+  has to finish its startup before an old one is stopped, so the service
+  keeps answering throughout.
+* ``SIGTERM`` / ``SIGINT`` stop all workers gracefully, each gets
+  ``settings.worker_graceful_timeout`` seconds to finish its requests.
+
+Workers share their state through ``settings.shared_state_dir`` (a temporary
+directory unless configured): metrics are aggregated over all workers, the
+result cache gets a SQLite tier there and jobs are kept in a SQLite store,
+see ``Settings.share_state``.
+"""
+
+import argparse
+import gc
+import logging
+import os
+import select
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+
+from openapi_server.settings import ENV_PREFIX, settings
+from openapi_server.structured_logging import configure_logging, stop_logging
+
+# not __name__, which is "__main__" when run with -m
+logger = logging.getLogger("openapi_server.serve")
+
+
+class WorkerServer(uvicorn.Server):
+    """uvicorn server of one worker, telling the parent through a pipe once it has started."""
+
+    def __init__(self, config: uvicorn.Config, ready_fd: int):
+        super().__init__(config)
+        self.ready_fd = ready_fd
+
+    async def startup(self, sockets: Optional[List[socket.socket]] = None):
+        await super().startup(sockets)
+        if not self.should_exit:
+            os.write(self.ready_fd, b"1")
+        os.close(self.ready_fd)
+
+
+class Worker:
+
+    def __init__(self, pid: int, ready_fd: int):
+        self.pid = pid
+        self.ready_fd = ready_fd
+        self.started_at = time.monotonic()
+        self.ready = False
+
+    def wait_ready(self, timeout: float) -> bool:
+        """Wait until the worker has started; False if it exited or the timeout passed first."""
+        if not self.ready and self.ready_fd >= 0:
+            readable, _, _ = select.select([self.ready_fd], [], [], timeout)
+            if readable:
+                self.ready = os.read(self.ready_fd, 1) == b"1"
+                self.close()
+        return self.ready
+
+    def close(self):
+        if self.ready_fd >= 0:
+            os.close(self.ready_fd)
+            self.ready_fd = -1
+
+
+class Arbiter:
+    """The parent process: forks the workers, replaces exited ones and restarts them on ``SIGHUP``."""
+
+    # seconds between checks of the workers
+    TICK = 0.2
+    # workers exiting within this many seconds of their start are respawned with a delay
+    MIN_UPTIME = 1.0
+
+    def __init__(self, app, sock: socket.socket, workers: int, graceful_timeout: float):
+        self.app = app
+        self.sock = sock
+        self.worker_count = workers
+        self.graceful_timeout = graceful_timeout
+        self.workers: Dict[int, Worker] = {}
+        self._signals: List[int] = []
+        self._respawn_at = 0.0
+
+    def run(self):
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, self._on_signal)
+        for _ in range(self.worker_count):
+            self.spawn()
+        logger.info("Serving on %s with %d workers", self.sock.getsockname(), self.worker_count)
+        while True:
+            self.reap()
+            while self._signals:
+                signum = self._signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.rolling_restart()
+                else:
+                    self.stop()
+                    return
+            if len(self.workers) < self.worker_count and time.monotonic() >= self._respawn_at:
+                self.spawn()
+            time.sleep(self.TICK)
+
+    def _on_signal(self, signum, frame):
+        self._signals.append(signum)
+
+    def spawn(self) -> Worker:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            self._run_worker(write_fd)
+        os.close(write_fd)
+        worker = Worker(pid, read_fd)
+        self.workers[pid] = worker
+        return worker
+
+    def _run_worker(self, ready_fd: int):
+        status = 1
+        try:
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, signal.SIG_DFL)
+            # the parent handles SIGHUP, e.g. when the terminal sends it to the process group
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            config = uvicorn.Config(self.app, lifespan="on", access_log=False, log_level=settings.log_level.lower(),
+                                    timeout_graceful_shutdown=self.graceful_timeout)
+            WorkerServer(config, ready_fd).run(sockets=[self.sock])
+            status = 0
+        except BaseException:
+            logger.exception("Worker %d failed", os.getpid())
+        finally:
+            stop_logging()
+            os._exit(status)
+
+    def reap(self):
+        """Forget workers that exited; one that exited right after its start delays the next spawn."""
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            worker.close()
+            logger.warning("Worker %d exited with status %d", pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - worker.started_at < self.MIN_UPTIME:
+                self._respawn_at = time.monotonic() + self.MIN_UPTIME
+
+    def rolling_restart(self):
+        """Replace the workers one by one, each only after its replacement has started."""
+        logger.info("Restarting %d workers", len(self.workers))
+        for old in list(self.workers.values()):
+            if any(signum != signal.SIGHUP for signum in self._signals):
+                return
+            new = self.spawn()
+            if not new.wait_ready(self.graceful_timeout):
+                logger.error("Worker %d did not start, keeping the remaining workers", new.pid)
+                self.stop_worker(new)
+                return
+            self.stop_worker(old)
+        self._signals = [signum for signum in self._signals if signum != signal.SIGHUP]
+
+    def stop_worker(self, worker: Worker):
+        """Stop a worker gracefully, killing it if it is still running after the graceful timeout."""
+        self.workers.pop(worker.pid, None)
+        worker.close()
+        try:
+            os.kill(worker.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        # uvicorn waits up to the timeout for open connections, then runs the shutdown
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(worker.pid, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid:
+                return
+            time.sleep(0.05)
+        logger.warning("Worker %d did not stop within %ss, killing it", worker.pid, self.graceful_timeout)
+        os.kill(worker.pid, signal.SIGKILL)
+        os.waitpid(worker.pid, 0)
+
+    def stop(self):
+        logger.info("Stopping %d workers", len(self.workers))
+        workers = list(self.workers.values())
+        for worker in workers:
+            try:
+                os.kill(worker.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for worker in workers:
+            self.stop_worker(worker)
+
+
+def bind(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m openapi_server.serve",
+                                     description="Serve the PDF classifier with several worker processes.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=settings.workers,
+                        help="worker processes, 0 starts one per CPU (PDFCLASSIFIER_WORKERS)")
+    parser.add_argument("--graceful-timeout", type=float, default=settings.worker_graceful_timeout,
+                        help="seconds a stopping worker gets to finish (PDFCLASSIFIER_WORKER_GRACEFUL_TIMEOUT)")
+    parser.add_argument("--shared-state-dir", default=settings.shared_state_dir,
+                        help="directory the workers share state through (PDFCLASSIFIER_SHARED_STATE_DIR)")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    directory = args.shared_state_dir
+    temporary = directory is None
+    if temporary:
+        directory = tempfile.mkdtemp(prefix="pdfclassifier-")
+    # metrics of an earlier run must not be summed into this one
+    shutil.rmtree(os.path.join(directory, "metrics"), ignore_errors=True)
+    settings.share_state(directory)
+    # for processes that read the environment rather than inherit the settings
+    os.environ[ENV_PREFIX + "SHARED_STATE_DIR"] = directory
+
+    # preload: whatever the import and the implementation build is shared copy-on-write with the workers
+    from openapi_server.apis.classification_api_base import BaseClassificationApi
+    from openapi_server.main import app
+    BaseClassificationApi.find_implementation(settings.implementation).preload()
+    gc.collect()
+    gc.freeze()
+
+    sock = bind(args.host, args.port)
+    try:
+        Arbiter(app, sock, args.workers or os.cpu_count() or 1, args.graceful_timeout).run()
+    finally:
+        sock.close()
+        if temporary:
+            shutil.rmtree(directory, ignore_errors=True)
+        stop_logging()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+# coding: utf-8
+
+"""
+Runtime configuration of the PDF classifier service.
+
+All values are read from environment variables prefixed with
+``PDFCLASSIFIER_`` once at import time. The resulting ``settings`` object is
+a plain mutable dataclass, so tests and operators can tune values at runtime
+by assigning attributes.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Mapping, Optional
+
+ENV_PREFIX = "PDFCLASSIFIER_"
+
+
+def _env(environ: Mapping[str, str], name: str) -> Optional[str]:
+    value = environ.get(ENV_PREFIX + name)
+    if value is None or value.strip() == "":
+        return None
+    return value.strip()
+
+
+def _env_int(environ: Mapping[str, str], name: str, default: int) -> int:
+    value = _env(environ, name)
+    return default if value is None else int(value)
+
+
+def _env_float(environ: Mapping[str, str], name: str, default: float) -> float:
+    value = _env(environ, name)
+    return default if value is None else float(value)
+
+
+def _env_bool(environ: Mapping[str, str], name: str, default: bool) -> bool:
+    value = _env(environ, name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+@dataclass
+class Settings:
+    # --- request body ingestion ---
+    # read uploads chunk-wise from the ASGI stream instead of buffering them
+    stream_body: bool = True
+    # bodies up to this size are kept in memory, larger ones are spooled to disk
+    body_spool_threshold: int = 8 * 1024 * 1024
+    # uploads larger than this are rejected with 413
+    body_max_size: int = 512 * 1024 * 1024
+    # directory for spooled bodies, None uses the system temp dir
+    body_spool_dir: Optional[str] = None
+
+    # --- PDF validation ---
+    # "header" only checks the %PDF- header; "structure" also parses the
+    # trailer, cross-reference sections and page tree from the end of the body
+    pdf_validation: str = "header"
+    # milliseconds of wall and CPU time the structure validation may take per document
+    pdf_validation_budget_ms: int = 50
+    # reject encrypted documents when validating the structure
+    pdf_reject_encrypted: bool = True
+
+    # --- implementation ---
+    # implementation_name (or class name) of the BaseClassificationApi subclass
+    # to serve, None picks the first registered one
+    implementation: Optional[str] = None
+
+    # --- proxy implementation (PDFCLASSIFIER_IMPLEMENTATION=proxy) ---
+    # base URL of the upstream classifier API, e.g. http://classifier:8080/api/v1
+    proxy_upstream_url: Optional[str] = None
+    # negotiate HTTP/2 with the upstream, needs the h2 package (httpx[http2])
+    proxy_http2: bool = False
+    # connections to the upstream, and how many of them are kept alive when idle
+    proxy_max_connections: int = 100
+    proxy_max_keepalive: int = 20
+    # seconds an idle keep-alive connection is kept
+    proxy_keepalive_expiry: float = 30.0
+    # seconds to connect, and to wait for the upstream per attempt
+    proxy_connect_timeout: float = 5.0
+    proxy_timeout: float = 30.0
+    # attempts after the first on connection errors, timeouts and 429/502/503/504
+    proxy_retries: int = 2
+    # base of the jittered exponential backoff between attempts
+    proxy_retry_backoff_ms: float = 100.0
+    # consecutive failures that open the circuit, and seconds it stays open
+    proxy_breaker_failures: int = 5
+    proxy_breaker_reset: float = 10.0
+    # milliseconds after which an unanswered request is sent again, 0 disables hedging
+    proxy_hedge_after_ms: float = 0.0
+
+    # --- mock responses ---
+    # seed for deterministic corruption: identical (seed, uuid) requests get
+    # byte-identical responses; None corrupts randomly
+    corruption_seed: Optional[str] = None
+    # simulated latency profile, e.g. "fixed:200" or "spike:base=20,p99=2000",
+    # see openapi_server.implementation.latency; None answers immediately
+    latency_profile: Optional[str] = None
+    # per-UUID-suffix latency profiles, "suffix=profile;suffix=profile"
+    latency_suffix_profiles: Optional[str] = None
+    # requests the simulated backend handles at a time, 0 is unlimited
+    latency_slots: int = 0
+    # CSV, JSON or SQLite file of the response rules, see
+    # openapi_server.implementation.mock_table; None uses the packaged table
+    mock_table_path: Optional[str] = None
+    # seconds between checks of the table file for changes, 0 disables reloading
+    mock_table_reload_interval: float = 2.0
+
+    # --- result cache ---
+    # answer resubmitted documents from a cache keyed by the body's SHA-256
+    result_cache: bool = False
+    # bounds of the in-memory LRU tier
+    result_cache_max_entries: int = 10000
+    result_cache_max_bytes: int = 64 * 1024 * 1024
+    # seconds a cached result is reused
+    result_cache_ttl: int = 3600
+    # SQLite file of the on-disk tier, None keeps the cache in memory only
+    result_cache_sqlite_path: Optional[str] = None
+
+    # --- admission control ---
+    # uploads (POST requests) handled at a time, further ones get 503; 0 is unlimited
+    admission_max_in_flight: int = 0
+    # sum of the Content-Length of uploads being handled beyond which new ones
+    # get 503; 0 is unlimited
+    admission_max_queued_bytes: int = 0
+    # uploads per second per client before 429; 0 disables the rate limit
+    admission_client_rate: float = 0.0
+    # uploads a client may send at once on top of the rate, 0 uses the rate
+    admission_client_burst: int = 0
+    # header identifying a client (an API key), the client IP without it
+    admission_client_header: str = "X-API-Key"
+    # Retry-After seconds of uploads rejected for overload
+    admission_retry_after: int = 1
+
+    # --- scheduling ---
+    # queue classifications by estimated cost, see openapi_server.scheduler
+    scheduler: bool = False
+    # classifications of each queue run at a time, 0 is unlimited
+    scheduler_small_workers: int = 8
+    scheduler_large_workers: int = 2
+    # estimated milliseconds from which a document goes to the large queue
+    scheduler_large_cost_ms: float = 1000.0
+    # milliseconds taken off a waiting document's estimate per second it waits
+    scheduler_aging_ms_per_s: float = 1000.0
+    # cost model: base_ms + ms_per_mb * MiB + ms_per_page * pages
+    scheduler_cost_base_ms: float = 5.0
+    scheduler_cost_ms_per_mb: float = 10.0
+    scheduler_cost_ms_per_page: float = 20.0
+    # bytes per page assumed when the page count cannot be read
+    scheduler_bytes_per_page: int = 100 * 1024
+    # milliseconds a classification waits for its page count before the size alone is used
+    scheduler_page_count_timeout_ms: float = 100.0
+
+    # --- batch classification ---
+    # documents of one batch request classified concurrently
+    batch_concurrency: int = 8
+    # maximum number of documents in a multipart batch request
+    batch_max_items: int = 1000
+
+    # --- asynchronous jobs ---
+    # worker tasks classifying queued jobs
+    jobs_workers: int = 4
+    # queued jobs beyond which submissions are rejected with 429
+    jobs_queue_depth: int = 100
+    # seconds a finished job stays retrievable
+    jobs_ttl: int = 3600
+    # "memory" or "sqlite": where jobs are kept
+    jobs_store: str = "memory"
+    # database file of the sqlite job store
+    jobs_sqlite_path: str = "jobs.sqlite3"
+    # upper bound in seconds for the long-poll ``wait`` parameter
+    jobs_max_wait: int = 30
+    # timeout in seconds of a single webhook callback attempt
+    jobs_callback_timeout: int = 10
+    # comma-separated hosts callbacks may go to: "host", "host:port" or "*.domain"; empty allows none
+    jobs_callback_allowlist: str = ""
+
+    # --- logging ---
+    # level of the openapi_server loggers
+    log_level: str = "INFO"
+    # one JSON object per record; false writes plain text lines
+    log_json: bool = True
+    # share of requests whose access record and info/debug records are logged
+    log_sample_rate: float = 1.0
+    # per-route overrides of log_sample_rate, "route=rate;route=rate" with
+    # route templates such as /api/v1/classify/{uuid}
+    log_route_sample_rates: Optional[str] = None
+
+    # --- serving (python -m openapi_server.serve) ---
+    # worker processes, 0 starts one per CPU
+    workers: int = 0
+    # seconds a stopping worker gets to finish its requests before it is killed
+    worker_graceful_timeout: int = 30
+    # directory through which the workers share metrics, the result cache and
+    # jobs; None lets the serving process create a temporary one
+    shared_state_dir: Optional[str] = None
+
+    # --- execution of synchronous implementations ---
+    # "thread" or "process": where sync classify_pdf implementations are run
+    executor_kind: str = "thread"
+    # size of the executor, 0 picks a default based on the CPU count
+    executor_workers: int = 0
+
+    def share_state(self, directory: str):
+        """
+        Keep the state workers have to agree on in ``directory``.
+
+        The result cache gets a SQLite tier there unless one is configured,
+        and an in-memory job store, which other workers cannot see, is
+        replaced by a SQLite one.
+        """
+        self.shared_state_dir = directory
+        if self.result_cache_sqlite_path is None:
+            self.result_cache_sqlite_path = os.path.join(directory, "result_cache.sqlite3")
+        if self.jobs_store == "memory":
+            self.jobs_store = "sqlite"
+            self.jobs_sqlite_path = os.path.join(directory, "jobs.sqlite3")
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "Settings":
+        """Create the settings from ``PDFCLASSIFIER_*`` environment variables."""
+        defaults = cls()
+        settings = cls(
+            stream_body=_env_bool(environ, "STREAM_BODY", defaults.stream_body),
+            body_spool_threshold=_env_int(environ, "BODY_SPOOL_THRESHOLD", defaults.body_spool_threshold),
+            body_max_size=_env_int(environ, "BODY_MAX_SIZE", defaults.body_max_size),
+            body_spool_dir=_env(environ, "BODY_SPOOL_DIR"),
+            pdf_validation=_env(environ, "PDF_VALIDATION") or defaults.pdf_validation,
+            pdf_validation_budget_ms=_env_int(environ, "PDF_VALIDATION_BUDGET_MS", defaults.pdf_validation_budget_ms),
+            pdf_reject_encrypted=_env_bool(environ, "PDF_REJECT_ENCRYPTED", defaults.pdf_reject_encrypted),
+            implementation=_env(environ, "IMPLEMENTATION"),
+            proxy_upstream_url=_env(environ, "PROXY_UPSTREAM_URL"),
+            proxy_http2=_env_bool(environ, "PROXY_HTTP2", defaults.proxy_http2),
+            proxy_max_connections=_env_int(environ, "PROXY_MAX_CONNECTIONS", defaults.proxy_max_connections),
+            proxy_max_keepalive=_env_int(environ, "PROXY_MAX_KEEPALIVE", defaults.proxy_max_keepalive),
+            proxy_keepalive_expiry=_env_float(environ, "PROXY_KEEPALIVE_EXPIRY", defaults.proxy_keepalive_expiry),
+            proxy_connect_timeout=_env_float(environ, "PROXY_CONNECT_TIMEOUT", defaults.proxy_connect_timeout),
+            proxy_timeout=_env_float(environ, "PROXY_TIMEOUT", defaults.proxy_timeout),
+            proxy_retries=_env_int(environ, "PROXY_RETRIES", defaults.proxy_retries),
+            proxy_retry_backoff_ms=_env_float(environ, "PROXY_RETRY_BACKOFF_MS", defaults.proxy_retry_backoff_ms),
+            proxy_breaker_failures=_env_int(environ, "PROXY_BREAKER_FAILURES", defaults.proxy_breaker_failures),
+            proxy_breaker_reset=_env_float(environ, "PROXY_BREAKER_RESET", defaults.proxy_breaker_reset),
+            proxy_hedge_after_ms=_env_float(environ, "PROXY_HEDGE_AFTER_MS", defaults.proxy_hedge_after_ms),
+            corruption_seed=_env(environ, "CORRUPTION_SEED"),
+            latency_profile=_env(environ, "LATENCY_PROFILE"),
+            latency_suffix_profiles=_env(environ, "LATENCY_SUFFIX_PROFILES"),
+            latency_slots=_env_int(environ, "LATENCY_SLOTS", defaults.latency_slots),
+            mock_table_path=_env(environ, "MOCK_TABLE_PATH"),
+            mock_table_reload_interval=_env_float(environ, "MOCK_TABLE_RELOAD_INTERVAL",
+                                                  defaults.mock_table_reload_interval),
+            result_cache=_env_bool(environ, "RESULT_CACHE", defaults.result_cache),
+            result_cache_max_entries=_env_int(environ, "RESULT_CACHE_MAX_ENTRIES", defaults.result_cache_max_entries),
+            result_cache_max_bytes=_env_int(environ, "RESULT_CACHE_MAX_BYTES", defaults.result_cache_max_bytes),
+            result_cache_ttl=_env_int(environ, "RESULT_CACHE_TTL", defaults.result_cache_ttl),
+            result_cache_sqlite_path=_env(environ, "RESULT_CACHE_SQLITE_PATH"),
+            admission_max_in_flight=_env_int(environ, "ADMISSION_MAX_IN_FLIGHT", defaults.admission_max_in_flight),
+            admission_max_queued_bytes=_env_int(environ, "ADMISSION_MAX_QUEUED_BYTES",
+                                                defaults.admission_max_queued_bytes),
+            admission_client_rate=_env_float(environ, "ADMISSION_CLIENT_RATE", defaults.admission_client_rate),
+            admission_client_burst=_env_int(environ, "ADMISSION_CLIENT_BURST", defaults.admission_client_burst),
+            admission_client_header=_env(environ, "ADMISSION_CLIENT_HEADER") or defaults.admission_client_header,
+            admission_retry_after=_env_int(environ, "ADMISSION_RETRY_AFTER", defaults.admission_retry_after),
+            scheduler=_env_bool(environ, "SCHEDULER", defaults.scheduler),
+            scheduler_small_workers=_env_int(environ, "SCHEDULER_SMALL_WORKERS", defaults.scheduler_small_workers),
+            scheduler_large_workers=_env_int(environ, "SCHEDULER_LARGE_WORKERS", defaults.scheduler_large_workers),
+            scheduler_large_cost_ms=_env_float(environ, "SCHEDULER_LARGE_COST_MS", defaults.scheduler_large_cost_ms),
+            scheduler_aging_ms_per_s=_env_float(environ, "SCHEDULER_AGING_MS_PER_S",
+                                                defaults.scheduler_aging_ms_per_s),
+            scheduler_cost_base_ms=_env_float(environ, "SCHEDULER_COST_BASE_MS", defaults.scheduler_cost_base_ms),
+            scheduler_cost_ms_per_mb=_env_float(environ, "SCHEDULER_COST_MS_PER_MB",
+                                                defaults.scheduler_cost_ms_per_mb),
+            scheduler_cost_ms_per_page=_env_float(environ, "SCHEDULER_COST_MS_PER_PAGE",
+                                                  defaults.scheduler_cost_ms_per_page),
+            scheduler_bytes_per_page=_env_int(environ, "SCHEDULER_BYTES_PER_PAGE", defaults.scheduler_bytes_per_page),
+            scheduler_page_count_timeout_ms=_env_float(environ, "SCHEDULER_PAGE_COUNT_TIMEOUT_MS",
+                                                       defaults.scheduler_page_count_timeout_ms),
+            batch_concurrency=_env_int(environ, "BATCH_CONCURRENCY", defaults.batch_concurrency),
+            batch_max_items=_env_int(environ, "BATCH_MAX_ITEMS", defaults.batch_max_items),
+            jobs_workers=_env_int(environ, "JOBS_WORKERS", defaults.jobs_workers),
+            jobs_queue_depth=_env_int(environ, "JOBS_QUEUE_DEPTH", defaults.jobs_queue_depth),
+            jobs_ttl=_env_int(environ, "JOBS_TTL", defaults.jobs_ttl),
+            jobs_store=_env(environ, "JOBS_STORE") or defaults.jobs_store,
+            jobs_sqlite_path=_env(environ, "JOBS_SQLITE_PATH") or defaults.jobs_sqlite_path,
+            jobs_max_wait=_env_int(environ, "JOBS_MAX_WAIT", defaults.jobs_max_wait),
+            jobs_callback_timeout=_env_int(environ, "JOBS_CALLBACK_TIMEOUT", defaults.jobs_callback_timeout),
+            jobs_callback_allowlist=_env(environ, "JOBS_CALLBACK_ALLOWLIST") or defaults.jobs_callback_allowlist,
+            log_level=_env(environ, "LOG_LEVEL") or defaults.log_level,
+            log_json=_env_bool(environ, "LOG_JSON", defaults.log_json),
+            log_sample_rate=_env_float(environ, "LOG_SAMPLE_RATE", defaults.log_sample_rate),
+            log_route_sample_rates=_env(environ, "LOG_ROUTE_SAMPLE_RATES"),
+            workers=_env_int(environ, "WORKERS", defaults.workers),
+            worker_graceful_timeout=_env_int(environ, "WORKER_GRACEFUL_TIMEOUT", defaults.worker_graceful_timeout),
+            shared_state_dir=_env(environ, "SHARED_STATE_DIR"),
+            executor_kind=_env(environ, "EXECUTOR_KIND") or defaults.executor_kind,
+            executor_workers=_env_int(environ, "EXECUTOR_WORKERS", defaults.executor_workers),
+        )
+        if settings.shared_state_dir:
+            settings.share_state(settings.shared_state_dir)
+        return settings
+
+
+settings = Settings.from_env()
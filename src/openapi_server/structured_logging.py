@@ -0,0 +1,265 @@
+# coding: utf-8
+
+"""
+Structured, sampled, non-blocking logging.
+
+Records of the ``openapi_server`` loggers are put on an in-memory queue by a
+``QueueHandler`` and written as one JSON object per line by a
+``QueueListener`` thread, so a request never waits for stdout. Each record
+carries the ``correlation_id`` of its request, which is the uuid from the
+path (or an ``X-Correlation-Id`` header, or a generated id); batch items and
+jobs carry their own uuid.
+
+``AccessLogMiddleware`` writes one consolidated access record per request
+with method, route, status, sizes and duration. Requests are sampled per
+route (``settings.log_sample_rate`` and ``settings.log_route_sample_rates``);
+for an unsampled request only warnings and errors are written, and failed
+requests (status >= 500) always get their access record.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid as uuid_lib
+from functools import lru_cache
+from typing import Dict, Optional, TextIO
+
+from openapi_server import request_context
+from openapi_server.metrics import route_template
+from openapi_server.settings import settings
+
+LOGGER_NAME = "openapi_server"
+access_logger = logging.getLogger(LOGGER_NAME + ".access")
+
+# attributes every LogRecord has; anything else was passed with ``extra=``
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including the fields passed with ``extra=``."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        document = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                document[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            document["exception"] = record.exc_text
+        return json.dumps(document, ensure_ascii=False, default=str)
+
+
+class RequestLog:
+    """
+    Logging state of one HTTP request, bound by ``AccessLogMiddleware``.
+
+    The route template and path parameters are only known once the request is
+    routed, so the correlation id and the sampling decision are resolved on
+    first use after routing. A copy sent to an executor process carries the
+    resolved values only.
+    """
+
+    __slots__ = ("scope", "_correlation_id", "_sampled")
+
+    def __init__(self, scope=None, correlation_id: Optional[str] = None, sampled: Optional[bool] = None):
+        self.scope = scope
+        self._correlation_id = correlation_id
+        self._sampled = sampled
+
+    def __reduce__(self):
+        return RequestLog, (None, self.correlation_id, self.sampled)
+
+    @property
+    def route(self) -> Optional[str]:
+        """The path with its parameters replaced by ``{name}``, None before routing."""
+        return None if self.scope is None else route_template(self.scope)
+
+    @property
+    def correlation_id(self) -> str:
+        if self._correlation_id is None:
+            correlation_id = (self.scope or {}).get("path_params", {}).get("uuid")
+            if correlation_id is None:
+                headers = dict((self.scope or {}).get("headers") or ())
+                correlation_id = headers.get(b"x-correlation-id", b"").decode("latin-1") or None
+            if correlation_id is None:
+                correlation_id = uuid_lib.uuid4().hex
+            elif self.route is None:
+                # a path uuid may still turn up once the request is routed
+                return correlation_id
+            self._correlation_id = correlation_id
+        return self._correlation_id
+
+    @property
+    def sampled(self) -> bool:
+        if self._sampled is None:
+            route = self.route
+            if route is None:
+                return True
+            self._sampled = random.random() < sample_rate(route)
+        return self._sampled
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the correlation id of the current request; drop low-level records of unsampled requests."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = request_context.current()
+        request_log = context.request_log
+        if (request_log is not None and record.levelno < logging.WARNING and record.name != access_logger.name
+                and not request_log.sampled):
+            return False
+        if not hasattr(record, "correlation_id"):
+            correlation_id = context.correlation_id
+            if correlation_id is None and request_log is not None:
+                correlation_id = request_log.correlation_id
+            if correlation_id is not None:
+                record.correlation_id = correlation_id
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    ``QueueHandler`` that leaves the formatting to the listener thread.
+
+    Forked processes (e.g. the process executor) inherit the handler but not
+    the listener thread; they write through the target handlers directly.
+    """
+
+    def __init__(self, record_queue, listener_pid: int, handlers):
+        super().__init__(record_queue)
+        self.listener_pid = listener_pid
+        self.handlers = handlers
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # render what depends on the live objects here, the JSON in the listener
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record: logging.LogRecord):
+        if os.getpid() == self.listener_pid:
+            super().emit(record)
+            return
+        for handler in self.handlers:
+            handler.handle(record)
+
+
+def configure_logging(stream: Optional[TextIO] = None) -> logging.handlers.QueueListener:
+    """Route the ``openapi_server`` loggers through a queue to a JSON stream handler (stdout by default)."""
+    stop_logging()
+    global _listener
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if settings.log_json else logging.Formatter(
+        "%(asctime)s %(levelname)s %(name)s [%(correlation_id)s] %(message)s", defaults={"correlation_id": "-"}))
+
+    record_queue = queue.SimpleQueue()
+    handler = _QueueHandler(record_queue, os.getpid(), [output])
+    handler.addFilter(RequestContextFilter())
+
+    logger = logging.getLogger(LOGGER_NAME)
+    for existing in list(logger.handlers):
+        logger.removeHandler(existing)
+    logger.addHandler(handler)
+    logger.setLevel(settings.log_level.upper())
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(record_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Flush the queue and stop the listener thread."""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+@lru_cache(maxsize=16)
+def parse_route_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse ``route=rate;route=rate``, e.g. ``/api/v1/classify/{uuid}=0.1``."""
+    rates = {}
+    for entry in spec.split(";"):
+        if not entry.strip():
+            continue
+        route, sep, rate = entry.rpartition("=")
+        if not sep:
+            raise ValueError(f"Log sample rate entry '{entry}' must be 'route=rate'")
+        rates[route.strip()] = float(rate)
+    return rates
+
+
+def sample_rate(route: str) -> float:
+    if settings.log_route_sample_rates:
+        rate = parse_route_sample_rates(settings.log_route_sample_rates).get(route)
+        if rate is not None:
+            return rate
+    return settings.log_sample_rate
+
+
+class AccessLogMiddleware:
+    """ASGI middleware writing one access record per HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        response_bytes = 0
+        request_bytes = 0
+
+        async def counting_receive():
+            nonlocal request_bytes
+            message = await receive()
+            request_bytes += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        request_log = RequestLog(scope)
+        with request_context.bind(request_log=request_log):
+            try:
+                await self.app(scope, counting_receive, counting_send)
+            finally:
+                if status >= 500 or request_log.sampled:
+                    access_logger.info(
+                        "%s %s %d", scope["method"], scope["path"], status,
+                        extra={
+                            "correlation_id": request_log.correlation_id,
+                            "method": scope["method"],
+                            "path": scope["path"],
+                            "route": request_log.route or scope["path"],
+                            "status": status,
+                            "request_bytes": request_bytes,
+                            "response_bytes": response_bytes,
+                            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                        },
+                    )
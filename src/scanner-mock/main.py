@@ -1,12 +1,18 @@
+import collections
+import concurrent.futures
 import csv
+import io
 import random
+import re
 import time
 import os
 import uuid
 import argparse
-from io import StringIO
+import asyncio
+import json
 import signal
 import sys
+from typing import NamedTuple
 
 
 # Attempt to import reportlab components.
@@ -28,47 +34,46 @@ except ImportError:
     letter = None
     inch = None
 
-# The CSV data provided by the user, embedded as a multiline string.
-CSV_DATA = """UUID Ending,kind,doc_id_val,doc_id_score,doc_date_sic_val,doc_date_sic_score,doc_date_parsed,doc_subject_val,doc_subject_score
-10,INVOICE,DOC123,0.99,2024-01-01,0.9,2024-01-01T10:00:00Z,KFZ Reparatur,0.8
-11,INVOICE,DOC124,0.89,2025-03-12,0.7,2025-03-12T00:00:00Z,Ihr Einkauf vielen Dank,0.8
-12,INVOICE,DOC125,0.79,2025-03-13,0.6,2025-03-13T00:00:00Z,Ihr Einkauf vielen Dank,0.7
-13,INVOICE,DOC126,0.69,2025-03-13,0.5,2025-03-13T00:00:00Z,Ihr Einkauf vielen Dank,0.6
-14,INVOICE,DOC127,0.59,2025-02-12,0.5,2025-02-12T00:00:00Z,Ihr Einkauf vielen Dank,0.5
-15,INVOICE,DOC128,0.49,2025-01-11,0.4,2025-01-11T00:00:00Z,Ihr Einkauf vielen Dank,0.4
-17,INVOICE,DOC129,0.39,2024-12-10,0.3,2024-12-10T00:00:00Z,Ihr Einkauf vielen Dank,0.3
-18,INVOICE,DOC130,0.29,2024-11-11,0.2,2024-11-11T00:00:00Z,Ihr Einkauf vielen Dank,0.2
-19,INVOICE,DOC131,0.19,2024-10-09,0.1,2024-10-09T00:00:00Z,Ihr Einkauf vielen Dank,0.1
-20,STATEMENT,DE92 1234 5678 9123 87,0.99,2025-04-01,0.9,2025-04-01T00:00:00Z,Kontoauszug 3-25,0.7
-21,STATEMENT,DE92 1234 5678 9123 87,0.89,2025-03-01,0.9,2025-03-01T00:00:00Z,Kontoauszug 2-25,0.7
-22,STATEMENT,DE92 1234 5678 9123 87,0.79,2025-02-01,0.9,2025-02-01T00:00:00Z,Kontoauszug 1-25,0.7
-23,STATEMENT,DE92 1234 5678 9123 87,0.69,2025-01-01,0.9,2025-01-01T00:00:00Z,Kontoauszug 12-24,0.7
-24,STATEMENT,DE92 1234 5678 9123 87,0.59,2024-12-01,0.9,2024-12-01T00:00:00Z,Kontoauszug 11-24,0.7
-25,STATEMENT,DE92 1234 5678 9123 87,0.49,2024-11-01,0.9,2024-11-01T00:00:00Z,Kontoauszug 10-24,0.7
-26,STATEMENT,DE92 1234 5678 9123 87,0.39,2024-10-01,0.9,2024-10-01T00:00:00Z,Kontoauszug 09-24,0.7
-27,STATEMENT,DE92 1234 5678 9123 87,0.29,2024-09-01,0.9,2024-09-01T00:00:00Z,Kontoauszug 08-24,0.7
-28,STATEMENT,DE92 1234 5678 9123 87,0.19,2024-08-01,0.9,2024-08-01T00:00:00Z,Kontoauszug 07-24,0.7
-29,STATEMENT,DE92 1234 5678 9123 87,0.09,2024-07-01,0.9,2024-07-01T00:00:00Z,Kontoauszug 06-24,0.7
-30,LETTER,K7-22389,0.99,2025-04-21,0.99,2025-04-21T00:00:00Z,Versicherungsfall 4711,0.7
-31,LETTER,K7-22389,0.89,2025-04-01,0.89,2025-04-01T00:00:00Z,Versicherungsfall 4711,0.7
-32,LETTER,K7-22389,0.79,2025-03-11,0.79,2025-03-11T00:00:00Z,Beitragsanpassung,0.7
-33,LETTER,B-2025-SSA-KGA,0.69,2025-01-12,0.69,2025-01-12T00:00:00Z,Kindergeld Bertram,0.7
-34,LETTER,Klasse 7b,0.59,2024-12-22,0.59,2024-12-22T00:00:00Z,Einladung zum Elternabend,0.7
-35,LETTER,Wandern,0.49,2024-11-10,0.49,2024-11-10T00:00:00Z,Wanderfreunde Bergisch-Gladbach,0.7
-36,LETTER,Lotto-DE,0.39,2024-10-01,0.39,2024-10-01T00:00:00Z,Hxx-123-so-aaaayxy,0.2
-37,LETTER,,0.29,2024-09-01,0.29,2024-09-01T00:00:00Z,,0.0
-38,LETTER,,0.19,2024-08-01,0.19,2024-08-01T00:00:00Z,,0.0
-39,LETTER,,0.09,2024-07-01,0.09,2024-07-01T00:00:00Z,,0.0
-"""
-
-
-def load_data():
-    """Loads the CSV data from the string into a list of dictionaries."""
-    # Use StringIO to treat the string data as a file
-    f = StringIO(CSV_DATA)
-    reader = csv.DictReader(f)
-    data = list(reader)
-    return data
+# httpx is only needed to upload documents in push mode.
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# The response table of the classifier mock, shared with it so the generated
+# documents match the configured responses. In the image it is copied next to
+# this script, in the source tree it is read from the openapi_server package.
+_HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_PATH = next(
+    (path for path in (os.path.join(_HERE, "mock_responses.csv"),
+                       os.path.join(_HERE, "..", "openapi_server", "implementation", "mock_responses.csv"))
+     if os.path.exists(path)),
+    os.path.join(_HERE, "mock_responses.csv"))
+
+
+def load_data(path=DEFAULT_DATA_PATH):
+    """Loads the rows of the response table CSV into a list of dictionaries.
+
+    Regex rules are skipped, no UUID can be derived from them.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        return [row for row in reader if (row.get("match") or "suffix") != "regex"]
+
+
+def generate_uuid_for_row(data_row):
+    """A UUID the row's rule matches: the exact UUID, or a random one with the rule's prefix or suffix."""
+    match = data_row.get("match") or "suffix"
+    pattern = data_row.get("pattern") or data_row.get("UUID Ending")
+    if not pattern:  # Handle cases where the pattern might be missing or empty for a row
+        print("Warning: Row found with missing or empty 'UUID Ending'. Using a generic suffix.")
+        pattern = "unknown_id"
+    if match == "exact":
+        return pattern
+    if match == "prefix":
+        base_uuid = str(uuid.uuid4())
+        return pattern + base_uuid[len(pattern):]
+    return generate_uuid_ending_with(pattern)
 
 
 def generate_uuid_ending_with(suffix_str):
@@ -99,74 +104,363 @@ def generate_uuid_ending_with(suffix_str):
     return new_uuid_str
 
 
-def create_output_file(data_row, output_filepath):
+def scan_fields(uuid_str):
+    """The per-document fields of a scan: its UUID, the scan time and the PDF file ID."""
+    return {
+        "uuid": uuid_str,
+        "scanned": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "id": uuid.UUID(uuid_str).hex if len(uuid_str) == 36 else uuid.uuid4().hex,
+    }
+
+
+def document_lines(data_row, fields):
+    """The text lines of the document for a row of the CSV data and the per-document fields."""
+    lines = [f"uuid: {fields['uuid']}", f"scanned: {fields['scanned']}"]
+    return lines + [f"{key}: {value}" for key, value in data_row.items()]
+
+
+def render_pdf(content_lines, file_id=None):
+    """Renders the lines onto an A4 page and returns the PDF as bytes, with file_id (32 hex digits) as its /ID."""
+    buffer = io.BytesIO()
+    # uncompressed, so the text can be patched in the rendered bytes; invariant fixes /ID and the dates
+    c = rl_canvas.Canvas(buffer, pagesize=A4, pageCompression=0, invariant=file_id is not None)
+    textobject = c.beginText()
+    textobject.setFont("Helvetica", 10)  # Basic font
+    # Set text origin (x, y) from bottom-left of the page
+    textobject.setTextOrigin(inch, 10.5 * inch)  # Start 1 inch from left, 10.5 inches from bottom
+
+    for line in content_lines:
+        textobject.textLine(line)  # Adds a line and moves to the next
+
+    c.drawText(textobject)
+    c.save()
+    content = buffer.getvalue()
+    if file_id is not None:
+        content = _PDF_ID.sub(b"/ID [<%s><%s>]" % (file_id.encode(), file_id.encode()), content, count=1)
+    return content
+
+
+def render_txt(content_lines):
+    """Renders the lines as the text fallback and returns it as bytes."""
+    text = "--- TEXT FALLBACK (reportlab not available or PDF creation failed) ---\n"
+    return (text + "".join(line + "\n" for line in content_lines)).encode("utf-8")
+
+
+def render_document(data_row, fields):
+    """
+    Renders the document for a row: a PDF if reportlab is available, otherwise
+    the text fallback.
+
+    Returns:
+        tuple: (content bytes, file extension ".pdf" or ".txt")
+    """
+    content_lines = document_lines(data_row, fields)
+    if REPORTLAB_AVAILABLE:
+        try:
+            return render_pdf(content_lines, fields["id"]), ".pdf"
+        except Exception as e:
+            # Fallback to TXT if PDF creation failed for some reason other than reportlab not being available initially
+            print(f"Error creating PDF: {e}. Falling back to TXT.")
+    return render_txt(content_lines), ".txt"
+
+
+def write_file(output_filepath, content):
+    """Writes the content to a temporary file next to output_filepath and renames it into place."""
+    temporary_filepath = output_filepath + ".tmp"
+    with open(temporary_filepath, "wb", buffering=0) as f:
+        f.write(content)
+    os.replace(temporary_filepath, output_filepath)
+
+
+def create_output_file(data_row, output_filepath, fields=None):
     """
     Creates an output file (PDF if reportlab is available, otherwise TXT)
-    with the data from the row. Applies corruption to specified fields.
+    with the data from the row.
 
     Args:
         data_row (dict): A dictionary representing a row from the CSV data.
         output_filepath (str): The full path for the output file (e.g., ".../uuid.pdf").
+        fields (dict): The per-document fields, by default those of the UUID in the file name.
+
+    Returns:
+        tuple: (path of the written file, its size in bytes)
     """
-    # Prepare the content, applying corruption where needed
-    content_lines = []
+    stem = os.path.splitext(output_filepath)[0]
+    content, extension = render_document(data_row, fields or scan_fields(os.path.basename(stem)))
+    output_filepath = stem + extension
+    write_file(output_filepath, content)
+    return output_filepath, len(content)
 
-    # Get original values and their scores for corruption
-    doc_id_val = data_row.get('doc_id_val', '')
-    doc_id_score = data_row.get('doc_id_score', '1.0')  # Default to 1.0 if score missing
 
-    doc_date_sic_val = data_row.get('doc_date_sic_val', '')
-    doc_date_sic_score = data_row.get('doc_date_sic_score', '1.0')
+# --- Document templates ---
+# The rows never change, so each row's document is rendered once with a
+# placeholder of the same width for every per-document field. A document is
+# then the template's fragments joined with the field values; as nothing
+# moves, the offsets in the PDF's cross-reference table stay valid.
 
-    doc_subject_val = data_row.get('doc_subject_val', '')
-    doc_subject_score = data_row.get('doc_subject_score', '1.0')
+# per-document fields and the width of their values
+TEMPLATE_FIELDS = {"uuid": 36, "scanned": 20, "id": 32}
+_PDF_ID = re.compile(rb"/ID\s*\[\s*<[0-9A-Fa-f]+>\s*<[0-9A-Fa-f]+>\s*\]")
 
-    for key, value in data_row.items():
-        content_lines.append(f"{key}: {value}")
 
-    # Write to PDF if reportlab is available
-    if REPORTLAB_AVAILABLE:
-        try:
-            # Ensure output_filepath ends with .pdf for PDF generation
-            if not output_filepath.lower().endswith(".pdf"):
-                output_filepath += ".pdf"
-
-            c = rl_canvas.Canvas(output_filepath, pagesize=A4)
-            textobject = c.beginText()
-            textobject.setFont("Helvetica", 10)  # Basic font
-            # Set text origin (x, y) from bottom-left of the page
-            textobject.setTextOrigin(inch, 10.5 * inch)  # Start 1 inch from left, 10.5 inches from bottom
-
-            for line in content_lines:
-                textobject.textLine(line)  # Adds a line and moves to the next
-
-            c.drawText(textobject)
-            c.save()
-            print(f"Created PDF: {output_filepath}")
-        except Exception as e:
-            print(f"Error creating PDF {output_filepath}: {e}. Falling back to TXT if possible.")
-            # Fallback to TXT if PDF creation failed for some reason other than reportlab not being available initially
-            create_txt_fallback(content_lines, output_filepath)
-    else:
-        # Fallback to TXT if reportlab was never available
-        create_txt_fallback(content_lines, output_filepath)
+def _placeholder(name):
+    return f"@@{name}@@".ljust(TEMPLATE_FIELDS[name], "#")
+
+
+class DocumentTemplate(NamedTuple):
+    extension: str
+    # the document split at the placeholders, one more fragment than fields
+    fragments: tuple
+    # the field in front of each fragment after the first
+    fields: tuple
+
+    def fill(self, fields):
+        """The document with the per-document field values filled in."""
+        parts = [self.fragments[0]]
+        for name, fragment in zip(self.fields, self.fragments[1:]):
+            value = fields[name].encode("ascii")
+            if len(value) != TEMPLATE_FIELDS[name]:
+                raise ValueError(f"{name} must be {TEMPLATE_FIELDS[name]} characters: {fields[name]!r}")
+            parts.append(value)
+            parts.append(fragment)
+        return b"".join(parts)
+
+
+def build_template(data_row):
+    """Renders the row's document with placeholders and splits it at them."""
+    content, extension = render_document(data_row, {name: _placeholder(name) for name in TEMPLATE_FIELDS})
+    markers = {_placeholder(name).encode("ascii"): name for name in TEMPLATE_FIELDS}
+    pattern = re.compile(b"|".join(re.escape(marker) for marker in markers))
+    fragments, fields, position = [], [], 0
+    for found in pattern.finditer(content):
+        fragments.append(content[position:found.start()])
+        fields.append(markers[found.group()])
+        position = found.end()
+    fragments.append(content[position:])
+    return DocumentTemplate(extension, tuple(fragments), tuple(fields))
 
 
-def create_txt_fallback(content_lines, pdf_filepath):
-    """Helper function to create a .txt file as a fallback."""
-    txt_output_filepath = pdf_filepath.lower().replace(".pdf", ".txt")
+def create_from_template(template, writer, uuid_str):
+    """Writes the document for uuid_str from the row's template, returning its path and size."""
+    content = template.fill(scan_fields(uuid_str))
+    return writer.write(uuid_str + template.extension, content), len(content)
+
+
+# --- Inbox writer ---
+
+FSYNC_POLICIES = ("none", "file", "batch")
+# directory in the inbox the documents are written to before they are renamed into place
+TMP_DIR = ".tmp"
+
+
+def _sync_directory(path):
+    fd = os.open(path, os.O_RDONLY)
     try:
-        with open(txt_output_filepath, "w", encoding="utf-8") as f:
-            f.write("--- TEXT FALLBACK (reportlab not available or PDF creation failed) ---\n")
-            for line in content_lines:
-                f.write(line + "\n")
-        print(f"Created TXT fallback: {txt_output_filepath}")
-    except Exception as e_txt:
-        print(f"Error creating TXT fallback {txt_output_filepath}: {e_txt}")
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class InboxWriter:
+    """
+    Writes documents into the inbox so a watcher only ever sees complete files.
+
+    A document is written to the inbox's .tmp directory and renamed into place,
+    which is atomic within a file system. The fsync policy decides what survives
+    a crash:
+
+    * none  nothing is synced, the page cache decides
+    * file  every document is synced before it is renamed into place; the
+            directories are synced once per batch
+    * batch documents are held in .tmp until batch_size of them are written or
+            the oldest waited batch_seconds, then synced, renamed into place
+            together, and their directories synced once
+
+    With shard_depth, documents go to subdirectories named after the first
+    characters of their name, two per level: inbox/ab/cd/abcd....pdf.
+    """
+
+    def __init__(self, root, fsync="none", batch_size=64, batch_seconds=1.0, shard_depth=0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync}', expected one of {FSYNC_POLICIES}")
+        self.root = root
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.shard_depth = shard_depth
+        self.tmp_dir = os.path.join(root, TMP_DIR)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._directories = {root}
+        # (temporary path, final path) of the documents waiting for the batch
+        self._batch = []
+        # directories with renames since the last directory sync, and how many renames
+        self._unsynced = set()
+        self._renames = 0
+        # when the first document of the batch or the first unsynced rename was written
+        self._pending_since = 0.0
+
+    def path_for(self, name):
+        """The final path of the document called name."""
+        shards = [name[2 * level:2 * level + 2] for level in range(self.shard_depth)]
+        return os.path.join(self.root, *shards, name)
+
+    def write(self, name, content):
+        """Writes the document and returns its final path; with the batch policy it appears there with the batch."""
+        final_path = self.path_for(name)
+        directory = os.path.dirname(final_path)
+        if directory not in self._directories:
+            os.makedirs(directory, exist_ok=True)
+            self._directories.add(directory)
+        temporary_path = os.path.join(self.tmp_dir, name + ".tmp")
+        fd = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o644)
+        try:
+            view = memoryview(content)
+            while view:
+                view = view[os.write(fd, view):]
+            if self.fsync == "file":
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        if self.fsync == "none":
+            os.replace(temporary_path, final_path)
+            return final_path
+        if not self._batch and not self._renames:
+            self._pending_since = time.monotonic()
+        if self.fsync == "batch":
+            self._batch.append((temporary_path, final_path))
+            if len(self._batch) >= self.batch_size:
+                self.flush()
+        else:
+            os.replace(temporary_path, final_path)
+            self._unsynced.add(directory)
+            self._renames += 1
+            if self._renames >= self.batch_size:
+                self.flush()
+        return final_path
+
+    def flush_deadline(self):
+        """When the waiting documents or unsynced renames are due to be flushed, or None if nothing waits."""
+        if self._batch or self._renames:
+            return self._pending_since + self.batch_seconds
+        return None
+
+    def flush_due(self):
+        """Flushes if the oldest waiting document or unsynced rename is batch_seconds old."""
+        deadline = self.flush_deadline()
+        if deadline is not None and time.monotonic() >= deadline:
+            self.flush()
+
+    def sleep_until(self, until):
+        """Sleeps until the monotonic time until, flushing a batch that comes due meanwhile."""
+        while True:
+            now = time.monotonic()
+            deadline = self.flush_deadline()
+            wake = until if deadline is None else min(until, deadline)
+            if wake > now:
+                time.sleep(wake - now)
+            self.flush_due()
+            if time.monotonic() >= until:
+                return
+
+    def flush(self):
+        """Syncs and renames the waiting documents into place, and syncs the directories they went to."""
+        batch, self._batch = self._batch, []
+        for temporary_path, _ in batch:
+            fd = os.open(temporary_path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        for temporary_path, final_path in batch:
+            os.replace(temporary_path, final_path)
+            self._unsynced.add(os.path.dirname(final_path))
+        directories, self._unsynced, self._renames = self._unsynced, set(), 0
+        for directory in directories:
+            _sync_directory(directory)
+
+    def close(self):
+        self.flush()
+
+
+# --- Parallel generation ---
+
+def _init_worker():
+    """Prepares a render worker: the parent handles the signals, and reportlab is warmed up once per process."""
+    # the parent finishes the documents in flight and then shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    if REPORTLAB_AVAILABLE:
+        # loads the modules and font metrics all later documents of this worker reuse
+        render_pdf(["warm-up"])
+
+
+def _render_task(data_row, uuid_str):
+    """Renders one document in a worker, returning its content, extension and the seconds taken."""
+    started = time.perf_counter()
+    content, extension = render_document(data_row, scan_fields(uuid_str))
+    return content, extension, time.perf_counter() - started
+
+
+class Stats:
+    """Throughput and time per document (rendering or filling and writing), reported periodically and at the end."""
+
+    # document times kept for the percentiles, the oldest are dropped first
+    MAX_SAMPLES = 100_000
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.documents = 0
+        self.bytes = 0
+        self.errors = 0
+        self.document_seconds = collections.deque(maxlen=self.MAX_SAMPLES)
+        self._last_report = (self.started, 0, 0)
+
+    def add(self, size, document_seconds):
+        self.documents += 1
+        self.bytes += size
+        self.document_seconds.append(document_seconds)
+
+    def _document_ms(self):
+        if not self.document_seconds:
+            return "ms per document n/a"
+        samples = sorted(self.document_seconds)
+        mean = sum(samples) / len(samples)
+        p50 = samples[len(samples) // 2]
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        return f"ms per document mean {mean * 1000:.3f} p50 {p50 * 1000:.3f} p99 {p99 * 1000:.3f}"
+
+    def report(self, final=False):
+        """One stats line: totals, and the rates since the last report (since the start for the final one)."""
+        now = time.monotonic()
+        since, documents, size = (self.started, 0, 0) if final else self._last_report
+        self._last_report = (now, self.documents, self.bytes)
+        elapsed = max(now - since, 1e-9)
+        label = "Total" if final else "Stats"
+        return (f"{label}: {self.documents} documents ({self.errors} failed) in {now - self.started:.1f}s, "
+                f"{(self.documents - documents) / elapsed:.1f} docs/s, "
+                f"{(self.bytes - size) / elapsed / 1e6:.2f} MB/s, {self._document_ms()}")
+
+
+def generate(output_folder_path, rate, count=None, workers=None, data_path=DEFAULT_DATA_PATH,
+             stats_interval=10.0, verbose=False, render_each=False, fsync="none", batch_size=64,
+             batch_seconds=1.0, shard_depth=0):
+    """
+    Generates documents, from the rows' templates or, with render_each, rendered one by one on a process pool.
 
+    Args:
+        output_folder_path (str): The folder the documents are written to.
+        rate (float): Documents per second, fractional rates included; 0 generates as fast as possible.
+        count (int): Exit after this many documents (burst mode); None runs until stopped.
+        workers (int): Render processes with render_each, None for one per CPU.
+        data_path (str): The CSV response table.
+        stats_interval (float): Seconds between two stats lines, 0 only reports at the end.
+        verbose (bool): Print every generated file.
+        render_each (bool): Render every document with reportlab instead of filling in a template.
+        fsync, batch_size, batch_seconds, shard_depth: How documents are written, see InboxWriter.
 
-def main_loop(output_folder_path, time_p_pdf):
-    """Main loop for the mock scanner application."""
+    Returns:
+        Stats: the stats of the run.
+    """
     # Ensure the output folder exists, create if not.
     if not os.path.isdir(output_folder_path):
         try:
@@ -174,74 +468,493 @@ def main_loop(output_folder_path, time_p_pdf):
             print(f"Created output folder: {output_folder_path}")
         except OSError as e:
             print(f"Error: Could not create output folder '{output_folder_path}'. {e}")
-            return  # Exit if folder cannot be created
+            return None  # Exit if folder cannot be created
 
-    document_data_rows = load_data()
+    document_data_rows = load_data(data_path)
     if not document_data_rows:
-        print("Error: No data loaded from CSV_DATA. Exiting.")
-        return
-
-    print(f"Mock scanner started. Writing files to: {output_folder_path} every {time_p_pdf} seconds.")
+        print(f"Error: No data loaded from {data_path}. Exiting.")
+        return None
+
+    workers = workers or os.cpu_count() or 1
+    pace = f"{rate:g} documents/s" if rate > 0 else "as fast as possible"
+    amount = f"{count} documents" if count is not None else "documents until stopped"
+    mode = f"{workers} render workers" if render_each else f"{len(document_data_rows)} templates"
+    print(f"Mock scanner started. Writing {amount} to {output_folder_path}, {pace}, {mode}.")
     if not REPORTLAB_AVAILABLE:
         print("Reminder: reportlab is not installed, so .txt files will be generated.")
 
+    writer = InboxWriter(output_folder_path, fsync=fsync, batch_size=batch_size, batch_seconds=batch_seconds,
+                         shard_depth=shard_depth)
+    templates = None if render_each else [build_template(row) for row in document_data_rows]
+    stats = Stats()
+    # renders queued ahead of the workers; more only adds latency once they are busy
+    max_in_flight = workers * 4
+    pending = collections.deque()
+
+    def collect(future, uuid_str):
+        try:
+            content, extension, document_seconds = future.result()
+            started = time.perf_counter()
+            path = writer.write(uuid_str + extension, content)
+        except Exception as e:
+            stats.errors += 1
+            print(f"Error generating a document: {e}")
+            return
+        stats.add(len(content), document_seconds + time.perf_counter() - started)
+        if verbose:
+            print(f"Created {path}")
+
+    def emit(template, uuid_str):
+        started = time.perf_counter()
+        try:
+            path, size = create_from_template(template, writer, uuid_str)
+        except OSError as e:
+            stats.errors += 1
+            print(f"Error writing a document: {e}")
+            return
+        stats.add(size, time.perf_counter() - started)
+        if verbose:
+            print(f"Created {path}")
+
+    pool = None
+    if render_each:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
     try:
-        while True:
+        next_due = next_report = time.monotonic()
+        submitted = 0
+        while count is None or submitted < count:
+            now = time.monotonic()
+            writer.flush_due()
+            if rate > 0:
+                # a slow rate must not hold a written batch back beyond batch_seconds
+                writer.sleep_until(next_due)
+                # catch up on short stalls, but do not burst after long ones
+                next_due = max(next_due, time.monotonic() - 1) + 1 / rate
+
             # Randomly select a row from the loaded data
-            selected_row_data = random.choice(document_data_rows)
+            index = random.randrange(len(document_data_rows))
+            selected_row_data = document_data_rows[index]
+            # Generate the base filename, a UUID the row's rule matches
+            base_filename = generate_uuid_for_row(selected_row_data)
+            if pool is None:
+                emit(templates[index], base_filename)
+            else:
+                while len(pending) >= max_in_flight or (pending and pending[0][0].done()):
+                    collect(*pending.popleft())
+                pending.append((pool.submit(_render_task, selected_row_data, base_filename), base_filename))
+            submitted += 1
+
+            if stats_interval > 0 and now >= next_report + stats_interval:
+                next_report = now
+                print(stats.report())
+    finally:
+        # also on Ctrl+C and docker stop: documents being rendered are finished and counted
+        while pending:
+            collect(*pending.popleft())
+        if pool is not None:
+            pool.shutdown()
+        writer.close()
+        print(stats.report(final=True))
+    return stats
+
+
+# --- Push mode ---
+
+class LatencyHistogram:
+    """
+    HDR-style latency histogram: log-linear buckets over microseconds.
 
-            # Get the 'UUID Ending' for the filename suffix
-            uuid_suffix = selected_row_data.get('UUID Ending')
-            if not uuid_suffix:  # Handle cases where 'UUID Ending' might be missing or empty for a row
-                print(f"Warning: Row found with missing or empty 'UUID Ending'. Using a generic suffix.")
-                uuid_suffix = "unknown_id"
+    Values below 2 ** sub_bucket_bits microseconds are counted exactly; above,
+    every power of two is split into 2 ** (sub_bucket_bits - 1) linear buckets,
+    so any recorded value is off by less than 2 ** (1 - sub_bucket_bits)
+    relative (1.6 % with the default 7 bits) at a fixed memory cost.
+    """
 
-                # Generate the base filename (UUID ending with the suffix)
-            base_filename = generate_uuid_ending_with(uuid_suffix)
+    def __init__(self, sub_bucket_bits=7):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.counts = collections.Counter()
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def _index(self, microseconds):
+        if microseconds < self.sub_bucket_count:
+            return microseconds
+        shift = microseconds.bit_length() - self.sub_bucket_bits
+        half = self.sub_bucket_count >> 1
+        return self.sub_bucket_count + (shift - 1) * half + (microseconds >> shift) - half
+
+    def _highest_value(self, index):
+        """The largest microsecond value counted in the bucket."""
+        if index < self.sub_bucket_count:
+            return index
+        half = self.sub_bucket_count >> 1
+        shift, sub = divmod(index - self.sub_bucket_count, half)
+        shift += 1
+        return ((sub + half + 1) << shift) - 1
+
+    def record(self, seconds):
+        self.counts[self._index(int(seconds * 1e6))] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def value_at(self, percentile):
+        """The latency in seconds at or below which percentile % of the recorded values are."""
+        if not self.count:
+            return 0.0
+        wanted = max(1, -(-self.count * percentile // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= wanted:
+                return min(self._highest_value(index) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        """Latency statistics in milliseconds."""
+        if not self.count:
+            return {"count": 0}
+        summary = {"count": self.count, "min_ms": self.min * 1000, "mean_ms": self.total / self.count * 1000}
+        for name, percentile in (("p50", 50), ("p90", 90), ("p99", 99), ("p999", 99.9)):
+            summary[f"{name}_ms"] = self.value_at(percentile) * 1000
+        summary["max_ms"] = self.max * 1000
+        return {name: round(value, 3) for name, value in summary.items()}
+
+
+def _stop_pushing(signum, stop):
+    print(f"\nCaught signal {signal.Signals(signum).name} ({signum}). Finishing the uploads in flight...")
+    stop.set()
+
+
+class PushStats:
+    """Outcomes and latencies of the uploads, reported periodically and summarized at the end."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.latency = LatencyHistogram()
+        self.outcomes = collections.Counter()
+        self.bytes = 0
+        self._last_report = (self.started, 0)
+
+    @property
+    def documents(self):
+        return sum(self.outcomes.values())
+
+    def add(self, outcome, size, seconds=None):
+        self.outcomes[outcome] += 1
+        self.bytes += size
+        if seconds is not None:
+            self.latency.record(seconds)
+
+    def report(self):
+        now = time.monotonic()
+        since, documents = self._last_report
+        self._last_report = (now, self.documents)
+        latency = self.latency.summary()
+        return (f"Stats: {self.documents} uploads ({self.documents - self.outcomes['ok']} failed) "
+                f"in {now - self.started:.1f}s, {(self.documents - documents) / max(now - since, 1e-9):.1f} docs/s, "
+                f"latency ms p50 {latency.get('p50_ms', 0):.1f} p99 {latency.get('p99_ms', 0):.1f}")
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            "uploads": self.documents,
+            "ok": self.outcomes["ok"],
+            "failed": self.documents - self.outcomes["ok"],
+            "seconds": round(elapsed, 3),
+            "docs_per_second": round(self.documents / max(elapsed, 1e-9), 1),
+            "mb_per_second": round(self.bytes / max(elapsed, 1e-9) / 1e6, 3),
+            "outcomes": dict(sorted(self.outcomes.items())),
+            "latency": self.latency.summary(),
+        }
+
+
+def check_response(response, uuid_str, data_row):
+    """The outcome of one upload: ok, or what was wrong with the classifier's answer."""
+    if response.status_code != 200:
+        return f"http_{response.status_code}"
+    try:
+        result = response.json()
+        custom_id, kind = result["custom_id"], result["result"]["kind"]
+    except (ValueError, KeyError, TypeError):
+        return "invalid_response"
+    if custom_id != uuid_str:
+        return "custom_id_mismatch"
+    if kind != data_row.get("kind"):
+        return "kind_mismatch"
+    return "ok"
+
+
+async def push(base_url, rate, count=None, concurrency=16, data_path=DEFAULT_DATA_PATH, stats_interval=10.0,
+               verbose=False, render_each=False, workers=None, timeout=30.0, transport=None):
+    """
+    Generates documents and uploads them to the classifier's POST {base_url}/classify/{uuid}.
+
+    Uploads run concurrently on one pooled httpx.AsyncClient, at most concurrency
+    at a time, paced at rate documents per second (0 as fast as the classifier
+    answers). Every answer is checked: its custom_id must be the generated UUID
+    and its kind that of the row. The latency from sending to the complete
+    answer goes into a LatencyHistogram. SIGINT and SIGTERM stop the generation;
+    the uploads in flight are awaited.
 
-            # Determine filename based on whether PDF or TXT will be created
-            # The create_output_file function will adjust if it's PDF and path doesn't end with .pdf
-            # or call create_txt_fallback which changes extension.
-            # For consistency, we'll aim for .pdf initially for the path.
-            output_filename = f"{base_filename}.pdf"
-            full_output_filepath = os.path.join(output_folder_path, output_filename)
+    Args:
+        base_url (str): The classifier API, e.g. http://localhost:8080/api/v1.
+        transport: An httpx transport replacing the network, e.g. httpx.ASGITransport.
+        The other arguments are those of generate.
 
-            # Create the PDF (or TXT fallback)
-            create_output_file(selected_row_data, full_output_filepath)
+    Returns:
+        PushStats: the outcomes and latencies of the run.
+    """
+    if httpx is None:
+        raise RuntimeError("Push mode needs the httpx library, install it with 'pip install httpx'.")
+    document_data_rows = load_data(data_path)
+    if not document_data_rows:
+        raise RuntimeError(f"No data loaded from {data_path}.")
+
+    pace = f"{rate:g} documents/s" if rate > 0 else "as fast as possible"
+    amount = f"{count} documents" if count is not None else "documents until stopped"
+    print(f"Mock scanner started. Uploading {amount} to {base_url}, {pace}, {concurrency} concurrent uploads.")
+
+    templates = None if render_each else [build_template(row) for row in document_data_rows]
+    pool = None
+    if render_each:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                                      initializer=_init_worker)
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    handled_signals = []
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, _stop_pushing, signum, stop)
+            handled_signals.append(signum)
+        except (NotImplementedError, RuntimeError, ValueError):
+            # not the main thread, or not supported by the platform's event loop
+            pass
+
+    stats = PushStats()
+    slots = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def upload(client, data_row, uuid_str, content=None):
+        size = 0
+        try:
+            if content is None:
+                # rendered in the upload task, so up to concurrency documents keep the render workers busy
+                content, _, _ = await loop.run_in_executor(pool, _render_task, data_row, uuid_str)
+            size = len(content)
+            started = time.perf_counter()
+            response = await client.post(f"/classify/{uuid_str}", content=content,
+                                         headers={"Content-Type": "application/pdf"})
+            outcome = check_response(response, uuid_str, data_row)
+            stats.add(outcome, size, time.perf_counter() - started)
+        except Exception as e:
+            # the render or the upload failed
+            outcome = f"error_{type(e).__name__}"
+            stats.add(outcome, size)
+        finally:
+            slots.release()
+        if verbose or outcome != "ok" and stats.outcomes[outcome] == 1:
+            print(f"Uploaded {uuid_str}: {outcome}")
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url.rstrip("/"), limits=limits, timeout=timeout,
+                                 transport=transport) as client:
+        try:
+            next_due = next_report = time.monotonic()
+            submitted = 0
+            while (count is None or submitted < count) and not stop.is_set():
+                now = time.monotonic()
+                if rate > 0:
+                    if next_due > now:
+                        await asyncio.sleep(next_due - now)
+                    # catch up on short stalls, but do not burst after long ones
+                    next_due = max(next_due, time.monotonic() - 1) + 1 / rate
+                await slots.acquire()
+
+                index = random.randrange(len(document_data_rows))
+                data_row = document_data_rows[index]
+                uuid_str = generate_uuid_for_row(data_row)
+                content = templates[index].fill(scan_fields(uuid_str)) if pool is None else None
+                task = asyncio.create_task(upload(client, data_row, uuid_str, content))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                submitted += 1
+
+                if stats_interval > 0 and now >= next_report + stats_interval:
+                    next_report = now
+                    print(stats.report())
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            if pool is not None:
+                pool.shutdown()
+            for signum in handled_signals:
+                loop.remove_signal_handler(signum)
+    return stats
+
+
+def print_summary(stats, summary_path=None):
+    """Prints the push summary, and writes it as JSON to summary_path if given."""
+    summary = stats.summary()
+    latency = summary["latency"]
+    print(f"Total: {summary['uploads']} uploads, {summary['ok']} ok, {summary['failed']} failed "
+          f"in {summary['seconds']:.1f}s, {summary['docs_per_second']:.1f} docs/s, {summary['mb_per_second']:.2f} MB/s")
+    print(f"Outcomes: {', '.join(f'{name} {n}' for name, n in summary['outcomes'].items()) or 'none'}")
+    if latency["count"]:
+        print("Latency ms: " + ", ".join(f"{name[:-3]} {latency[name]:.1f}" for name in
+                                          ("min_ms", "mean_ms", "p50_ms", "p90_ms", "p99_ms", "p999_ms", "max_ms")))
+    if summary_path:
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Summary written to {summary_path}")
+    return summary
+
+
+def main_loop(output_folder_path, time_p_pdf, data_path=DEFAULT_DATA_PATH):
+    """Main loop for the mock scanner application: one document every time_p_pdf seconds."""
+    generate(output_folder_path, 1 / time_p_pdf if time_p_pdf > 0 else 0, data_path=data_path, verbose=True)
 
-            # Wait for (time_p_pdf) second before processing the next file
-            time.sleep(time_p_pdf)
-    except Exception as e:
-        print(f"\nAn unexpected error occurred in the main loop: {e}")
 
 # Signal handler function
 def graceful_shutdown_handler(signum, frame):
     """Handles SIGINT and SIGTERM for graceful shutdown."""
     signal_name = signal.Signals(signum).name
     print(f"\nCaught signal {signal_name} ({signum}). Shutting down mock scanner gracefully...")
-    # Perform any necessary cleanup here if needed in the future
+    # Unwinds the generator, which finishes the documents in flight and prints the final stats
     sys.exit(0) # Exit cleanly
 
+
 if __name__ == "__main__":
     # Set up command-line argument parsing
     parser = argparse.ArgumentParser(description="Mock Scanner: Generates PDF (or TXT) files from CSV data.")
     parser.add_argument("-o", "--outpath",
                         dest="outpath",
-                        required=True,
+                        required=False,
                         type=str,
                         help="The folder where the generated files will be saved.")
+    parser.add_argument("-p", "--push",
+                        dest="push_url",
+                        required=False,
+                        default=None,
+                        type=str,
+                        help="push mode: upload the documents to the classifier API at this base URL, "
+                             "e.g. http://localhost:8080/api/v1, instead of writing them to --outpath")
+    parser.add_argument("-c", "--concurrency",
+                        dest="concurrency",
+                        required=False,
+                        default=16,
+                        type=int,
+                        help="uploads in flight at once in push mode")
+    parser.add_argument("--timeout",
+                        dest="timeout",
+                        required=False,
+                        default=30.0,
+                        type=float,
+                        help="seconds an upload may take in push mode")
+    parser.add_argument("--summary",
+                        dest="summary_path",
+                        required=False,
+                        default=None,
+                        type=str,
+                        help="file the push mode summary is written to as JSON")
     parser.add_argument("-t", "--time",
                         dest="time_p_pdf",
                         required=False,
                         default=1,
-                        type=int,
+                        type=float,
                         help="seconds between two pdf")
+    parser.add_argument("-r", "--rate",
+                        dest="rate",
+                        required=False,
+                        default=None,
+                        type=float,
+                        help="documents per second, e.g. 250 or 0.5; 0 is as fast as possible. "
+                             "Overrides --time; the default is 1/--time, or 0 with --count")
+    parser.add_argument("-n", "--count",
+                        dest="count",
+                        required=False,
+                        default=None,
+                        type=int,
+                        help="burst mode: generate this many documents, then exit")
+    parser.add_argument("-w", "--workers",
+                        dest="workers",
+                        required=False,
+                        default=None,
+                        type=int,
+                        help="render processes with --render-each, default one per CPU")
+    parser.add_argument("--render-each",
+                        dest="render_each",
+                        action="store_true",
+                        help="render every document with reportlab instead of filling in the rows' templates")
+    parser.add_argument("--stats-interval",
+                        dest="stats_interval",
+                        required=False,
+                        default=10.0,
+                        type=float,
+                        help="seconds between two stats lines, 0 only reports at the end")
+    parser.add_argument("-v", "--verbose",
+                        action="store_true",
+                        help="print every generated file")
+    parser.add_argument("--fsync",
+                        dest="fsync",
+                        required=False,
+                        default="none",
+                        choices=FSYNC_POLICIES,
+                        help="none: no syncs; file: sync every document before it appears, directories per batch; "
+                             "batch: sync and publish documents in batches")
+    parser.add_argument("--batch-size",
+                        dest="batch_size",
+                        required=False,
+                        default=64,
+                        type=int,
+                        help="documents per synced batch")
+    parser.add_argument("--batch-seconds",
+                        dest="batch_seconds",
+                        required=False,
+                        default=1.0,
+                        type=float,
+                        help="longest time a document waits for its batch")
+    parser.add_argument("--shard-depth",
+                        dest="shard_depth",
+                        required=False,
+                        default=0,
+                        type=int,
+                        help="directory levels named after the UUID's leading characters, 2 writes inbox/ab/cd/abcd...pdf")
+    parser.add_argument("-d", "--data",
+                        dest="data_path",
+                        required=False,
+                        default=os.environ.get("MOCK_DATA", DEFAULT_DATA_PATH),
+                        type=str,
+                        help="CSV response table of the classifier mock to generate documents for")
 
     args = parser.parse_args()
+    if (args.outpath is None) == (args.push_url is None):
+        parser.error("one of --outpath or --push is required")
+    if args.rate is not None:
+        rate = args.rate
+    elif args.count is not None:
+        rate = 0
+    else:
+        rate = 1 / args.time_p_pdf if args.time_p_pdf > 0 else 0
+
+    if args.push_url:
+        # Upload until --count or a signal, which the event loop handles
+        stats = asyncio.run(push(args.push_url, rate, count=args.count, concurrency=args.concurrency,
+                                 data_path=args.data_path, stats_interval=args.stats_interval, verbose=args.verbose,
+                                 render_each=args.render_each, workers=args.workers, timeout=args.timeout))
+        summary = print_summary(stats, args.summary_path)
+        sys.exit(0 if summary["failed"] == 0 else 1)
 
     # Register signal handlers for SIGINT (Ctrl+C) and SIGTERM (docker stop)
     signal.signal(signal.SIGINT, graceful_shutdown_handler)
     signal.signal(signal.SIGTERM, graceful_shutdown_handler)
 
-    # Start the main loop with the provided output folder
-    main_loop(args.outpath, args.time_p_pdf)
+    # Start generating into the provided output folder
+    generate(args.outpath, rate, count=args.count, workers=args.workers, data_path=args.data_path,
+             stats_interval=args.stats_interval, verbose=args.verbose or 0 < rate <= 1,
+             render_each=args.render_each, fsync=args.fsync, batch_size=args.batch_size,
+             batch_seconds=args.batch_seconds, shard_depth=args.shard_depth)
@@ -2,7 +2,11 @@ import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 
+from openapi_server.implementation.classification_service import EXPECTED_PDF_HEADER
 from openapi_server.main import app as application
+from openapi_server.settings import settings
+
+SAMPLE_PDF_BODY = EXPECTED_PDF_HEADER + b" some pdf content bytes"
 
 
 @pytest.fixture
@@ -15,3 +19,11 @@ def app() -> FastAPI:
 @pytest.fixture
 def client(app) -> TestClient:
     return TestClient(app)
+
+
+@pytest.fixture
+def restore_settings():
+    """The shared settings; whatever the test changes is restored afterwards."""
+    saved = dict(vars(settings))
+    yield settings
+    vars(settings).update(saved)
@@ -0,0 +1,92 @@
+# tests/test_admission.py
+
+import uuid
+
+from fastapi.testclient import TestClient
+
+from openapi_server import admission
+from openapi_server.admission import AdmissionController
+from openapi_server.main import app
+from openapi_server.settings import settings
+from tests.conftest import SAMPLE_PDF_BODY
+
+UUID_10 = str(uuid.UUID("00000000-0000-0000-0000-000000000010"))
+PDF_HEADERS = {"Content-Type": "application/pdf"}
+
+
+def _post(client, headers=None):
+    return client.post(f"/api/v1/classify/{UUID_10}", content=SAMPLE_PDF_BODY, headers={**PDF_HEADERS, **(headers or {})})
+
+
+def test_in_flight_limit(restore_settings):
+    restore_settings.admission_max_in_flight = 2
+    controller = AdmissionController()
+    assert controller.admit("ip:a", 10) is None
+    assert controller.admit("ip:b", 10) is None
+    rejection = controller.admit("ip:c", 10)
+    assert (rejection.status, rejection.reason) == (503, "in_flight")
+    controller.release(10)
+    assert controller.admit("ip:c", 10) is None
+
+
+def test_queued_bytes_budget_admits_a_single_large_upload(restore_settings):
+    restore_settings.admission_max_queued_bytes = 100
+    controller = AdmissionController()
+    assert controller.admit("ip:a", 500) is None
+    assert controller.admit("ip:b", 1).reason == "queued_bytes"
+    controller.release(500)
+    assert controller.admit("ip:b", 60) is None
+    assert controller.admit("ip:b", 40) is None
+    assert controller.admit("ip:b", 1).reason == "queued_bytes"
+
+
+def test_client_token_bucket(restore_settings):
+    restore_settings.admission_client_rate = 0.5
+    restore_settings.admission_client_burst = 2
+    controller = AdmissionController()
+    assert controller.admit("key:a", 0) is None
+    assert controller.admit("key:a", 0) is None
+    rejection = controller.admit("key:a", 0)
+    assert (rejection.status, rejection.reason, rejection.retry_after) == (429, "client_rate", 2)
+    # other clients have their own bucket
+    assert controller.admit("key:b", 0) is None
+
+
+def test_overloaded_service_sheds_uploads_with_503(restore_settings, monkeypatch):
+    restore_settings.admission_max_in_flight = 1
+    restore_settings.admission_retry_after = 3
+    monkeypatch.setattr(admission.controller, "in_flight", 1)
+    client = TestClient(app)
+    before = admission.rejected_total.labels("in_flight").value
+
+    response = _post(client)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    assert response.json() == {"detail": "Too many uploads in progress"}
+    assert admission.rejected_total.labels("in_flight").value == before + 1
+    # only uploads are admission controlled
+    assert client.get("/api/v1/admission").status_code == 200
+
+
+def test_rate_limit_is_keyed_by_api_key(restore_settings):
+    restore_settings.admission_client_rate = 0.001
+    restore_settings.admission_client_burst = 1
+    client = TestClient(app)
+    assert _post(client, {"X-API-Key": "first"}).status_code == 200
+    assert _post(client, {"X-API-Key": "first"}).status_code == 429
+    assert _post(client, {"X-API-Key": "second"}).status_code == 200
+    assert admission.controller.in_flight == 0
+
+
+def test_limits_are_tunable_at_runtime_across_workers(restore_settings, tmp_path):
+    restore_settings.shared_state_dir = str(tmp_path)
+    client = TestClient(app)
+    response = client.patch("/api/v1/admission", json={"admission_max_in_flight": 5})
+    assert response.status_code == 200
+    assert response.json()["limits"]["admission_max_in_flight"] == 5
+    assert client.patch("/api/v1/admission", json={"max_in_flight": 5}).status_code == 422
+
+    # another worker picks the change up from the shared state directory
+    restore_settings.admission_max_in_flight = 0
+    AdmissionController().admit("ip:a", 0)
+    assert settings.admission_max_in_flight == 5
@@ -0,0 +1,95 @@
+# tests/test_batch_api.py
+
+import json
+import uuid
+
+import pytest
+
+from openapi_server.apis.batch_api import BATCH_STREAM_MEDIA_TYPE
+from openapi_server.implementation.classification_service import MOCK_RESPONSES
+from tests.conftest import SAMPLE_PDF_BODY
+
+BATCH_URL = "/api/v1/classify/batch"
+
+
+def _uuid(ending: str) -> str:
+    return str(uuid.UUID("00000000-0000-0000-0000-0000000000" + ending))
+
+
+def _length_prefixed(*records) -> bytes:
+    return b"".join(f"{uuid_str} {len(body)}\n".encode("ascii") + body for uuid_str, body in records)
+
+
+def _lines(response):
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return sorted((json.loads(line) for line in response.text.splitlines()), key=lambda line: line["index"])
+
+
+def test_length_prefixed_batch(client):
+    body = _length_prefixed((_uuid("10"), SAMPLE_PDF_BODY), (_uuid("20"), SAMPLE_PDF_BODY), (_uuid("30"), SAMPLE_PDF_BODY))
+    lines = _lines(client.post(BATCH_URL, content=body, headers={"Content-Type": BATCH_STREAM_MEDIA_TYPE}))
+
+    assert [line["index"] for line in lines] == [0, 1, 2]
+    for line, ending in zip(lines, ("10", "20", "30")):
+        assert line["status"] == 200
+        assert line["uuid"] == _uuid(ending)
+        assert line["result"]["custom_id"] == _uuid(ending)
+        assert line["result"]["result"]["kind"] == MOCK_RESPONSES[ending]["kind"]
+
+
+def test_length_prefixed_batch_reports_item_errors_inline(client):
+    body = _length_prefixed(
+        (_uuid("10"), SAMPLE_PDF_BODY),
+        ("not-a-uuid", SAMPLE_PDF_BODY),
+        (_uuid("20"), b"IAMNOTAPDF"),
+        (_uuid("30"), b""),
+        (_uuid("31"), SAMPLE_PDF_BODY),
+    )
+    lines = _lines(client.post(BATCH_URL, content=body, headers={"Content-Type": BATCH_STREAM_MEDIA_TYPE}))
+
+    assert [(line["index"], line["status"]) for line in lines] == [(0, 200), (1, 422), (2, 400), (3, 400), (4, 200)]
+    assert lines[2]["detail"] == "Invalid file format: Does not appear to be a PDF."
+    assert lines[3]["detail"] == "PDF body must be present"
+
+
+def test_length_prefixed_batch_rejects_oversized_items(client, restore_settings):
+    restore_settings.body_max_size = 64
+    body = _length_prefixed((_uuid("10"), SAMPLE_PDF_BODY + b"x" * 100), (_uuid("20"), SAMPLE_PDF_BODY))
+    lines = _lines(client.post(BATCH_URL, content=body, headers={"Content-Type": BATCH_STREAM_MEDIA_TYPE}))
+    assert [(line["index"], line["status"]) for line in lines] == [(0, 413), (1, 200)]
+
+
+@pytest.mark.parametrize("body, status, detail", [
+    (f"{'0' * 8} twelve\n".encode() + SAMPLE_PDF_BODY, 400, "Malformed batch record header"),
+    (f"{'0' * 8} 1000\n".encode() + SAMPLE_PDF_BODY, 400, "Truncated batch record"),
+])
+def test_length_prefixed_batch_stops_on_broken_framing(client, body, status, detail):
+    lines = _lines(client.post(BATCH_URL, content=_length_prefixed((_uuid("10"), SAMPLE_PDF_BODY)) + body,
+                               headers={"Content-Type": BATCH_STREAM_MEDIA_TYPE}))
+    assert [line["status"] for line in lines] == [200, status]
+    assert lines[1]["detail"] == detail
+
+
+def test_multipart_batch(client):
+    files = [
+        (_uuid("10"), ("a.pdf", SAMPLE_PDF_BODY, "application/pdf")),
+        ("file", (f"{_uuid('20')}.pdf", SAMPLE_PDF_BODY, "application/pdf")),
+        (_uuid("30"), ("c.pdf", b"IAMNOTAPDF", "application/pdf")),
+    ]
+    lines = _lines(client.post(BATCH_URL, files=files))
+    assert [(line["index"], line["uuid"], line["status"]) for line in lines] == [
+        (0, _uuid("10"), 200), (1, _uuid("20"), 200), (2, _uuid("30"), 400)]
+
+
+def test_batch_rejects_unknown_content_type(client):
+    response = client.post(BATCH_URL, content=SAMPLE_PDF_BODY, headers={"Content-Type": "application/pdf"})
+    assert response.status_code == 415
+
+
+def test_batch_applies_corruption_seed(client):
+    body = _length_prefixed((_uuid("19"), SAMPLE_PDF_BODY))
+    headers = {"Content-Type": BATCH_STREAM_MEDIA_TYPE, "X-Corruption-Seed": "batch"}
+    single = client.post(f"/api/v1/classify/{_uuid('19')}", content=SAMPLE_PDF_BODY,
+                         headers={"Content-Type": "application/pdf", "X-Corruption-Seed": "batch"})
+    assert _lines(client.post(BATCH_URL, content=body, headers=headers))[0]["result"] == single.json()
@@ -0,0 +1,150 @@
+# tests/test_body_stream.py
+
+import asyncio
+import hashlib
+import mmap
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from openapi_server.body_stream import read_pdf_body
+from openapi_server.implementation.classification_service import EXPECTED_PDF_HEADER, ClassificationServiceImpl
+from tests.conftest import SAMPLE_PDF_BODY
+
+TEST_UUID = uuid.UUID("00000000-0000-0000-0000-000000000010")
+
+
+def _streaming_request(chunks, headers=None):
+    """Build a Request whose receive channel hands out ``chunks`` one by one and records how many were read."""
+    received = []
+
+    async def receive():
+        index = len(received)
+        received.append(index)
+        if index >= len(chunks):
+            return {"type": "http.disconnect"}
+        return {"type": "http.request", "body": chunks[index], "more_body": index < len(chunks) - 1}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    }
+    return Request(scope, receive), received
+
+
+def _read(request, spool_threshold=1024, max_size=1024 * 1024):
+    return asyncio.run(read_pdf_body(request, spool_threshold=spool_threshold, max_size=max_size))
+
+
+def test_read_pdf_body_returns_complete_body():
+    request, _ = _streaming_request([b"%PD", b"F-1.7 ", b"rest of the document"])
+    with _read(request) as spooled:
+        assert spooled.size == len(b"%PDF-1.7 rest of the document")
+        assert spooled.getvalue() == b"%PDF-1.7 rest of the document"
+
+
+def test_read_pdf_body_rejects_bad_header_on_first_chunk():
+    request, received = _streaming_request([b"<html>error page", b"never read", b"never read"])
+    with pytest.raises(HTTPException) as exc_info:
+        _read(request)
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == "Invalid file format: Does not appear to be a PDF."
+    assert len(received) == 1
+
+
+@pytest.mark.parametrize("chunks, detail", [
+    ([b""], "PDF body must be present"),
+    ([b"%PD"], "PDF body too short"),
+    ([b"%PDF-"], "PDF body too short"),
+    ([b"IAM", b"NO"], "PDF body too short"),
+])
+def test_read_pdf_body_keeps_validation_order(chunks, detail):
+    request, _ = _streaming_request(chunks)
+    with pytest.raises(HTTPException) as exc_info:
+        _read(request)
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == detail
+
+
+def test_read_pdf_body_spools_large_bodies_to_disk():
+    request, _ = _streaming_request([SAMPLE_PDF_BODY, b"x" * 4096])
+    with _read(request, spool_threshold=1024) as spooled:
+        assert spooled.rolled_to_disk
+        assert spooled.size == len(SAMPLE_PDF_BODY) + 4096
+
+
+@pytest.mark.parametrize("spool_threshold", [1024 * 1024, 1024])
+def test_read_pdf_body_buffer_is_read_only_and_not_copied(spool_threshold):
+    request, _ = _streaming_request([SAMPLE_PDF_BODY, b"x" * 4096])
+    with _read(request, spool_threshold=spool_threshold) as spooled:
+        view = spooled.getbuffer()
+        assert view.readonly and view == spooled.getvalue()
+        assert isinstance(view.obj, mmap.mmap) == spooled.rolled_to_disk
+        assert hashlib.sha256(view).hexdigest() == spooled.digest
+        head = view[:len(EXPECTED_PDF_HEADER)]
+    # a slice outliving the upload does not break closing it
+    with pytest.raises(ValueError):
+        bytes(view)
+    assert head == EXPECTED_PDF_HEADER
+
+
+def test_read_pdf_body_enforces_max_size_while_streaming():
+    request, received = _streaming_request([SAMPLE_PDF_BODY, b"x" * 100, b"x" * 100, b"never read"])
+    with pytest.raises(HTTPException) as exc_info:
+        _read(request, max_size=128)
+    assert exc_info.value.status_code == 413
+    assert len(received) == 3
+
+
+def test_read_pdf_body_rejects_oversized_content_length_upfront():
+    request, received = _streaming_request([SAMPLE_PDF_BODY], headers={"Content-Length": "4096"})
+    with pytest.raises(HTTPException) as exc_info:
+        _read(request, max_size=1024)
+    assert exc_info.value.status_code == 413
+    assert received == []
+
+
+def test_classify_pdf_streams_chunked_upload(client):
+    def body_chunks():
+        yield EXPECTED_PDF_HEADER
+        yield b"1.7\n"
+        yield b"x" * 10000
+
+    response = client.post(f"/api/v1/classify/{TEST_UUID}", content=body_chunks(),
+                           headers={"Content-Type": "application/pdf"})
+    assert response.status_code == 200
+    assert response.json()["custom_id"] == str(TEST_UUID)
+
+
+def test_classify_pdf_rejects_body_above_max_size(client, restore_settings):
+    restore_settings.body_max_size = 16
+    response = client.post(f"/api/v1/classify/{TEST_UUID}", content=SAMPLE_PDF_BODY + b"x" * 64,
+                           headers={"Content-Type": "application/pdf"})
+    assert response.status_code == 413
+
+
+def test_classify_pdf_buffered_mode(client, restore_settings):
+    restore_settings.stream_body = False
+    response = client.post(f"/api/v1/classify/{TEST_UUID}", content=SAMPLE_PDF_BODY,
+                           headers={"Content-Type": "application/pdf"})
+    assert response.status_code == 200
+
+
+def test_classify_pdf_hands_spooled_uploads_over_memory_mapped(client, restore_settings, monkeypatch):
+    restore_settings.body_spool_threshold = 1024
+    bodies = []
+    classify_pdf_json = ClassificationServiceImpl.classify_pdf_json
+
+    def recording(self, uuid_param_str, body):
+        bodies.append((type(body), type(getattr(body, "obj", None)), len(body)))
+        return classify_pdf_json(self, uuid_param_str, body)
+
+    monkeypatch.setattr(ClassificationServiceImpl, "classify_pdf_json", recording)
+    response = client.post(f"/api/v1/classify/{TEST_UUID}", content=SAMPLE_PDF_BODY + b"x" * 10000,
+                           headers={"Content-Type": "application/pdf"})
+    assert response.status_code == 200
+    assert bodies == [(memoryview, mmap.mmap, len(SAMPLE_PDF_BODY) + 10000)]
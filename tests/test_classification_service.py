@@ -1,5 +1,6 @@
 # tests/test_classification_service.py  (or your preferred test directory structure)
 
+import random
 import unittest
 import uuid
 from datetime import datetime, timezone
@@ -11,8 +12,11 @@ from openapi_server.implementation.classification_service import (
     ClassificationServiceImpl,
     MOCK_RESPONSES,
     DEFAULT_RESPONSE_DATA,
-    EXPECTED_PDF_HEADER
+    EXPECTED_PDF_HEADER,
+    compile_response_template,
+    response_tables,
 )
+from openapi_server.implementation.corruption import CorruptionEngine
 from openapi_server.models.classification_result import ClassificationResult
 from openapi_server.models.result_item import ResultItem
 from openapi_server.models.qualified_value import QualifiedValue
@@ -151,19 +155,39 @@ class TestClassificationServiceImpl(unittest.TestCase):
         self.assertEqual(cm.exception.status_code, 400)
         self.assertEqual(cm.exception.detail, "Invalid file format: Does not appear to be a PDF.")
 
-    @patch('datetime.datetime', wraps=datetime)  # Use wraps to keep original datetime behavior unless mocked
     @patch('uuid.uuid4', return_value=FIXED_UUID_FOR_CLASS_ID)
-    def test_classify_pdf_internal_error_parsing_date(self, mock_uuid4, mock_datetime_cls):
-        """Test HTTPException 500 if date parsing fails internally."""
-        test_uuid = self._generate_uuid_ending_with("10")
+    def test_classify_pdf_json_matches_model(self, mock_uuid4):
+        """Test the precompiled JSON rendering is identical to serializing the response model."""
+        for ending in ("10", "25", "37", "99"):
+            test_uuid = str(self._generate_uuid_ending_with(ending))
+            self.service.corruption_engine = CorruptionEngine(random.Random(ending))
+            model_json = self.service.classify_pdf(uuid_param_str=test_uuid, body=SAMPLE_PDF_BODY).model_dump_json(by_alias=True)
+            self.service.corruption_engine = CorruptionEngine(random.Random(ending))
+            raw_json = self.service.classify_pdf_json(uuid_param_str=test_uuid, body=SAMPLE_PDF_BODY)
+            self.assertIsInstance(raw_json, bytes)
+            self.assertEqual(raw_json, model_json.encode("utf-8"))
+
+    def test_response_templates_are_compiled_for_all_mock_responses(self):
+        """Test every MOCK_RESPONSES entry has a template holding the parsed date."""
+        table = response_tables.table()
+        self.assertEqual(len(table), len(MOCK_RESPONSES))
+        for ending in MOCK_RESPONSES:
+            template = table.match(str(self._generate_uuid_ending_with(ending))).value
+            expected_dt = datetime.fromisoformat(MOCK_RESPONSES[ending]["doc_date_parsed"])
+            self.assertEqual(template.doc_date_parsed, expected_dt)
+
+    @patch('datetime.datetime', wraps=datetime)  # Use wraps to keep original datetime behavior unless mocked
+    def test_compile_response_template_invalid_date(self, mock_datetime_cls):
+        """Test the compiled template carries no parsed date if date parsing fails."""
         error_message = "Mocked ISO format error"
 
         # Mock the fromisoformat method specifically to raise an error
         mock_datetime_cls.fromisoformat.side_effect = ValueError(error_message)
 
-        result = self.service.classify_pdf(uuid_param_str=str(test_uuid), body=SAMPLE_PDF_BODY)
+        template = compile_response_template(MOCK_RESPONSES["10"])
 
-        self.assertIsNone(result.result.doc_date_parsed)
+        self.assertIsNone(template.doc_date_parsed)
+        self.assertIn(b'"doc_date_parsed":null', b"".join(template.json_fragments))
         mock_datetime_cls.fromisoformat.assert_called_once()  # Ensure our mock was hit
 
 # --- To Run the Tests ---
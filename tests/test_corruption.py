@@ -0,0 +1,79 @@
+# tests/test_corruption.py
+
+import random
+
+import pytest
+
+from openapi_server.implementation import corruption
+from openapi_server.implementation.corruption import PRINTABLE_CHARS, CorruptionEngine
+
+requires_numpy = pytest.mark.skipif(corruption.numpy is None, reason="NumPy not installed")
+
+
+def _engine(seed=42, use_numpy=False):
+    return CorruptionEngine(random.Random(seed), use_numpy=use_numpy)
+
+
+@pytest.mark.parametrize("value, score, expected", [
+    ("", 0.5, ""),
+    (None, 0.5, ""),
+    ("KFZ Reparatur", 1.0, "KFZ Reparatur"),
+    ("KFZ Reparatur", 1.5, "KFZ Reparatur"),  # invalid probability, no corruption
+    ("KFZ Reparatur", -0.1, "KFZ Reparatur"),
+    ("KFZ Reparatur", "not a float", "KFZ Reparatur"),
+    ("KFZ Reparatur", None, "KFZ Reparatur"),
+])
+def test_corrupt_edge_cases(value, score, expected):
+    assert _engine().corrupt(value, score) == expected
+
+
+def test_score_zero_replaces_every_character():
+    corrupted = _engine().corrupt("ä" * 1000, 0.0)
+    assert len(corrupted) == 1000
+    assert set(corrupted) <= set(PRINTABLE_CHARS)
+
+
+def test_score_string_is_accepted():
+    assert _engine().corrupt("DOC123", "1.0") == "DOC123"
+
+
+@pytest.mark.parametrize("items", [
+    [("DOC123", 0.5), ("2024-01-01", 0.3), ("Ihr Einkauf vielen Dank", 0.1)],  # per-character path
+    [("DOC123", 0.5), ("Kontoauszug 3-25" * 40, 0.3)],  # random block path
+])
+def test_seeded_engine_is_reproducible(items):
+    assert _engine(7).corrupt_many(items) == _engine(7).corrupt_many(items)
+    assert _engine(7).corrupt_many(items) != _engine(8).corrupt_many(items)
+
+
+def test_corrupt_many_keeps_order_and_lengths():
+    items = [("DOC123", 0.5), ("", 0.5), ("Kontoauszug 3-25", "bad"), ("Versicherungsfall 4711", 0.0)]
+    result = _engine().corrupt_many(items)
+    assert [len(value) for value in result] == [6, 0, 16, 22]
+    assert result[1] == ""
+    assert result[2] == "Kontoauszug 3-25"
+
+
+@pytest.mark.parametrize("score", [0.1, 0.5, 0.9, 0.99])
+def test_per_character_keep_probability(score):
+    value = "ä" * 200000  # never drawn as replacement, so kept characters are exact
+    corrupted = _engine(score).corrupt(value, score)
+    kept = corrupted.count("ä") / len(value)
+    assert kept == pytest.approx(score, abs=0.005)
+
+
+def test_replacements_are_uniform():
+    corrupted = _engine().corrupt("ä" * 95000, 0.0)
+    counts = [corrupted.count(char) for char in PRINTABLE_CHARS]
+    assert min(counts) > 800 and max(counts) < 1200
+
+
+def test_default_engine_uses_os_random():
+    engine = CorruptionEngine()
+    assert engine.corrupt("x" * 64, 0.0) != engine.corrupt("x" * 64, 0.0)
+
+
+@requires_numpy
+def test_numpy_and_python_paths_are_identical():
+    items = [("DOC123", 0.5), ("", 0.5), ("Ihr Einkauf vielen Dank äöü", 0.3), ("x" * 5000, 0.9)]
+    assert _engine(3, use_numpy=True).corrupt_many(items) == _engine(3, use_numpy=False).corrupt_many(items)
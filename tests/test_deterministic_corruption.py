@@ -0,0 +1,63 @@
+# tests/test_deterministic_corruption.py
+
+import asyncio
+import uuid
+
+import pytest
+
+from openapi_server import executor, request_context
+from openapi_server.implementation.classification_service import ClassificationServiceImpl
+from tests.conftest import SAMPLE_PDF_BODY
+
+UUID_36 = str(uuid.UUID("00000000-0000-0000-0000-000000000036"))
+UUID_19 = str(uuid.UUID("00000000-0000-0000-0000-000000000019"))
+
+
+@pytest.fixture
+def restore_settings(restore_settings):
+    yield restore_settings
+    executor.shutdown_executor()
+
+
+def _post(client, uuid_str, seed=None):
+    headers = {"Content-Type": "application/pdf"}
+    if seed is not None:
+        headers["X-Corruption-Seed"] = seed
+    response = client.post(f"/api/v1/classify/{uuid_str}", content=SAMPLE_PDF_BODY, headers=headers)
+    assert response.status_code == 200
+    return response.content
+
+
+def test_seed_header_gives_byte_identical_responses(client):
+    assert _post(client, UUID_36, seed="run-1") == _post(client, UUID_36, seed="run-1")
+
+
+def test_seed_header_output_depends_on_seed_and_uuid(client):
+    first = _post(client, UUID_19, seed="run-1")
+    assert first != _post(client, UUID_19, seed="run-2")
+    assert first != _post(client, UUID_36, seed="run-1")
+
+
+def test_without_seed_responses_differ(client):
+    assert _post(client, UUID_36) != _post(client, UUID_36)
+
+
+def test_configured_seed_applies_to_all_requests(client, restore_settings):
+    restore_settings.corruption_seed = "global"
+    assert _post(client, UUID_19) == _post(client, UUID_19)
+    assert _post(client, UUID_19) == _post(client, UUID_19, seed="global")
+    assert _post(client, UUID_19) != _post(client, UUID_19, seed="other")
+
+
+def test_seed_reaches_process_executor(restore_settings):
+    restore_settings.executor_kind = "process"
+    restore_settings.executor_workers = 1
+    service = ClassificationServiceImpl()
+
+    async def classify():
+        with request_context.bind(corruption_seed="run-1"):
+            return await service.classify_pdf_async(UUID_19, SAMPLE_PDF_BODY)
+
+    with request_context.bind(corruption_seed="run-1"):
+        expected = service.classify_pdf_json(UUID_19, SAMPLE_PDF_BODY)
+    assert asyncio.run(classify()) == expected
@@ -0,0 +1,66 @@
+# tests/test_executor.py
+
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from openapi_server import executor
+from openapi_server.implementation.classification_service import ClassificationServiceImpl
+from openapi_server.models.classification_result import ClassificationResult
+from tests.conftest import SAMPLE_PDF_BODY
+
+TEST_UUID = str(uuid.UUID("00000000-0000-0000-0000-000000000020"))
+
+
+@pytest.fixture
+def executor_settings(restore_settings):
+    executor.shutdown_executor()
+    yield restore_settings
+    executor.shutdown_executor()
+
+
+def _raise_bad_request():
+    raise HTTPException(status_code=400, detail="bad")
+
+
+def test_run_sync_uses_worker_thread(executor_settings):
+    thread_name = asyncio.run(executor.run_sync(lambda: threading.current_thread().name))
+    assert thread_name.startswith("classify")
+
+
+def test_run_sync_does_not_block_event_loop(executor_settings):
+    executor_settings.executor_workers = 4
+
+    async def run_concurrently():
+        started = time.perf_counter()
+        await asyncio.gather(*(executor.run_sync(time.sleep, 0.1) for _ in range(4)))
+        return time.perf_counter() - started
+
+    assert asyncio.run(run_concurrently()) < 0.3
+
+
+def test_run_sync_in_process_pool_propagates_http_exception(executor_settings):
+    executor_settings.executor_kind = "process"
+    executor_settings.executor_workers = 1
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(executor.run_sync(_raise_bad_request))
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == "bad"
+
+
+def test_unknown_executor_kind_is_rejected(executor_settings):
+    executor_settings.executor_kind = "fibers"
+    with pytest.raises(ValueError):
+        executor.get_executor()
+
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_classify_pdf_async_default_runs_sync_implementation(executor_settings, kind):
+    executor_settings.executor_kind = kind
+    executor_settings.executor_workers = 2
+    result = asyncio.run(ClassificationServiceImpl().classify_pdf_async(TEST_UUID, SAMPLE_PDF_BODY))
+    assert ClassificationResult.from_json(result).custom_id == TEST_UUID
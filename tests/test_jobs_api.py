@@ -0,0 +1,221 @@
+# tests/test_jobs_api.py
+
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from openapi_server import jobs
+from openapi_server.body_stream import SpooledBody
+from openapi_server.implementation.classification_service import MOCK_RESPONSES
+from openapi_server.jobs import (DONE, FAILED, QUEUED, InMemoryJobStore, Job, SqliteJobStore, callback_allowed,
+                                 parse_allowlist)
+from openapi_server.main import app
+from tests.conftest import SAMPLE_PDF_BODY
+
+UUID_10 = str(uuid.UUID("00000000-0000-0000-0000-000000000010"))
+PDF_HEADERS = {"Content-Type": "application/pdf"}
+
+
+def _submit(client, uuid_str=UUID_10, body=SAMPLE_PDF_BODY, headers=None):
+    return client.post(f"/api/v1/jobs/{uuid_str}", content=body, headers={**PDF_HEADERS, **(headers or {})})
+
+
+def test_submit_and_poll(restore_settings):
+    with TestClient(app) as client:
+        response = _submit(client)
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        assert response.headers["location"] == f"/api/v1/jobs/{job_id}"
+
+        job = client.get(response.headers["location"], params={"wait": 5}).json()
+    assert job["status"] == DONE
+    assert job["result"]["custom_id"] == UUID_10
+    assert job["result"]["result"]["kind"] == MOCK_RESPONSES["10"]["kind"]
+
+
+def test_failed_classification_is_reported_in_the_job(restore_settings):
+    with TestClient(app) as client:
+        job_id = _submit(client, uuid_str="not-a-uuid").json()["job_id"]
+        job = client.get(f"/api/v1/jobs/{job_id}", params={"wait": 5}).json()
+    assert job["status"] == FAILED
+    assert job["error"]["status"] == 422
+
+
+def test_invalid_body_is_rejected_at_submission(restore_settings):
+    with TestClient(app) as client:
+        response = _submit(client, body=b"IAMNOTAPDF")
+    assert response.status_code == 400
+
+
+def test_full_queue_is_rejected_with_429(restore_settings):
+    restore_settings.jobs_workers = 0
+    restore_settings.jobs_queue_depth = 1
+    with TestClient(app) as client:
+        assert _submit(client).status_code == 202
+        response = _submit(client)
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+
+
+def test_long_poll_returns_unfinished_job_after_timeout(restore_settings):
+    restore_settings.jobs_workers = 0
+    with TestClient(app) as client:
+        job_id = _submit(client).json()["job_id"]
+        started = time.monotonic()
+        job = client.get(f"/api/v1/jobs/{job_id}", params={"wait": 0.2}).json()
+    assert job["status"] == QUEUED
+    assert time.monotonic() - started >= 0.2
+
+
+def test_unknown_job(restore_settings):
+    with TestClient(app) as client:
+        assert client.get(f"/api/v1/jobs/{uuid.uuid4()}").status_code == 404
+
+
+def test_jobs_need_the_lifespan():
+    assert TestClient(app).get(f"/api/v1/jobs/{uuid.uuid4()}").status_code == 503
+
+
+def test_callback_receives_finished_job(restore_settings):
+    restore_settings.jobs_callback_allowlist = "callback.test"
+    received = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        received.append((str(request.url), json.loads(request.content)))
+        return httpx.Response(204)
+
+    with TestClient(app) as client:
+        jobs.get_job_manager()._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        job_id = _submit(client, headers={"X-Callback-Url": "http://callback.test/done"}).json()["job_id"]
+        client.get(f"/api/v1/jobs/{job_id}", params={"wait": 5})
+        for _ in range(50):
+            if received:
+                break
+            time.sleep(0.01)
+    assert received[0][0] == "http://callback.test/done"
+    assert received[0][1]["job_id"] == job_id
+    assert received[0][1]["result"]["custom_id"] == UUID_10
+
+
+@pytest.mark.parametrize("url", [
+    "http://elsewhere.test/done",
+    "file:///etc/passwd",
+    "http://callback.test:8080/done",
+    "not a url",
+])
+def test_callback_url_must_be_allowed(restore_settings, url):
+    restore_settings.jobs_callback_allowlist = "callback.test"
+    with TestClient(app) as client:
+        response = _submit(client, headers={"X-Callback-Url": url})
+    assert response.status_code == 400
+
+
+def test_callbacks_are_refused_without_an_allowlist(restore_settings):
+    with TestClient(app) as client:
+        response = _submit(client, headers={"X-Callback-Url": "http://callback.test/done"})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("url, allowed", [
+    ("https://hooks.example.com/done", True),
+    ("http://a.b.example.com:80/done", True),
+    ("http://a.b.example.com:8080/done", False),
+    ("http://example.com/done", False),
+    ("http://evil-example.com/done", False),
+    ("http://localhost:9000/done", True),
+    ("http://localhost/done", False),
+    ("ftp://hooks.example.com/done", False),
+])
+def test_callback_allowlist_matching(url, allowed):
+    assert callback_allowed(url, parse_allowlist(["*.example.com", " localhost:9000", ""])) is allowed
+
+
+def test_queued_uploads_stay_spooled(restore_settings):
+    restore_settings.jobs_workers = 0
+    restore_settings.body_spool_threshold = 8
+    with TestClient(app) as client:
+        job_id = _submit(client).json()["job_id"]
+        upload = jobs.get_job_manager().store._bodies[job_id]
+        assert isinstance(upload, SpooledBody)
+        assert upload.rolled_to_disk
+    assert upload.file.closed
+
+
+def test_sqlite_store_is_called_off_the_event_loop(restore_settings, tmp_path, monkeypatch):
+    restore_settings.jobs_store = "sqlite"
+    restore_settings.jobs_sqlite_path = str(tmp_path / "jobs.sqlite3")
+    loop_threads, store_threads = set(), set()
+    execute = SqliteJobStore._execute
+
+    def recording_execute(self, *args):
+        store_threads.add(threading.get_ident())
+        return execute(self, *args)
+
+    monkeypatch.setattr(SqliteJobStore, "_execute", recording_execute)
+
+    with TestClient(app) as client:
+        loop_threads.add(client.portal.call(threading.get_ident))
+        job_id = _submit(client).json()["job_id"]
+        job = client.get(f"/api/v1/jobs/{job_id}", params={"wait": 5}).json()
+    assert job["status"] == DONE
+    assert store_threads and not store_threads & loop_threads
+
+
+def test_sqlite_store_requeues_unfinished_jobs_on_restart(restore_settings, tmp_path):
+    restore_settings.jobs_store = "sqlite"
+    restore_settings.jobs_sqlite_path = str(tmp_path / "jobs.sqlite3")
+    restore_settings.jobs_workers = 0
+    with TestClient(app) as client:
+        job_id = _submit(client).json()["job_id"]
+
+    restore_settings.jobs_workers = 1
+    with TestClient(app) as client:
+        job = client.get(f"/api/v1/jobs/{job_id}", params={"wait": 5}).json()
+    assert job["status"] == DONE
+    assert job["result"]["custom_id"] == UUID_10
+
+
+@pytest.mark.parametrize("make_store", [
+    lambda tmp_path: InMemoryJobStore(ttl=60),
+    lambda tmp_path: SqliteJobStore(ttl=60, path=str(tmp_path / "jobs.sqlite3")),
+])
+def test_store_evicts_finished_jobs_after_ttl(make_store, tmp_path):
+    store = make_store(tmp_path)
+    store.create(Job(id="a", uuid=UUID_10), b"body-a")
+    store.create(Job(id="b", uuid=UUID_10), b"body-b")
+    assert store.take_body("a") == b"body-a"
+
+    finished = Job(id="a", uuid=UUID_10, status=DONE, finished_at=time.time() - 120, result=b"{}")
+    store.update(finished)
+    assert store.get("a") is None
+    assert store.get("b").status == QUEUED
+
+    assert store.evict_expired(time.time()) == 1
+    assert store.evict_expired(time.time()) == 0
+    store.close()
+
+
+def test_sqlite_store_only_requeues_jobs_of_exited_workers(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    store = SqliteJobStore(ttl=60, path=path)
+    for job_id in ("live", "exited", "own"):
+        store.create(Job(id=job_id, uuid=UUID_10), b"body")
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    with sqlite3.connect(path) as db:
+        db.execute("UPDATE jobs SET owner = ? WHERE id = 'live'", (f"{os.getppid()}:other",))
+        db.execute("UPDATE jobs SET owner = ? WHERE id = 'exited'", (f"{exited.pid}:other",))
+
+    assert [job.id for job in store.unfinished()] == ["exited"]
+    # claimed, so not handed out twice
+    assert store.unfinished() == []
+    store.close()
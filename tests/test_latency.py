@@ -0,0 +1,121 @@
+# tests/test_latency.py
+
+import asyncio
+import random
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from openapi_server import request_context
+from openapi_server.implementation.classification_service import ClassificationServiceImpl
+from openapi_server.implementation.latency import (
+    FixedLatency,
+    LatencyProfile,
+    LogNormalLatency,
+    SizeLatency,
+    SpikeLatency,
+    parse_profile,
+    resolve_profile,
+)
+from openapi_server.main import app
+from tests.conftest import SAMPLE_PDF_BODY
+
+UUID_10 = str(uuid.UUID("00000000-0000-0000-0000-000000000010"))
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("none", LatencyProfile()),
+    ("fixed:200", FixedLatency(ms=200)),
+    ("fixed:ms=200", FixedLatency(ms=200)),
+    ("lognormal:median=50, sigma=1", LogNormalLatency(median=50, sigma=1)),
+    ("size:5,base=2", SizeLatency(ms_per_mb=5, base=2)),
+    ("SPIKE:p99=500", SpikeLatency(p99=500)),
+])
+def test_parse_profile(spec, expected):
+    assert parse_profile(spec) == expected
+
+
+@pytest.mark.parametrize("spec", ["slow", "fixed:seconds=1", "fixed:fast", "fixed:1,2"])
+def test_parse_profile_rejects_invalid_specs(spec):
+    with pytest.raises(ValueError):
+        parse_profile(spec)
+
+
+@pytest.mark.parametrize("spec, message", [
+    ("lognormal:0", "'median' must be above 0"),
+    ("lognormal:median=-1", "'median' must be above 0"),
+    ("lognormal:median=100,sigma=-1", "'sigma' must not be negative"),
+    ("normal:mean=100,stddev=-5", "'stddev' must not be negative"),
+    ("fixed:inf", "'ms' must be finite"),
+    ("fixed:nan", "'ms' must be finite"),
+    ("fixed:-1", "'ms' must not be negative"),
+    ("size:ms_per_mb=-1", "'ms_per_mb' must not be negative"),
+    ("spike:rate=1.5", "'rate' must be from 0 to 1"),
+    ("spike:rate=-0.1", "'rate' must not be negative"),
+])
+def test_parse_profile_rejects_out_of_range_values(spec, message):
+    with pytest.raises(ValueError, match=message):
+        parse_profile(spec)
+    response = TestClient(app).post(f"/api/v1/classify/{UUID_10}", content=SAMPLE_PDF_BODY,
+                                    headers={"Content-Type": "application/pdf", "X-Latency-Profile": spec})
+    assert response.status_code == 400
+
+
+def test_spike_profile_hits_configured_p99():
+    rng = random.Random(1)
+    delays = sorted(SpikeLatency(base=10, p99=1000).delay_ms(0, rng) for _ in range(100_000))
+    assert delays[50_000] == 10
+    assert delays[99_000] == pytest.approx(1000, rel=0.05)
+
+
+def test_size_profile_is_proportional_to_body_size():
+    assert SizeLatency(ms_per_mb=20, base=5).delay_ms(3 * 1024 * 1024, random.Random()) == 65
+
+
+def test_profile_precedence(restore_settings):
+    restore_settings.latency_profile = "fixed:1"
+    restore_settings.latency_suffix_profiles = "0=fixed:2;10=fixed:3"
+    assert resolve_profile(UUID_10) == FixedLatency(3)
+    assert resolve_profile(UUID_10[:-2] + "15") == FixedLatency(1)
+    assert resolve_profile(UUID_10[:-2] + "20") == FixedLatency(2)
+    with request_context.bind(latency_profile="fixed:4"):
+        assert resolve_profile(UUID_10) == FixedLatency(4)
+
+
+def test_latency_header_delays_response():
+    client = TestClient(app)
+    started = time.monotonic()
+    response = client.post(f"/api/v1/classify/{UUID_10}", content=SAMPLE_PDF_BODY,
+                           headers={"Content-Type": "application/pdf", "X-Latency-Profile": "fixed:100"})
+    assert response.status_code == 200
+    assert time.monotonic() - started >= 0.1
+
+
+def test_invalid_latency_header_is_rejected():
+    response = TestClient(app).post(f"/api/v1/classify/{UUID_10}", content=SAMPLE_PDF_BODY,
+                                    headers={"Content-Type": "application/pdf", "X-Latency-Profile": "slow"})
+    assert response.status_code == 400
+
+
+def _classify_concurrently(count):
+    service = ClassificationServiceImpl()
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(*(service.classify_pdf_async(UUID_10, SAMPLE_PDF_BODY) for _ in range(count)))
+        return time.monotonic() - started
+
+    return asyncio.run(run())
+
+
+def test_delays_do_not_block_each_other(restore_settings):
+    restore_settings.latency_profile = "fixed:100"
+    assert _classify_concurrently(20) < 1.0
+
+
+def test_slots_queue_requests(restore_settings):
+    restore_settings.latency_profile = "fixed:50"
+    restore_settings.latency_slots = 2
+    assert _classify_concurrently(6) >= 0.15
@@ -0,0 +1,117 @@
+# tests/test_metrics.py
+
+import json
+import re
+import subprocess
+import sys
+import threading
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from openapi_server.main import app
+from openapi_server.metrics import (Counter, Gauge, Histogram, MetricsRegistry, SharedMetrics, merge_families,
+                                    render_families)
+from tests.conftest import SAMPLE_PDF_BODY
+
+UUID_10 = str(uuid.UUID("00000000-0000-0000-0000-000000000010"))
+
+
+def _value(text: str, sample: str) -> float:
+    match = re.search(rf"^{re.escape(sample)} (\S+)$", text, re.MULTILINE)
+    assert match, f"{sample} not in metrics"
+    return float(match.group(1))
+
+
+def test_counter_sums_increments_of_all_threads():
+    counter = Counter("test_total", "Test.", ["kind"])
+
+    def work():
+        for _ in range(1000):
+            counter.labels("a").inc()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.labels("a").value == 8000
+    assert counter.render() == ["# HELP test_total Test.", "# TYPE test_total counter", 'test_total{kind="a"} 8000']
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{le="0.1"} 1',
+        'test_seconds_bucket{le="1"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        "test_seconds_sum 6.05",
+        "test_seconds_count 4",
+    ]
+
+
+def test_registry_rejects_duplicate_names():
+    registry = MetricsRegistry()
+    registry.register(Gauge("test_gauge", "Test."))
+    with pytest.raises(ValueError):
+        registry.register(Gauge("test_gauge", "Test."))
+
+
+def test_metrics_endpoint_reports_stages_and_requests():
+    client = TestClient(app)
+    before = client.get("/metrics").text
+    assert client.post(f"/api/v1/classify/{UUID_10}", content=SAMPLE_PDF_BODY,
+                       headers={"Content-Type": "application/pdf"}).status_code == 200
+    assert client.post(f"/api/v1/classify/{UUID_10}", content=b"IAMNOTAPDF",
+                       headers={"Content-Type": "application/pdf"}).status_code == 400
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    for stage in ("body_read", "parse_uuid", "validate_body", "corrupt", "serialization"):
+        assert _value(text, f'pdfclassifier_stage_seconds_count{{stage="{stage}"}}') >= 1
+
+    def delta(sample):
+        return _value(text, sample) - (_value(before, sample) if sample in before else 0)
+
+    assert delta('pdfclassifier_classifications_total{kind="INVOICE",suffix="10"}') == 1
+    assert delta('pdfclassifier_http_requests_total{route="/api/v1/classify/{uuid}",status="200"}') == 1
+    assert delta('pdfclassifier_http_requests_total{route="/api/v1/classify/{uuid}",status="400"}') == 1
+    assert delta('pdfclassifier_request_body_bytes_count{route="/api/v1/classify/{uuid}"}') == 2
+    # the metrics request itself is in flight
+    assert _value(text, "pdfclassifier_http_requests_in_flight") == 1
+
+
+def test_merge_families_sums_samples_of_all_workers():
+    def snapshot(requests, in_flight):
+        counter = Counter("test_total", "Test.", ["route"])
+        counter.labels("/a").inc(requests)
+        gauge = Gauge("test_in_flight", "Test.")
+        gauge.set(in_flight)
+        return [counter.collect(), gauge.collect()]
+
+    merged = merge_families([snapshot(2, 1), snapshot(3, 1)])
+    assert render_families(merged).splitlines() == [
+        "# HELP test_total Test.", "# TYPE test_total counter", 'test_total{route="/a"} 5',
+        "# HELP test_in_flight Test.", "# TYPE test_in_flight gauge", "test_in_flight 2",
+    ]
+
+
+def test_shared_metrics_keep_counters_of_exited_workers(tmp_path):
+    live = MetricsRegistry()
+    live.counter("test_total", "Test.").inc(2)
+    exited = MetricsRegistry()
+    exited.counter("test_total", "Test.").inc(3)
+    exited.gauge("test_in_flight", "Test.").set(1)
+
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    with open(tmp_path / f"{process.pid}.json", "w") as f:
+        json.dump({"pid": process.pid, "families": exited.collect()}, f)
+
+    text = SharedMetrics(str(tmp_path), live).render()
+    assert _value(text, "test_total") == 5
+    assert "test_in_flight" not in text
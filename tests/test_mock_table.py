@@ -0,0 +1,221 @@
+# tests/test_mock_table.py
+
+import csv
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from openapi_server.implementation import mock_table
+from openapi_server.implementation.classification_service import MOCK_RESPONSES
+from openapi_server.implementation.mock_table import ResponseTable, Rule, TableWatcher, load_rules
+from openapi_server.main import app
+from tests.conftest import SAMPLE_PDF_BODY
+
+FIELDS = ("kind", "doc_id_val", "doc_id_score", "doc_date_sic_val", "doc_date_sic_score", "doc_date_parsed",
+          "doc_subject_val", "doc_subject_score")
+EXACT_UUID = "12345678-0000-0000-0000-000000000010"
+
+
+def _fields(kind: str) -> dict:
+    return {**MOCK_RESPONSES["10"], "kind": kind}
+
+
+def _rules(*rules) -> list:
+    return [Rule(match, pattern, _fields(kind)) for match, pattern, kind in rules]
+
+
+def _write_csv(path, rules):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, ["match", "pattern", *FIELDS])
+        writer.writeheader()
+        for match, pattern, kind in rules:
+            writer.writerow({"match": match, "pattern": pattern, **_fields(kind)})
+
+
+def _replace_csv(path, rules):
+    """Write the table the way it should be updated: aside, then renamed over the old one."""
+    _write_csv(f"{path}.tmp", rules)
+    os.replace(f"{path}.tmp", path)
+
+
+def test_precedence():
+    table = ResponseTable(_rules(
+        ("regex", r"1234.*", "REGEX_LATE"),
+        ("regex", r".*[0-9]{2}", "REGEX"),
+        ("prefix", "1234", "PREFIX"),
+        ("prefix", "12345", "LONGER_PREFIX"),
+        ("suffix", "10", "SUFFIX"),
+        ("suffix", "0010", "LONGER_SUFFIX"),
+        ("exact", EXACT_UUID.upper(), "EXACT"),
+    ))
+
+    def kind(uuid_str):
+        entry = table.match(uuid_str)
+        return None if entry is None else entry.value["kind"]
+
+    assert kind(EXACT_UUID) == "EXACT"
+    assert kind("22345678-0000-0000-0000-000000000010") == "LONGER_SUFFIX"
+    assert kind("22345678-0000-0000-0000-000000000110") == "SUFFIX"
+    assert kind("12345678-0000-0000-0000-000000000020") == "LONGER_PREFIX"
+    assert kind("12340000-0000-0000-0000-000000000020") == "PREFIX"
+    assert kind("99990000-0000-0000-0000-000000000020") == "REGEX"
+    assert kind("99990000-0000-0000-0000-00000000002a") is None
+    assert table.match(EXACT_UUID).key == f"exact:{EXACT_UUID}"
+
+
+def test_regex_rules_that_do_not_combine_are_tried_in_order():
+    table = ResponseTable(_rules(("regex", r"(?P<end>.*a)", "A"), ("regex", r"(?P<end>.*b)", "B")))
+    assert table.match("0000000b").value["kind"] == "B"
+    assert table.match("0000000c") is None
+
+
+@pytest.mark.parametrize("pattern", [r"(.)\1.*", r"(a)?(?(1)a|bb).*"])
+def test_regex_rules_with_numbered_references_are_tried_in_order(pattern):
+    table = ResponseTable(_rules(("regex", "f.*", "F"), ("regex", pattern, "REPEAT")))
+    assert table._regex is None
+    assert table.match("aa000000").value["kind"] == "REPEAT"
+    assert table.match("f0000000").value["kind"] == "F"
+    assert table.match("ab000000") is None
+    # an escaped backslash before a digit is no reference
+    assert ResponseTable(_rules(("regex", r"f\\1", "F"), ("regex", "a.*", "A")))._regex is not None
+
+
+def test_thousands_of_rules():
+    rules = [("suffix", f"{n:04x}", f"S{n}") for n in range(4096)]
+    rules += [("prefix", f"{n:05x}", f"P{n}") for n in range(1024)]
+    table = ResponseTable(_rules(*rules))
+    assert len(table) == 5120
+    assert table.match("ffff0000-0000-0000-0000-000000000abc").value["kind"] == "S2748"
+    assert table.match("003ff000-0000-0000-0000-00000000000g").value["kind"] == "P1023"
+
+
+@pytest.mark.parametrize("extension", ["csv", "json", "sqlite"])
+def test_table_formats(tmp_path, extension):
+    rules = [("suffix", "10", "SUFFIX"), ("exact", EXACT_UUID, "EXACT"), ("regex", "f.*", "REGEX")]
+    path = tmp_path / f"table.{extension}"
+    rows = [{"match": match, "pattern": pattern, **_fields(kind)} for match, pattern, kind in rules]
+    if extension == "csv":
+        _write_csv(path, rules)
+    elif extension == "json":
+        path.write_text(json.dumps(rows))
+    else:
+        with sqlite3.connect(path) as connection:
+            connection.execute(f"CREATE TABLE mock_responses (match, pattern, {', '.join(FIELDS)})")
+            connection.executemany(f"INSERT INTO mock_responses VALUES ({', '.join('?' * (len(FIELDS) + 2))})",
+                                   [tuple(row.values()) for row in rows])
+        connection.close()
+    assert load_rules(str(path)) == _rules(*rules)
+
+
+def test_packaged_table_is_the_suffix_table():
+    rules = load_rules(mock_table.DEFAULT_TABLE_PATH)
+    assert {rule.match for rule in rules} == {"suffix"}
+    assert MOCK_RESPONSES["10"]["doc_id_score"] == 0.99
+
+
+def test_distributed_table_is_the_packaged_table():
+    # a copy rather than a link, so it survives archives and checkouts without symlinks
+    dist_copy = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dist-files",
+                             "mock-data.csv")
+    assert not os.path.islink(dist_copy)
+    with open(dist_copy, "rb") as copy, open(mock_table.DEFAULT_TABLE_PATH, "rb") as packaged:
+        assert copy.read() == packaged.read()
+
+
+@pytest.mark.parametrize("rules, error", [
+    ([("infix", "10", "X")], "Unknown match kind 'infix'"),
+    ([("regex", "(", "X")], "rule 1: missing \\), unterminated subpattern"),
+    ([("exact", "no-uuid", "X")], "badly formed hexadecimal UUID string"),
+    ([("suffix", "10", "X"), ("suffix", "10", "Y")], "rule 2: duplicate suffix rule '10'"),
+])
+def test_invalid_tables(tmp_path, rules, error):
+    path = tmp_path / "table.csv"
+    _write_csv(path, rules)
+    with pytest.raises(ValueError, match=error):
+        load_rules(str(path))
+
+
+def test_watcher_swaps_in_changed_tables(tmp_path, restore_settings):
+    path = tmp_path / "table.csv"
+    _write_csv(path, [("suffix", "10", "FIRST")])
+    restore_settings.mock_table_path = str(path)
+    restore_settings.mock_table_reload_interval = 0.05
+    watcher = TableWatcher()
+    first = watcher.table()
+    try:
+        _replace_csv(path, [("suffix", "10", "SECOND"), ("suffix", "20", "NEW")])
+        deadline = time.monotonic() + 5
+        while watcher.table() is first:
+            assert time.monotonic() < deadline, "table was not reloaded"
+            time.sleep(0.01)
+        second = watcher.table()
+        assert first.match(EXACT_UUID).value["kind"] == "FIRST"
+        assert second.match(EXACT_UUID).value["kind"] == "SECOND" and len(second) == 2
+        assert second.version != first.version
+
+        # a broken table is reported and the current one kept
+        failed = mock_table.table_reloads_total.labels("failed").value
+        _replace_csv(path, [("suffix", "10", "X"), ("suffix", "10", "Y")])
+        while mock_table.table_reloads_total.labels("failed").value == failed:
+            assert time.monotonic() < deadline, "broken table was not noticed"
+            time.sleep(0.01)
+        assert watcher.table() is second
+    finally:
+        watcher.stop()
+
+
+def test_reload_without_watching(tmp_path, restore_settings):
+    path = tmp_path / "table.json"
+    path.write_text(json.dumps({"10": _fields("FIRST")}))
+    restore_settings.mock_table_path = str(path)
+    restore_settings.mock_table_reload_interval = 0
+    watcher = TableWatcher()
+    assert watcher.table().match(EXACT_UUID).value["kind"] == "FIRST"
+    assert watcher.reload() is False
+    path.write_text(json.dumps({"10": _fields("SECOND")}))
+    os.utime(path, ns=(0, 0))
+    assert watcher.reload() is True
+    assert watcher.table().match(EXACT_UUID).value["kind"] == "SECOND"
+
+
+def test_preloaded_table_is_used_without_watching(tmp_path, restore_settings):
+    path = tmp_path / "table.csv"
+    _write_csv(path, [("suffix", "10", "FIRST")])
+    restore_settings.mock_table_path = str(path)
+    restore_settings.mock_table_reload_interval = 0.05
+    watcher = TableWatcher()
+    preloaded = watcher.load()
+    assert watcher._thread is None
+    try:
+        # e.g. in a forked worker: the same table, now watched
+        assert watcher.table() is preloaded
+        assert watcher._thread is not None
+    finally:
+        watcher.stop()
+
+
+def test_configured_table_is_served(tmp_path, restore_settings):
+    path = tmp_path / "table.csv"
+    _write_csv(path, [("exact", EXACT_UUID, "INVOICE"), ("prefix", "0", "LETTER")])
+    restore_settings.mock_table_path = str(path)
+    with TestClient(app) as client:
+        kinds = [client.post(f"/api/v1/classify/{uuid_str}", content=SAMPLE_PDF_BODY,
+                             headers={"Content-Type": "application/pdf"}).json()["result"]["kind"]
+                 for uuid_str in (EXACT_UUID, str(uuid.UUID(int=10)), "f" + EXACT_UUID[1:])]
+    assert kinds == ["INVOICE", "LETTER", "UNKNOWN"]
+
+
+def test_invalid_table_fails_the_start(tmp_path, restore_settings):
+    path = tmp_path / "table.json"
+    fields = _fields("INVOICE")
+    del fields["kind"]
+    path.write_text(json.dumps({"10": fields}))
+    restore_settings.mock_table_path = str(path)
+    with pytest.raises(ValueError, match="suffix rule '10' is no valid response: KeyError"):
+        with TestClient(app):
+            pass
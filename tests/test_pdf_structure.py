@@ -0,0 +1,174 @@
+# tests/test_pdf_structure.py
+
+import time
+import uuid
+import zlib
+
+import pytest
+
+from openapi_server.implementation.pdf_structure import PdfBudgetExceeded, PdfStructureError, inspect_pdf
+
+UUID_10 = str(uuid.UUID("00000000-0000-0000-0000-000000000010"))
+
+
+def _objects(pages: int) -> list:
+    kids = b" ".join(b"%d 0 R" % (3 + i) for i in range(pages))
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages]
+    objects += [b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] >>"] * pages
+    return objects
+
+
+def _write_objects(out: bytes, objects: list, first: int = 1):
+    offsets = []
+    for number, body in enumerate(objects, first):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    return out, offsets
+
+
+def build_table_pdf(pages: int = 3, trailer_extra: bytes = b"") -> bytes:
+    out, offsets = _write_objects(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n", _objects(pages))
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R%s >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, trailer_extra, xref)
+    return out
+
+
+def build_stream_pdf(pages: int = 3, trailer_extra: bytes = b"", object_stream_header: bytes = b"2 0 ") -> bytes:
+    """PDF 1.5 style: the page tree root in an object stream, a PNG-predicted xref stream."""
+    catalog, pages_object, *page_objects = _objects(pages)
+    out, offsets = b"%PDF-1.5\n", []
+    for number, body in [(1, catalog)] + list(enumerate(page_objects, 3)):
+        offsets.append((number, len(out)))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    object_stream_number = 3 + pages
+    header = object_stream_header
+    content = zlib.compress(header + pages_object)
+    offsets.append((object_stream_number, len(out)))
+    out += (b"%d 0 obj\n<< /Type /ObjStm /N 1 /First %d /Filter /FlateDecode /Length %d >>\nstream\n"
+            % (object_stream_number, len(header), len(content)) + content + b"\nendstream\nendobj\n")
+
+    xref_number = object_stream_number + 1
+    xref_offset = len(out)
+    entries = {0: (0, 0, 65535), 2: (2, object_stream_number, 0), xref_number: (1, xref_offset, 0)}
+    entries.update({number: (1, offset, 0) for number, offset in offsets})
+    rows, previous = [], bytes(7)
+    for number in range(xref_number + 1):
+        kind, field2, field3 = entries[number]
+        row = bytes([kind]) + field2.to_bytes(4, "big") + field3.to_bytes(2, "big")
+        rows.append(b"\x02" + bytes((a - b) & 0xFF for a, b in zip(row, previous)))
+        previous = row
+    data = zlib.compress(b"".join(rows))
+    out += (b"%d 0 obj\n<< /Type /XRef /Size %d /W [1 4 2] /Root 1 0 R%s /Filter /FlateDecode"
+            b" /DecodeParms << /Predictor 12 /Columns 7 >> /Length %d >>\nstream\n"
+            % (xref_number, xref_number + 1, trailer_extra, len(data)) + data + b"\nendstream\nendobj\n")
+    out += b"startxref\n%d\n%%%%EOF\n" % xref_offset
+    return out
+
+
+def append_update(pdf: bytes, pages: int) -> bytes:
+    """Incremental update replacing the page tree root's /Count."""
+    previous_xref = int(pdf.rsplit(b"startxref", 1)[1].split()[0])
+    size = int(pdf.split(b"/Size ", 1)[1].split()[0])
+    offset = len(pdf)
+    out = pdf + b"2 0 obj\n<< /Type /Pages /Kids [] /Count %d >>\nendobj\n" % pages
+    xref = len(out)
+    out += b"xref\n2 1\n%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R /Prev %d >>\nstartxref\n%d\n%%%%EOF\n" % (size, previous_xref, xref)
+    return out
+
+
+def test_xref_table():
+    structure = inspect_pdf(build_table_pdf(pages=3))
+    assert (structure.version, structure.xref, structure.page_count) == ("1.7", "table", 3)
+    assert (structure.objects, structure.encrypted, structure.incremental_updates) == (6, False, 0)
+
+
+def test_xref_stream_and_object_stream():
+    structure = inspect_pdf(build_stream_pdf(pages=4))
+    assert (structure.version, structure.xref, structure.page_count) == ("1.5", "stream", 4)
+
+
+def test_trailer_ending_in_a_number():
+    # nothing follows the last value but the end of the file, which is no truncation
+    pdf = build_table_pdf(pages=1).replace(b"<< /Size 4 /Root 1 0 R >>", b"<</Root 1 0 R/Size 4>>")
+    assert pdf.endswith(b"<</Root 1 0 R/Size 4>>\nstartxref\n%d\n%%%%EOF\n" % int(pdf.split()[-2]))
+    assert inspect_pdf(pdf).page_count == 1
+
+
+def test_incremental_update_wins():
+    structure = inspect_pdf(append_update(build_table_pdf(pages=3), pages=5))
+    assert (structure.page_count, structure.incremental_updates) == (5, 1)
+
+
+def test_encryption_is_reported():
+    assert inspect_pdf(build_table_pdf(trailer_extra=b" /Encrypt 99 0 R")).encrypted
+    # the page tree in an encrypted object stream cannot be read
+    structure = inspect_pdf(build_stream_pdf(trailer_extra=b" /Encrypt 99 0 R"))
+    assert structure.encrypted and structure.page_count is None
+
+
+def test_body_is_read_through_a_memoryview():
+    body = bytearray(build_table_pdf(pages=2))
+    assert inspect_pdf(memoryview(body)).page_count == 2
+
+
+@pytest.mark.parametrize("body, message", [
+    (build_table_pdf()[:-200], "No %%EOF"),
+    (b"%PDF-1.4\n<html><body>502 Bad Gateway</body></html>\n", "No %%EOF"),
+    (build_table_pdf().replace(b"startxref", b"startxxxx"), "No startxref"),
+    (build_table_pdf().replace(b"/Root 1 0 R", b"/Info 1 0 R"), "without /Root"),
+    (build_table_pdf().replace(b"/Count 3", b"/Count x"), "valid /Count"),
+])
+def test_broken_documents_are_rejected(body, message):
+    with pytest.raises(PdfStructureError, match=message):
+        inspect_pdf(body)
+
+
+def test_budget_is_enforced():
+    with pytest.raises(PdfBudgetExceeded):
+        inspect_pdf(build_stream_pdf(), budget_ms=0)
+
+
+def _with_xref_stream_data(pdf: bytes, data: bytes) -> bytes:
+    """Replace the compressed data of the xref stream built by build_stream_pdf."""
+    head, rest = pdf.rsplit(b"/Length ", 1)
+    length = int(rest.split(b" ", 1)[0])
+    stream_start = rest.index(b"stream\n") + len(b"stream\n")
+    tail = rest[stream_start + length:]
+    return head + b"/Length %d >>\nstream\n" % len(data) + data + tail
+
+
+def test_budget_is_enforced_while_decoding_predicted_rows():
+    # a small upload whose xref stream inflates to megabytes of predictor rows
+    rows = b"\x02" + bytes(7)
+    body = _with_xref_stream_data(build_stream_pdf(), zlib.compress(rows * (3 * 1024 * 1024 // len(rows)), 9))
+    assert len(body) < 64 * 1024
+    started = time.monotonic()
+    with pytest.raises(PdfBudgetExceeded):
+        inspect_pdf(body, budget_ms=50)
+    assert time.monotonic() - started < 1
+    with pytest.raises(PdfBudgetExceeded, match="decompresses to more than"):
+        inspect_pdf(_with_xref_stream_data(build_stream_pdf(), zlib.compress(bytes(32 * 1024 * 1024), 9)))
+
+
+@pytest.mark.parametrize("body, message", [
+    (build_table_pdf().replace(b"/MediaBox [0 0 595 842]", b"/MediaBox " + b"[" * 3000 + b"]" * 3000), "nested deeper"),
+    (build_table_pdf().replace(b"/Count 3", b"/Count [" + b"[" * 3000), "nested deeper"),
+    (build_table_pdf().replace(b" 00000 n \n", b" 0000x n \n", 1), "Malformed xref entry"),
+    (build_stream_pdf().replace(b"/DecodeParms << /Predictor 12 /Columns 7 >>", b"/DecodeParms 5"),
+     "/DecodeParms is not a dictionary"),
+    (build_stream_pdf().replace(b"/Columns 7", b"/Columns -1"), "/Columns must be"),
+    (build_stream_pdf().replace(b"/Predictor 12", b"/Predictor /Up"), "/Predictor is not a number"),
+    (build_stream_pdf().replace(b"/W [1 4 2]", b"/W [1 4 2] /Index 7"), "Malformed PDF"),
+])
+def test_malformed_values_are_structure_errors(body, message):
+    with pytest.raises(PdfStructureError, match=message):
+        inspect_pdf(body)
+
+
+def test_malformed_object_stream_header():
+    with pytest.raises(PdfStructureError, match="Object stream 6 has a malformed header"):
+        inspect_pdf(build_stream_pdf(object_stream_header=b"2 x "))
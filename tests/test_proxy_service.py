@@ -0,0 +1,259 @@
+# tests/test_proxy_service.py
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from openapi_server import request_context, result_cache
+from openapi_server.implementation import proxy_service
+from openapi_server.implementation.proxy_service import ProxyClassificationServiceImpl
+from openapi_server.main import app
+from openapi_server.settings import settings
+from tests.conftest import SAMPLE_PDF_BODY
+
+UUID_10 = str(uuid.UUID("00000000-0000-0000-0000-000000000010"))
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+@pytest.fixture
+def restore_settings(restore_settings):
+    restore_settings.proxy_upstream_url = "http://upstream/api/v1"
+    restore_settings.proxy_retry_backoff_ms = 0
+    return restore_settings
+
+
+def _classify(handler, body=SAMPLE_PDF_BODY):
+    """Classify ``body`` through a proxy whose upstream is ``handler``."""
+    async def run():
+        proxy = ProxyClassificationServiceImpl(httpx.MockTransport(handler))
+        try:
+            return await proxy.classify_pdf_async(UUID_10, body)
+        finally:
+            await proxy.shutdown()
+    return asyncio.run(run())
+
+
+def _answers(*responses):
+    """A handler answering with ``responses`` in turn and recording the requests."""
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append((request, await request.aread()))
+        answer = responses[min(len(requests), len(responses)) - 1]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    return handler, requests
+
+
+def test_upload_is_forwarded_in_chunks(restore_settings):
+    body = memoryview(SAMPLE_PDF_BODY + bytes(200 * 1024))
+    handler, requests = _answers(httpx.Response(200, content=b'{"custom_id": "x"}'))
+    assert _classify(handler, body) == b'{"custom_id": "x"}'
+    request, content = requests[0]
+    assert request.url == f"http://upstream/api/v1/classify/{UUID_10}"
+    assert request.headers["Content-Length"] == str(len(body)) and content == body
+
+
+def test_uuid_is_forwarded_as_one_path_segment(restore_settings):
+    handler, requests = _answers(httpx.Response(200, content=b'{"custom_id": "x"}'))
+
+    async def run():
+        proxy = ProxyClassificationServiceImpl(httpx.MockTransport(handler))
+        try:
+            await proxy.classify_pdf_async("../x?y#z/w", SAMPLE_PDF_BODY)
+        finally:
+            await proxy.shutdown()
+
+    asyncio.run(run())
+    assert requests[0][0].url.raw_path == b"/api/v1/classify/%2E%2E%2Fx%3Fy%23z%2Fw"
+
+
+def test_result_cache_keys_on_the_forwarded_request(restore_settings):
+    restore_settings.result_cache = True
+    handler, requests = _answers(*[httpx.Response(200, json={"custom_id": "x", "result": {"kind": kind}})
+                                   for kind in ("FIRST", "SECOND", "SEEDED")])
+    uuid_20 = str(uuid.UUID("00000000-0000-0000-0000-000000000020"))
+
+    async def run():
+        proxy = ProxyClassificationServiceImpl(httpx.MockTransport(handler))
+        try:
+            answers = [await result_cache.classify_cached(proxy, uuid_str, SAMPLE_PDF_BODY)
+                       for uuid_str in (UUID_10, uuid_20, UUID_10)]
+            with request_context.bind(corruption_seed="7"):
+                answers.append(await result_cache.classify_cached(proxy, UUID_10, SAMPLE_PDF_BODY))
+            return answers
+        finally:
+            await proxy.shutdown()
+
+    try:
+        answers = asyncio.run(run())
+    finally:
+        result_cache.close_result_cache()
+    # the same body under another uuid or seed is asked upstream, only a repeated request is a hit
+    assert [hit for _, hit in answers] == [False, False, True, False]
+    assert [json.loads(result)["result"]["kind"] for result, _ in answers] == ["FIRST", "SECOND", "FIRST", "SEEDED"]
+    assert len(requests) == 3
+
+
+def test_retries_retryable_answers(restore_settings):
+    before = proxy_service.retries_total.value
+    handler, requests = _answers(httpx.Response(503), httpx.ConnectError("refused"), httpx.Response(200, content=b"{}"))
+    assert _classify(handler) == b"{}"
+    assert len(requests) == 3
+    assert proxy_service.retries_total.value == before + 2
+
+
+@pytest.mark.parametrize("answer, status, detail", [
+    (httpx.Response(400, json={"detail": "PDF body too short"}), 400, "PDF body too short"),
+    (httpx.Response(502, text="bad gateway"), 502, "Upstream classifier failed: bad gateway"),
+    (httpx.ConnectError("refused"), 502, "Upstream classifier unreachable: ConnectError"),
+    (httpx.ReadTimeout("slow"), 504, "Upstream classifier timed out"),
+])
+def test_upstream_errors(restore_settings, answer, status, detail):
+    handler, requests = _answers(answer)
+    with pytest.raises(HTTPException) as exc_info:
+        _classify(handler)
+    assert (exc_info.value.status_code, exc_info.value.detail) == (status, detail)
+    # client errors are the upstream's verdict and not retried
+    assert len(requests) == (1 if status == 400 else settings.proxy_retries + 1)
+
+
+def test_circuit_breaker_opens_and_recovers(restore_settings):
+    restore_settings.proxy_retries = 0
+    restore_settings.proxy_breaker_failures = 2
+    restore_settings.proxy_breaker_reset = 0.2
+    handler, requests = _answers(httpx.ConnectError("refused"), httpx.ConnectError("refused"),
+                                 httpx.Response(200, content=b"{}"))
+
+    async def run():
+        proxy = ProxyClassificationServiceImpl(httpx.MockTransport(handler))
+        statuses = []
+        for pause in (0, 0, 0, 0.25, 0):
+            await asyncio.sleep(pause)
+            try:
+                await proxy.classify_pdf_async(UUID_10, SAMPLE_PDF_BODY)
+                statuses.append(200)
+            except HTTPException as e:
+                statuses.append(e.status_code)
+        await proxy.shutdown()
+        return statuses, proxy.breaker.state
+
+    statuses, state = asyncio.run(run())
+    # the third request is refused without reaching the upstream, the fourth is the trial
+    assert statuses == [502, 502, 503, 200, 200]
+    assert len(requests) == 4 and state == "closed"
+
+
+def test_synchronous_callers_share_retries_and_breaker(restore_settings):
+    restore_settings.proxy_breaker_failures = 3
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if len(requests) == 1:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"custom_id": UUID_10})
+
+    proxy = ProxyClassificationServiceImpl(sync_transport=httpx.MockTransport(handler))
+    try:
+        assert proxy.classify_pdf_json(UUID_10, memoryview(SAMPLE_PDF_BODY)) == b'{"custom_id":"' + UUID_10.encode() + b'"}'
+        assert len(requests) == 2 and proxy.breaker.state == "closed"
+        assert requests[1].url == f"http://upstream/api/v1/classify/{UUID_10}"
+
+        proxy.breaker.record_failure()
+        proxy.breaker.record_failure()
+        proxy.breaker.record_failure()
+        with pytest.raises(HTTPException) as exc_info:
+            proxy.classify_pdf_json(UUID_10, SAMPLE_PDF_BODY)
+        assert exc_info.value.status_code == 503 and len(requests) == 2
+    finally:
+        asyncio.run(proxy.shutdown())
+
+
+def test_hedged_request_wins_over_a_slow_one(restore_settings):
+    restore_settings.proxy_hedge_after_ms = 50
+    before = proxy_service.hedges_total.labels("hedge").value
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            await asyncio.sleep(5)
+        return httpx.Response(200, content=b'{"attempt": %d}' % len(calls))
+
+    started = time.monotonic()
+    assert _classify(handler) == b'{"attempt": 2}'
+    assert time.monotonic() - started < 1
+    assert proxy_service.hedges_total.labels("hedge").value == before + 1
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def upstream():
+    """The mock served by uvicorn as the upstream classifier."""
+    port = _free_port()
+    env = {**os.environ, "PYTHONPATH": SRC, "PDFCLASSIFIER_LOG_LEVEL": "WARNING"}
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "openapi_server.main:app", "--port", str(port),
+                                "--log-level", "warning"], env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            httpx.get(f"{base_url}/metrics", timeout=1)
+            break
+        except httpx.HTTPError:
+            assert process.poll() is None and time.monotonic() < deadline, "upstream did not start"
+            time.sleep(0.1)
+    yield base_url
+    process.terminate()
+    process.wait()
+
+
+def test_proxy_in_front_of_the_mock(restore_settings, upstream):
+    restore_settings.implementation = "proxy"
+    restore_settings.proxy_upstream_url = f"{upstream}/api/v1"
+    # spooled to disk, so the upload is forwarded from a memory map
+    restore_settings.body_spool_threshold = 1024
+    body = SAMPLE_PDF_BODY + bytes(512 * 1024)
+    with TestClient(app) as client:
+        for _ in range(3):
+            response = client.post(f"/api/v1/classify/{UUID_10}", content=body,
+                                   headers={"Content-Type": "application/pdf", "X-Latency-Profile": "fixed:1"})
+            assert response.status_code == 200
+            assert response.json()["custom_id"] == UUID_10
+            assert response.json()["result"]["kind"] == "INVOICE"
+        response = client.post(f"/api/v1/classify/{UUID_10}", content=b"no pdf",
+                               headers={"Content-Type": "application/pdf"})
+        assert response.status_code == 400
+    upstream_metrics = httpx.get(f"{upstream}/metrics").text
+    assert 'pdfclassifier_http_requests_total{route="/api/v1/classify/{uuid}",status="200"} 3' in upstream_metrics
+
+
+def test_synchronous_classification_through_the_mock(restore_settings, upstream):
+    restore_settings.proxy_upstream_url = f"{upstream}/api/v1"
+    proxy = ProxyClassificationServiceImpl()
+    try:
+        result = proxy.classify_pdf(UUID_10, SAMPLE_PDF_BODY)
+        assert result.custom_id == UUID_10 and result.result.kind == "INVOICE"
+        with pytest.raises(HTTPException) as exc_info:
+            proxy.classify_pdf(UUID_10, b"no pdf")
+        assert exc_info.value.status_code == 400
+    finally:
+        asyncio.run(proxy.shutdown())
@@ -0,0 +1,64 @@
+# tests/test_registry.py
+
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from openapi_server.apis.classification_api_base import BaseClassificationApi
+from openapi_server.implementation.classification_service import ClassificationServiceImpl
+from openapi_server.main import app
+from openapi_server.registry import registry
+from tests.conftest import SAMPLE_PDF_BODY
+
+
+class RecordingServiceImpl(ClassificationServiceImpl):
+    """Mock implementation that records its lifecycle and which instance served a request."""
+    implementation_name = "recording"
+    events = []
+
+    async def startup(self):
+        RecordingServiceImpl.events.append(("startup", id(self)))
+
+    async def shutdown(self):
+        RecordingServiceImpl.events.append(("shutdown", id(self)))
+
+    def classify_pdf_json(self, uuid_param_str, body):
+        RecordingServiceImpl.events.append(("classify", id(self)))
+        return super().classify_pdf_json(uuid_param_str, body)
+
+
+@pytest.fixture
+def recording_settings(restore_settings):
+    RecordingServiceImpl.events.clear()
+    restore_settings.implementation = "recording"
+    return restore_settings
+
+
+def test_find_implementation_by_name():
+    assert BaseClassificationApi.find_implementation("mock") is ClassificationServiceImpl
+    assert BaseClassificationApi.find_implementation("ClassificationServiceImpl") is ClassificationServiceImpl
+    assert BaseClassificationApi.find_implementation("recording") is RecordingServiceImpl
+
+
+def test_find_implementation_defaults_to_first_registered():
+    assert BaseClassificationApi.find_implementation(None) is ClassificationServiceImpl
+
+
+def test_find_implementation_unknown_name():
+    with pytest.raises(LookupError, match="no-such-impl"):
+        BaseClassificationApi.find_implementation("no-such-impl")
+
+
+def test_lifespan_shares_one_started_instance(recording_settings):
+    with TestClient(app) as client:
+        for ending in ("10", "20"):
+            response = client.post(f"/api/v1/classify/{uuid.UUID(int=int(ending))}", content=SAMPLE_PDF_BODY,
+                                   headers={"Content-Type": "application/pdf"})
+            assert response.status_code == 200
+        assert registry.started
+
+    assert not registry.started
+    kinds = [kind for kind, _ in RecordingServiceImpl.events]
+    assert kinds == ["startup", "classify", "classify", "shutdown"]
+    assert len({instance for _, instance in RecordingServiceImpl.events}) == 1
@@ -0,0 +1,172 @@
+# tests/test_result_cache.py
+
+import asyncio
+import hashlib
+import threading
+import time
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from openapi_server import result_cache
+from openapi_server.implementation.classification_service import ClassificationServiceImpl
+from openapi_server.main import app
+from openapi_server.result_cache import MemoryCacheTier, ResultCache, SqliteCacheTier, classify_cached
+from tests.conftest import SAMPLE_PDF_BODY
+
+UUID_10 = str(uuid.UUID("00000000-0000-0000-0000-000000000010"))
+OTHER_UUID_10 = str(uuid.UUID("11111111-0000-0000-0000-000000000010"))
+
+
+class CountingServiceImpl(ClassificationServiceImpl):
+    implementation_name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    def classify_pdf_json(self, uuid_param_str, body):
+        self.calls += 1
+        return super().classify_pdf_json(uuid_param_str, body)
+
+
+@pytest.fixture
+def cache_settings(restore_settings):
+    restore_settings.result_cache = True
+    yield restore_settings
+    result_cache.close_result_cache()
+
+
+def _post(client, uuid_str=UUID_10, body=SAMPLE_PDF_BODY):
+    response = client.post(f"/api/v1/classify/{uuid_str}", content=body, headers={"Content-Type": "application/pdf"})
+    assert response.status_code == 200
+    return response
+
+
+def test_resubmission_is_answered_from_cache(cache_settings):
+    client = TestClient(app)
+    first = _post(client)
+    second = _post(client)
+    assert first.headers["x-cache"] == "MISS"
+    assert second.headers["x-cache"] == "HIT"
+    assert first.content == second.content
+
+    stats = client.get("/api/v1/cache/stats").json()
+    assert (stats["hits"], stats["misses"], stats["stores"]) == (1, 1, 1)
+
+
+def test_cache_hit_carries_requested_uuid(cache_settings):
+    client = TestClient(app)
+    _post(client)
+    response = _post(client, uuid_str=OTHER_UUID_10)
+    assert response.headers["x-cache"] == "HIT"
+    assert response.json()["custom_id"] == OTHER_UUID_10
+
+
+def test_cache_hit_validates_the_request(cache_settings):
+    client = TestClient(app)
+    _post(client)
+    headers = {"Content-Type": "application/pdf"}
+    response = client.post("/api/v1/classify/not-a-uuid", content=SAMPLE_PDF_BODY, headers=headers)
+    assert response.status_code == 422
+    # the cached result carries the uuid in the canonical form the service answers with
+    response = _post(client, uuid_str=OTHER_UUID_10.upper().replace("-", ""))
+    assert response.headers["x-cache"] == "HIT"
+    assert response.json()["custom_id"] == OTHER_UUID_10
+
+
+def test_validation_settings_are_part_of_the_key(cache_settings):
+    service = CountingServiceImpl()
+    asyncio.run(classify_cached(service, UUID_10, SAMPLE_PDF_BODY))
+    cache_settings.pdf_validation = "structure"
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(classify_cached(service, UUID_10, SAMPLE_PDF_BODY))
+    assert exc_info.value.status_code == 400 and service.calls == 2
+
+
+def test_different_bodies_are_cached_separately(cache_settings):
+    client = TestClient(app)
+    _post(client)
+    assert _post(client, body=SAMPLE_PDF_BODY + b"!").headers["x-cache"] == "MISS"
+
+
+def test_disabled_cache_sends_no_header():
+    client = TestClient(app)
+    assert "x-cache" not in _post(client).headers
+    assert client.get("/api/v1/cache/stats").json() == {"enabled": False}
+
+
+def test_streamed_digest_matches_body_hash(cache_settings):
+    service = CountingServiceImpl()
+    digest = hashlib.sha256(SAMPLE_PDF_BODY).hexdigest()
+    asyncio.run(classify_cached(service, UUID_10, SAMPLE_PDF_BODY, digest))
+    asyncio.run(classify_cached(service, UUID_10, SAMPLE_PDF_BODY))
+    assert service.calls == 1
+
+
+def test_implementation_version_is_part_of_the_key(cache_settings):
+    service = CountingServiceImpl()
+    asyncio.run(classify_cached(service, UUID_10, SAMPLE_PDF_BODY))
+    service.implementation_version = "2"
+    asyncio.run(classify_cached(service, UUID_10, SAMPLE_PDF_BODY))
+    assert service.calls == 2
+
+
+def test_memory_tier_evicts_least_recently_used():
+    tier = MemoryCacheTier(max_entries=2, max_bytes=1000, ttl=60)
+    tier.put("a", b"1")
+    tier.put("b", b"2")
+    tier.get("a")
+    tier.put("c", b"3")
+    assert (tier.get("a"), tier.get("b"), tier.get("c")) == (b"1", None, b"3")
+    assert tier.evictions == 1
+
+
+def test_memory_tier_respects_byte_bound_and_ttl():
+    tier = MemoryCacheTier(max_entries=100, max_bytes=10, ttl=60)
+    tier.put("a", b"x" * 6)
+    tier.put("b", b"x" * 6)
+    assert (tier.get("a"), len(tier), tier.size_bytes) == (None, 1, 6)
+
+    expiring = MemoryCacheTier(max_entries=100, max_bytes=10, ttl=0.01)
+    expiring.put("a", b"1")
+    time.sleep(0.02)
+    assert expiring.get("a") is None
+
+
+def test_disk_tier_survives_restart_and_promotes_hits(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResultCache(MemoryCacheTier(10, 1000, 60), SqliteCacheTier(path, ttl=60))
+    cache.put("key", b"{}")
+    cache.close()
+
+    cache = ResultCache(MemoryCacheTier(10, 1000, 60), SqliteCacheTier(path, ttl=60))
+    assert cache.get("key") == b"{}"
+    assert cache.get("key") == b"{}"
+    assert (cache.stats.disk_hits, cache.stats.memory_hits) == (1, 1)
+    cache.close()
+
+
+def test_disk_tier_is_used_off_the_event_loop(cache_settings, tmp_path, monkeypatch):
+    cache_settings.result_cache_sqlite_path = str(tmp_path / "cache.sqlite3")
+    threads = []
+    for name in ("get", "put"):
+        method = getattr(SqliteCacheTier, name)
+
+        def recording(self, *args, method=method):
+            threads.append(threading.current_thread())
+            return method(self, *args)
+
+        monkeypatch.setattr(SqliteCacheTier, name, recording)
+
+    async def classify():
+        service = CountingServiceImpl()
+        await classify_cached(service, UUID_10, SAMPLE_PDF_BODY)
+        result_cache.get_result_cache().memory = MemoryCacheTier(10, 1000, 60)
+        await classify_cached(service, UUID_10, SAMPLE_PDF_BODY)
+        return threading.current_thread(), service.calls
+
+    loop_thread, calls = asyncio.run(classify())
+    assert calls == 1 and result_cache.get_result_cache().stats.disk_hits == 1
+    assert len(threads) == 3 and loop_thread not in threads
@@ -0,0 +1,203 @@
+# tests/test_scanner_mock.py
+
+import asyncio
+import concurrent.futures
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+
+import httpx
+import pytest
+
+from openapi_server.implementation.pdf_structure import inspect_pdf
+from openapi_server.main import app
+
+SCANNER_MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "scanner-mock",
+                            "main.py")
+
+
+@pytest.fixture(scope="module")
+def scanner():
+    """The scanner mock script, imported as a module the render workers can unpickle its functions from."""
+    spec = importlib.util.spec_from_file_location("scanner_mock", SCANNER_MAIN)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    yield module
+    del sys.modules[spec.name]
+
+
+def _suffixes(scanner):
+    return {row["UUID Ending"] for row in scanner.load_data()}
+
+
+@pytest.mark.parametrize("render_each", [False, True])
+def test_burst_generates_count_documents(scanner, tmp_path, render_each):
+    stats = scanner.generate(str(tmp_path), rate=0, count=25, workers=2, stats_interval=0, render_each=render_each)
+    names = [name for name in os.listdir(tmp_path) if name != scanner.TMP_DIR]
+    assert stats.documents == 25 and stats.errors == 0 and len(names) == 25
+    assert stats.bytes == sum(os.path.getsize(tmp_path / name) for name in names)
+    assert len(stats.document_seconds) == 25
+    suffixes = _suffixes(scanner)
+    for name in names:
+        stem, extension = os.path.splitext(name)
+        assert extension in (".pdf", ".txt") and stem[-2:] in suffixes
+
+
+def test_sharded_batches(scanner, tmp_path):
+    stats = scanner.generate(str(tmp_path), rate=0, count=100, stats_interval=0, fsync="batch", batch_size=30,
+                             shard_depth=2)
+    paths = [os.path.join(root, name) for root, _, names in os.walk(tmp_path) for name in names]
+    assert stats.documents == 100 and len(paths) == 100
+    for path in paths:
+        name = os.path.basename(path)
+        assert os.path.relpath(path, tmp_path) == os.path.join(name[:2], name[2:4], name)
+    assert os.listdir(tmp_path / scanner.TMP_DIR) == []
+
+
+@pytest.mark.parametrize("fsync", ["none", "file"])
+def test_writer_publishes_complete_documents(scanner, tmp_path, fsync):
+    writer = scanner.InboxWriter(str(tmp_path), fsync=fsync, batch_size=2)
+    path = writer.write("a.pdf", b"%PDF-1.3 content")
+    assert path == str(tmp_path / "a.pdf")
+    with open(path, "rb") as f:
+        assert f.read() == b"%PDF-1.3 content"
+    assert os.listdir(tmp_path / scanner.TMP_DIR) == []
+    writer.close()
+
+
+def test_writer_batches(scanner, tmp_path):
+    writer = scanner.InboxWriter(str(tmp_path), fsync="batch", batch_size=3, batch_seconds=0.05)
+    writer.write("a.pdf", b"a")
+    writer.write("b.pdf", b"b")
+    # held back until the batch is full
+    assert sorted(os.listdir(tmp_path)) == [scanner.TMP_DIR]
+    writer.write("c.pdf", b"c")
+    assert sorted(os.listdir(tmp_path)) == [scanner.TMP_DIR, "a.pdf", "b.pdf", "c.pdf"]
+    # or until the oldest document waited long enough
+    writer.write("d.pdf", b"d")
+    writer.flush_due()
+    assert not os.path.exists(tmp_path / "d.pdf")
+    time.sleep(0.06)
+    writer.flush_due()
+    assert os.path.exists(tmp_path / "d.pdf")
+    with pytest.raises(ValueError, match="Unknown fsync policy 'always'"):
+        scanner.InboxWriter(str(tmp_path), fsync="always")
+
+
+def test_rate_paces_the_documents(scanner, tmp_path):
+    started = time.monotonic()
+    stats = scanner.generate(str(tmp_path), rate=40, count=20, workers=1, stats_interval=0)
+    # the 20th document is due 19/40 s after the first
+    assert stats.documents == 20
+    assert time.monotonic() - started >= 0.47
+
+
+def test_batches_are_flushed_while_pacing(scanner, tmp_path):
+    generating = threading.Thread(target=scanner.generate, args=(str(tmp_path),),
+                                  kwargs=dict(rate=1, count=2, stats_interval=0, fsync="batch", batch_seconds=0.1))
+    started = time.monotonic()
+    generating.start()
+    try:
+        # the first document is flushed after batch_seconds, not when the second one is due a second later
+        while len(os.listdir(tmp_path)) < 2:
+            assert time.monotonic() - started < 0.6, "the batch waited for the next document"
+            time.sleep(0.01)
+    finally:
+        generating.join()
+
+
+def test_template_documents(scanner):
+    row = scanner.load_data()[0]
+    template = scanner.build_template(row)
+    assert template.fields == (("uuid", "scanned", "id", "id") if template.extension == ".pdf" else ("uuid", "scanned"))
+    uuid_str = scanner.generate_uuid_for_row(row)
+    fields = scanner.scan_fields(uuid_str)
+    content = template.fill(fields)
+    assert f"uuid: {uuid_str}".encode() in content and f"scanned: {fields['scanned']}".encode() in content
+    assert row["doc_id_val"].encode() in content
+    if template.extension == ".pdf":
+        # the patched document is still a well-formed PDF
+        assert inspect_pdf(content).page_count == 1
+        assert f"/ID [<{fields['id']}><{fields['id']}>]".encode() in content
+        assert len(content) == len(scanner.render_document(row, fields)[0])
+    with pytest.raises(ValueError, match="uuid must be 36 characters"):
+        template.fill({**fields, "uuid": "short"})
+
+
+def test_stats_report(scanner):
+    stats = scanner.Stats()
+    for ms in range(1, 101):
+        stats.add(1000, ms / 1000)
+    line = stats.report(final=True)
+    assert line.startswith("Total: 100 documents (0 failed)")
+    assert "ms per document mean 50.500 p50 51.000 p99 100.000" in line
+
+
+def test_latency_histogram(scanner):
+    histogram = scanner.LatencyHistogram()
+    for us in range(1, 100001):
+        histogram.record(us / 1e6)
+    assert histogram.count == 100000 and histogram.min == 1e-6 and histogram.max == 0.1
+    for percentile in (1, 50, 90, 99, 99.9):
+        exact = percentile / 100 * 0.1
+        assert exact <= histogram.value_at(percentile) <= exact * 1.016
+    assert histogram.value_at(100) == 0.1
+    # small values are counted exactly
+    assert histogram.value_at(0.1) == 100e-6
+    assert scanner.LatencyHistogram().summary() == {"count": 0}
+
+
+def test_push_to_the_classifier(scanner, tmp_path):
+    stats = asyncio.run(scanner.push("http://classifier/api/v1", rate=0, count=40, concurrency=4, stats_interval=0,
+                                     transport=httpx.ASGITransport(app=app)))
+    assert stats.outcomes == {"ok": 40} and stats.latency.count == 40
+    summary = scanner.print_summary(stats, str(tmp_path / "summary.json"))
+    assert json.loads((tmp_path / "summary.json").read_text()) == summary
+    assert summary["uploads"] == 40 and summary["failed"] == 0
+    assert summary["latency"]["p50_ms"] <= summary["latency"]["max_ms"]
+
+
+def test_push_renders_on_all_workers(scanner, monkeypatch):
+    rendering, most = 0, 0
+    lock = threading.Lock()
+    render_task = scanner._render_task
+
+    def counting_render_task(data_row, uuid_str):
+        nonlocal rendering, most
+        with lock:
+            rendering += 1
+            most = max(most, rendering)
+        time.sleep(0.05)
+        with lock:
+            rendering -= 1
+        return render_task(data_row, uuid_str)
+
+    # threads instead of processes, so the render workers can be watched
+    monkeypatch.setattr(scanner, "_render_task", counting_render_task)
+    monkeypatch.setattr(scanner.concurrent.futures, "ProcessPoolExecutor",
+                        lambda max_workers, initializer: concurrent.futures.ThreadPoolExecutor(max_workers))
+    stats = asyncio.run(scanner.push("http://classifier/api/v1", rate=0, count=12, concurrency=8, stats_interval=0,
+                                     render_each=True, workers=4, transport=httpx.ASGITransport(app=app)))
+    assert stats.outcomes == {"ok": 12}
+    assert most == 4
+
+
+def test_push_checks_the_answers(scanner):
+    def handler(request):
+        uuid_str = request.url.path.rsplit("/", 1)[1]
+        case = int(uuid_str[-1], 16) % 4
+        if case == 0:
+            return httpx.Response(503)
+        if case == 1:
+            raise httpx.ConnectError("refused")
+        answer = {"custom_id": uuid_str if case == 2 else "other", "result": {"kind": "INVOICE"}}
+        return httpx.Response(200, json=answer)
+
+    stats = asyncio.run(scanner.push("http://classifier/api/v1", rate=0, count=200, concurrency=8, stats_interval=0,
+                                     transport=httpx.MockTransport(handler)))
+    assert stats.documents == 200 and stats.latency.count == 200 - stats.outcomes["error_ConnectError"]
+    assert set(stats.outcomes) == {"ok", "kind_mismatch", "custom_id_mismatch", "http_503", "error_ConnectError"}
@@ -0,0 +1,215 @@
+# tests/test_scheduler.py
+
+import asyncio
+import random
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from openapi_server.implementation.classification_service import EXPECTED_PDF_HEADER
+from openapi_server.main import app
+from openapi_server import scheduler as scheduler_module
+from openapi_server.scheduler import CostModel, CostScheduler, fit_cost_model, page_count, page_count_async, scheduler
+
+UUID_10 = str(uuid.UUID("00000000-0000-0000-0000-000000000010"))
+MIB = 1024 * 1024
+
+
+@pytest.fixture
+def restore_settings(restore_settings):
+    restore_settings.scheduler = True
+    return restore_settings
+
+
+def _pdf(pages: int) -> bytes:
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"<< /Type /Pages /Kids [] /Count %d >>" % pages]
+    out, offsets = b"%PDF-1.7\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 3\n0000000000 65535 f \n" + b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    return out + b"trailer\n<< /Size 3 /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % xref
+
+
+def test_cost_model_uses_page_count_or_size():
+    model = CostModel(base_ms=5, ms_per_mb=10, ms_per_page=20, bytes_per_page=MIB // 4)
+    assert model.estimate_ms(2 * MIB, 3) == 5 + 20 + 60
+    # unknown page count: one page per bytes_per_page
+    assert model.estimate_ms(2 * MIB, None) == 5 + 20 + 160
+    assert model.estimate_ms(0, None) == 5 + 20
+
+
+def test_page_count_reads_the_page_tree():
+    assert page_count(_pdf(400)) == 400
+    assert page_count(EXPECTED_PDF_HEADER + b" not really") is None
+
+
+def test_page_count_does_not_block_the_event_loop(monkeypatch):
+    def stuck(body, budget_ms):
+        time.sleep(0.3)
+        raise RecursionError("maximum recursion depth exceeded")
+
+    monkeypatch.setattr(scheduler_module, "inspect_pdf", stuck)
+
+    async def run():
+        ticks = []
+
+        async def tick():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        pages, _ = await asyncio.gather(page_count_async(_pdf(3)), tick())
+        return pages, ticks
+
+    started = time.monotonic()
+    pages, ticks = asyncio.run(run())
+    # the estimate falls back to the size while the loop keeps running
+    assert pages is None and len(ticks) == 5
+    assert time.monotonic() - started < 0.25
+
+
+def test_slow_page_count_falls_back_to_the_size_estimate(restore_settings, monkeypatch):
+    restore_settings.scheduler_page_count_timeout_ms = 20
+    monkeypatch.setattr(scheduler_module, "inspect_pdf", lambda body, budget_ms: time.sleep(0.3))
+    scheduler = CostScheduler()
+    body = _pdf(3)
+
+    async def classify():
+        async with scheduler.slot(body):
+            pass
+
+    started = time.monotonic()
+    asyncio.run(classify())
+    # the classification went ahead after the timeout, estimated by size only
+    assert time.monotonic() - started < 0.2
+    size, pages, estimate_ms, _ = scheduler.samples[-1]
+    assert (size, pages) == (len(body), None)
+    assert estimate_ms == CostModel.from_settings().estimate_ms(len(body), None)
+
+
+def _run_in_order(sizes):
+    """Classify bodies of ``sizes`` while a first classification holds the only worker; return the run order."""
+    scheduler = CostScheduler()
+    order = []
+
+    async def classify(name: str, size: int, hold=None):
+        async with scheduler.slot(bytes(size)):
+            order.append(name)
+            if hold is not None:
+                await hold.wait()
+
+    async def run():
+        # the worker is held until everything queued, so only the arrival order matters
+        all_queued = asyncio.Event()
+        tasks = [asyncio.create_task(classify("first", 0, all_queued))]
+        await asyncio.sleep(0)
+        for name, size in sizes:
+            tasks.append(asyncio.create_task(classify(name, size)))
+            await asyncio.sleep(0.002)
+        all_queued.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    return order, scheduler
+
+
+def test_shortest_estimate_runs_first(restore_settings):
+    restore_settings.scheduler_small_workers = 1
+    order, scheduler = _run_in_order([("big", 2 * MIB), ("medium", MIB), ("tiny", 1024)])
+    assert order == ["first", "tiny", "medium", "big"]
+    assert len(scheduler.samples) == 4
+
+
+def test_waiting_ages_into_priority(restore_settings):
+    restore_settings.scheduler_small_workers = 1
+    # a millisecond of waiting outweighs any estimate difference here
+    restore_settings.scheduler_aging_ms_per_s = 1_000_000
+    order, _ = _run_in_order([("big", 2 * MIB), ("medium", MIB), ("tiny", 1024)])
+    assert order == ["first", "big", "medium", "tiny"]
+
+
+def test_large_documents_do_not_take_the_workers_of_small_ones(restore_settings):
+    restore_settings.scheduler_small_workers = 1
+    restore_settings.scheduler_large_workers = 1
+    restore_settings.scheduler_large_cost_ms = 100
+    scheduler = CostScheduler()
+    finished = []
+
+    async def classify(name: str, size: int, hold: float):
+        async with scheduler.slot(bytes(size)):
+            await asyncio.sleep(hold)
+        finished.append(name)
+
+    async def run():
+        await asyncio.gather(classify("large-1", 2 * MIB, 0.2), classify("large-2", 2 * MIB, 0.2),
+                             classify("small", 1024, 0.01))
+
+    asyncio.run(run())
+    assert finished == ["small", "large-1", "large-2"]
+
+
+def test_cancelled_waiter_gives_up_its_place(restore_settings):
+    restore_settings.scheduler_small_workers = 1
+    scheduler = CostScheduler()
+
+    async def run():
+        holder_entered, release = asyncio.Event(), asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot(b""):
+                holder_entered.set()
+                await release.wait()
+
+        async def waiter():
+            async with scheduler.slot(b""):
+                return True
+
+        first = asyncio.create_task(holder())
+        await holder_entered.wait()
+        cancelled = asyncio.create_task(waiter())
+        second = asyncio.create_task(waiter())
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        release.set()
+        await first
+        assert await asyncio.wait_for(second, 1)
+        return scheduler.snapshot()["queues"]["small"]
+
+    assert asyncio.run(run()) == {"limit": 1, "running": 0, "queued": 0}
+
+
+def test_fit_recovers_the_cost_model():
+    rng = random.Random(7)
+    truth = CostModel(base_ms=12, ms_per_mb=3, ms_per_page=45)
+    samples = []
+    for _ in range(200):
+        size, pages = rng.randrange(10 * MIB), rng.randrange(1, 300)
+        samples.append((size, pages, 0.0, truth.estimate_ms(size, pages) + rng.uniform(-1, 1)))
+    fitted = fit_cost_model(samples, CostModel())
+    assert fitted.base_ms == pytest.approx(12, abs=1)
+    assert fitted.ms_per_mb == pytest.approx(3, abs=0.1)
+    assert fitted.ms_per_page == pytest.approx(45, abs=0.1)
+    # a single kind of document cannot separate the coefficients
+    assert fit_cost_model([(MIB, 10, 0.0, 100.0)] * 5, CostModel()) is None
+
+
+def test_classifications_are_scheduled_and_reported(restore_settings):
+    # the page count must not run out of time on a busy test machine
+    restore_settings.scheduler_page_count_timeout_ms = 10_000
+    client = TestClient(app)
+    before = len(scheduler.samples)
+    response = client.post(f"/api/v1/classify/{UUID_10}", content=_pdf(3), headers={"Content-Type": "application/pdf"})
+    assert response.status_code == 200
+    assert scheduler.samples[-1][1] == 3
+    state = client.get("/api/v1/scheduler").json()
+    assert state["enabled"] and state["samples"] == before + 1
+    assert state["queues"]["small"] == {"limit": 8, "running": 0, "queued": 0}
+    assert 'pdfclassifier_scheduler_actual_seconds_count{queue="small"}' in client.get("/metrics").text
+    # a body the parser cannot get through is classified on its size estimate
+    nested = _pdf(3).replace(b"/Count 3", b"/Count " + b"[" * 3000)
+    response = client.post(f"/api/v1/classify/{UUID_10}", content=nested, headers={"Content-Type": "application/pdf"})
+    assert response.status_code == 200 and scheduler.samples[-1][1] is None
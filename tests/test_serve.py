@@ -0,0 +1,106 @@
+# tests/test_serve.py
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import httpx
+import pytest
+
+from tests.conftest import SAMPLE_PDF_BODY
+
+UUID_10 = str(uuid.UUID("00000000-0000-0000-0000-000000000010"))
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="serve forks its workers")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _workers(pid: int) -> set:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return set(f.read().split())
+
+
+@pytest.fixture
+def server(tmp_path):
+    port = _free_port()
+    env = {**os.environ, "PYTHONPATH": SRC, "PDFCLASSIFIER_LOG_LEVEL": "WARNING"}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "openapi_server.serve", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", "2", "--graceful-timeout", "5", "--shared-state-dir", str(tmp_path)], env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while len(_workers(process.pid)) < 2 or not _ready(base_url):
+        assert process.poll() is None and time.monotonic() < deadline, "serve did not start"
+        time.sleep(0.1)
+    yield process, base_url
+    if process.poll() is None:
+        process.kill()
+        process.wait()
+
+
+def _ready(base_url: str) -> bool:
+    try:
+        return httpx.get(f"{base_url}/metrics", timeout=1).status_code == 200
+    except httpx.HTTPError:
+        return False
+
+
+def test_rolling_restart_keeps_serving_and_metrics_add_up(server):
+    process, base_url = server
+    before = _workers(process.pid)
+    statuses = []
+    stopped = threading.Event()
+
+    def load():
+        with httpx.Client(base_url=base_url, timeout=10) as client:
+            while not stopped.is_set():
+                try:
+                    statuses.append(client.post(f"/api/v1/classify/{UUID_10}", content=SAMPLE_PDF_BODY).status_code)
+                except httpx.HTTPError as e:
+                    statuses.append(repr(e))
+
+    thread = threading.Thread(target=load)
+    thread.start()
+    try:
+        time.sleep(0.5)
+        process.send_signal(signal.SIGHUP)
+        deadline = time.monotonic() + 30
+        while _workers(process.pid) & before or len(_workers(process.pid)) < 2:
+            assert time.monotonic() < deadline, "workers were not replaced"
+            time.sleep(0.1)
+        time.sleep(0.5)
+    finally:
+        stopped.set()
+        thread.join()
+
+    assert statuses and set(statuses) == {200}
+    # the last snapshot of every worker, exited ones included, is summed
+    time.sleep(1.5)
+    text = httpx.get(f"{base_url}/metrics").text
+    sample = 'pdfclassifier_http_requests_total{route="/api/v1/classify/{uuid}",status="200"} '
+    assert float(text.split(sample, 1)[1].split()[0]) == len(statuses)
+
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(timeout=30) == 0
+
+
+def test_jobs_are_visible_to_all_workers(server):
+    _, base_url = server
+    with httpx.Client(base_url=base_url, timeout=10) as client:
+        job_ids = [client.post(f"/api/v1/jobs/{UUID_10}", content=SAMPLE_PDF_BODY).json()["job_id"]
+                   for _ in range(4)]
+        for job_id in job_ids:
+            # fresh connections, so the lookups are spread over the workers
+            job = httpx.get(f"{base_url}/api/v1/jobs/{job_id}", params={"wait": 5}).json()
+            assert job["status"] == "done"
@@ -0,0 +1,86 @@
+# tests/test_structured_logging.py
+
+import io
+import json
+import logging
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from openapi_server.main import app
+from openapi_server.settings import settings
+from openapi_server.structured_logging import LOGGER_NAME, JsonFormatter, configure_logging, stop_logging
+from tests.conftest import SAMPLE_PDF_BODY
+
+UUID_10 = str(uuid.UUID("00000000-0000-0000-0000-000000000010"))
+
+
+@pytest.fixture
+def log_output(restore_settings):
+    restore_settings.log_level = "DEBUG"
+    output = io.StringIO()
+
+    def records():
+        stop_logging()
+        return [json.loads(line) for line in output.getvalue().splitlines()]
+
+    configure_logging(output)
+    yield records
+    stop_logging()
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.setLevel(logging.NOTSET)
+    logger.propagate = True
+
+
+def _post(uuid_str=UUID_10, body=SAMPLE_PDF_BODY):
+    return TestClient(app).post(f"/api/v1/classify/{uuid_str}", content=body, headers={"Content-Type": "application/pdf"})
+
+
+def test_one_access_record_per_request_with_path_uuid(log_output):
+    assert _post().status_code == 200
+    records = log_output()
+
+    access = [record for record in records if record["logger"] == "openapi_server.access"]
+    assert len(access) == 1
+    assert access[0]["correlation_id"] == UUID_10
+    assert access[0]["route"] == "/api/v1/classify/{uuid}"
+    assert access[0]["status"] == 200
+    assert access[0]["request_bytes"] == len(SAMPLE_PDF_BODY)
+    assert access[0]["duration_ms"] > 0
+
+    # records written from the executor thread carry the same correlation id
+    service = [record for record in records if record["logger"].endswith("classification_service")]
+    assert service and all(record["correlation_id"] == UUID_10 for record in service)
+
+
+def test_route_sampling_drops_info_records(log_output):
+    settings.log_route_sample_rates = "/api/v1/classify/{uuid}=0"
+    assert _post().status_code == 200
+    assert _post(body=b"IAMNOTAPDF").status_code == 400
+    assert log_output() == []
+
+
+def test_failed_requests_are_always_logged(log_output, monkeypatch):
+    settings.log_sample_rate = 0
+
+    def explode(*args):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr("openapi_server.implementation.classification_service.response_tables.table", explode)
+    assert _post().status_code == 500
+    records = log_output()
+    assert [record["logger"] for record in records] == [
+        "openapi_server.implementation.classification_service", "openapi_server.access"]
+    assert "Traceback" in records[0]["exception"]
+    assert records[1]["status"] == 500
+
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.LogRecord("openapi_server.test", logging.INFO, __file__, 1, "hello %s", ("world",), None)
+    record.duration_ms = 1.5
+    assert json.loads(JsonFormatter().format(record)) == {
+        "ts": round(record.created, 6), "level": "INFO", "logger": "openapi_server.test",
+        "message": "hello world", "duration_ms": 1.5}